@@ -12,6 +12,13 @@ import base64
 from io import BytesIO
 import sqlite3
 import os
+import threading
+
+from trial_records import RunBuffer
+from engine_core import TestEngineCore, EngineSink, PollingScheduler, PHASE_STIMULUS
+from live_feed import FeedSubscriber, attach_feed, FEED_ENV, DEFAULT_PORT
+from schema_migration import is_normalized
+from participant_directory import ParticipantDirectory
 
 # 页面设置
 st.set_page_config(
@@ -94,10 +101,15 @@ st.markdown("""
 
 
 # 初始化数据库
-def init_database():
-    conn = sqlite3.connect('reaction_test_web.db')
+def init_database(db_path='reaction_test_web.db'):
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
+    # 已迁移为规范化结构时，这三张表由兼容视图提供（见 schema_migration.py）
+    if is_normalized(conn):
+        conn.close()
+        return
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
             user_id TEXT PRIMARY KEY,
@@ -119,11 +131,15 @@ def init_database():
             stimulus_content TEXT,
             reaction_time REAL,
             is_correct INTEGER,
+            qc_label TEXT,
             test_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (user_id)
         )
     ''')
 
+    # 旧数据库补充质量控制列
+    ensure_column(cursor, 'test_records', 'qc_label', 'TEXT')
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS test_statistics (
             stat_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -145,6 +161,12 @@ def init_database():
     conn.close()
 
 
+def ensure_column(cursor, table, column, definition):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
 # 初始化session state
 def init_session_state():
     if 'user_data' not in st.session_state:
@@ -161,8 +183,7 @@ def init_session_state():
             'is_running': False,
             'current_test': None,
             'current_stimulus': None,
-            'reaction_times': [],
-            'correct_responses': [],
+            'run_buffer': RunBuffer(10),
             'current_trial': 0,
             'total_trials': 10,
             'stimulus_start_time': 0,
@@ -313,6 +334,12 @@ class WebStimulusGenerator:
                 'display': self._generate_disjunctive_display(target, distractors)
             }
 
+    def expected_response(self, test_type, stimulus):
+        """正确选项序号（只有选择反应时判断对错）"""
+        if test_type == 'choice':
+            return stimulus['target']['index']
+        return None
+
     def _generate_choice_display(self, options, target):
         html = '<div style="display:flex;justify-content:center;gap:30px;flex-wrap:wrap;">'
         for opt in options:
@@ -354,45 +381,69 @@ class WebStimulusGenerator:
         return html
 
 
+# 设置后，数据库每次提交都把提交次数与锁等待时长写入该JSON文件（供 load_test.py 读取）
+DB_STATS_ENV = 'REACTION_TEST_DB_STATS'
+
+
 # 数据库操作
 class WebDatabaseManager:
-    def __init__(self):
-        self.conn = sqlite3.connect('reaction_test_web.db', check_same_thread=False)
-        init_database()
-
-    def save_user(self, user_data):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO users (user_id, name, age, gender, occupation)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
+    """Web端数据库（所有会话共用一个连接，写入按轮次批量提交）"""
+
+    def __init__(self, db_path='reaction_test_web.db'):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        init_database(db_path)
+        # 参与者目录（侧边栏输入联想）
+        self.directory = ParticipantDirectory(db_path)
+        self.directory.ensure_index()
+        # 连接在各会话线程间共用，所有访问串行化
+        self.lock = threading.Lock()
+        self._saved_users = {}
+        self.commits = 0
+        self.lock_wait_ms = 0.0
+        self.stats_path = None
+
+    def _acquire(self):
+        start = time.perf_counter()
+        self.lock.acquire()
+        self.lock_wait_ms += (time.perf_counter() - start) * 1000
+
+    def _write_user(self, cursor, user_data):
+        """写入用户信息（与上次写入相同则跳过），返回写入的值，未写入时返回None
+
+        提交成功后由调用方记入 _saved_users，失败回滚时下次仍会重新写入
+        """
+        values = (
             user_data['user_id'],
             user_data['name'],
             user_data['age'],
             user_data['gender'],
             user_data['occupation']
-        ))
-        self.conn.commit()
-
-    def save_test_record(self, record_data):
-        cursor = self.conn.cursor()
+        )
+        if self._saved_users.get(values[0]) == values:
+            return None
         cursor.execute('''
-            INSERT INTO test_records 
-            (user_id, test_type, stimulus_type, trial_index, stimulus_content, reaction_time, is_correct)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            record_data['user_id'],
-            record_data['test_type'],
-            record_data['stimulus_type'],
-            record_data['trial_index'],
-            json.dumps(record_data['stimulus_content']),
-            record_data['reaction_time'],
-            1 if record_data['is_correct'] else 0
-        ))
-        self.conn.commit()
+            INSERT OR REPLACE INTO users (user_id, name, age, gender, occupation)
+            VALUES (?, ?, ?, ?, ?)
+        ''', values)
+        return values
 
-    def save_test_statistics(self, stat_data):
-        cursor = self.conn.cursor()
+    def _insert_records(self, cursor, records):
+        cursor.executemany('''
+            INSERT INTO test_records 
+            (user_id, test_type, stimulus_type, trial_index, stimulus_content, reaction_time, is_correct, qc_label)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(
+            record.user_id,
+            record.test_type,
+            record.stimulus_type,
+            record.trial_index,
+            json.dumps(record.stimulus_content),
+            record.reaction_time,
+            1 if record.is_correct else 0,
+            record.qc_label
+        ) for record in records])
+
+    def _insert_statistics(self, cursor, stat_data):
         cursor.execute('''
             INSERT INTO test_statistics 
             (user_id, test_type, stimulus_type, avg_reaction_time, std_reaction_time, 
@@ -410,216 +461,254 @@ class WebDatabaseManager:
             stat_data['total_trials'],
             stat_data['test_date']
         ))
-        self.conn.commit()
 
-    def get_user_history(self, user_id, limit=10):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM test_statistics 
-            WHERE user_id = ? 
-            ORDER BY test_date DESC, stat_id DESC 
-            LIMIT ?
-        ''', (user_id, limit))
-
-        columns = [description[0] for description in cursor.description]
-        rows = cursor.fetchall()
-
-        return [dict(zip(columns, row)) for row in rows]
+    def save_user(self, user_data):
+        self._acquire()
+        try:
+            try:
+                values = self._write_user(self.conn.cursor(), user_data)
+                if values is not None:
+                    self.conn.commit()
+                    self.commits += 1
+                    self._saved_users[values[0]] = values
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                print(f"保存用户信息失败: {e}")
+        finally:
+            self.lock.release()
+
+    def save_test_record(self, record):
+        self.write_run(None, [record])
 
-    def get_all_users(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT DISTINCT user_id, name FROM users ORDER BY created_time DESC')
-        return cursor.fetchall()
+    def save_test_statistics(self, stat_data):
+        self.write_run(None, [], stat_data)
+
+    def write_run(self, user_data, records, stat_data=None):
+        """在一个事务中写入用户信息、一批试次记录和（轮次结束时的）统计结果"""
+        self._acquire()
+        try:
+            cursor = self.conn.cursor()
+            try:
+                user_values = self._write_user(cursor, user_data) if user_data is not None else None
+                if records:
+                    self._insert_records(cursor, records)
+                if stat_data is not None:
+                    self._insert_statistics(cursor, stat_data)
+                self.conn.commit()
+                self.commits += 1
+                if user_values is not None:
+                    self._saved_users[user_values[0]] = user_values
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                print(f"保存测试数据失败: {e}")
+        finally:
+            self.lock.release()
+        if self.stats_path:
+            self.dump_stats()
+
+    def dump_stats(self):
+        """写出提交次数与累计锁等待时长"""
+        tmp_path = self.stats_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'commits': self.commits, 'lock_wait_ms': self.lock_wait_ms}, f)
+            os.replace(tmp_path, self.stats_path)
+        except OSError as e:
+            print(f"写出数据库统计失败: {e}")
 
+    def get_user_history(self, user_id, limit=10):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT * FROM test_statistics 
+                WHERE user_id = ? 
+                ORDER BY test_date DESC, stat_id DESC 
+                LIMIT ?
+            ''', (user_id, limit))
+
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
 
-# 测试引擎
-class WebTestEngine:
-    def __init__(self):
-        self.stimulus_generator = WebStimulusGenerator()
-        self.db_manager = WebDatabaseManager()
+        return [dict(zip(columns, row)) for row in rows]
 
-    def start_test(self, test_type, stimulus_type, user_data, trials=10):
-        # 重置测试状态
-        st.session_state.test_state = {
-            'is_running': True,
-            'current_test': test_type,
-            'current_stimulus_type': stimulus_type,
-            'reaction_times': [],
-            'correct_responses': [],
-            'current_trial': 0,
-            'total_trials': trials,
-            'stimulus_start_time': 0,
-            'user_data': user_data,
-            'current_stimulus': None,
-            'test_started': False,
-            'waiting_for_stimulus': False
-        }
 
-        # 保存用户信息
-        self.db_manager.save_user(user_data)
+class WebRunWriter:
+    """单轮测试的写入缓冲（作为引擎核心的数据存储）
 
-        # 准备第一个试次
-        self.prepare_next_trial()
+    试次记录先缓存在会话中，轮次完成时与统计结果在同一事务中提交；
+    停止测试时提交已缓存的记录。最早一条未提交记录超过 checkpoint_seconds 时
+    提前提交一次，浏览器断开最多丢失这段时间内的试次。
+    """
 
-    def prepare_next_trial(self):
-        if not st.session_state.test_state['is_running']:
-            return
+    def __init__(self, db_manager, user_data, checkpoint_seconds=15.0):
+        self.db_manager = db_manager
+        self.checkpoint_seconds = checkpoint_seconds
+        self.pending_user = user_data
+        self.pending_records = []
+        self.pending_since = None
 
-        # 如果所有试次完成，结束测试
-        if st.session_state.test_state['current_trial'] >= st.session_state.test_state['total_trials']:
-            self.complete_test()
-            return
+    def save_test_record(self, record):
+        if not self.pending_records:
+            self.pending_since = time.monotonic()
+        self.pending_records.append(record)
+        self.checkpoint()
 
-        # 设置等待状态
-        st.session_state.test_state['waiting_for_stimulus'] = True
-        st.session_state.test_state['test_started'] = False
-        st.session_state.test_state['current_stimulus'] = None
+    def save_test_statistics(self, stat_data):
+        self.flush(stat_data)
 
-        # 使用Streamlit的rerun来模拟等待
-        st.rerun()
+    def checkpoint(self):
+        """缓存时间过长时提前提交（每次脚本运行和每个试次都会检查）"""
+        if self.pending_records and time.monotonic() - self.pending_since >= self.checkpoint_seconds:
+            self.flush()
 
-    def show_stimulus(self):
-        if not st.session_state.test_state['is_running']:
+    def flush(self, stat_data=None):
+        if not self.pending_records and stat_data is None and self.pending_user is None:
             return
+        self.db_manager.write_run(self.pending_user, self.pending_records, stat_data)
+        self.pending_user = None
+        self.pending_records = []
+        self.pending_since = None
 
-        # 生成刺激物
-        test_type = st.session_state.test_state['current_test']
-        stimulus_type = st.session_state.test_state['current_stimulus_type']
 
-        stimulus = self.stimulus_generator.generate_stimulus(test_type, stimulus_type)
+# 测试引擎
+class WebSessionSink(EngineSink):
+    """引擎核心事件写入会话状态"""
 
-        # 更新状态
-        st.session_state.test_state['current_stimulus'] = stimulus
-        st.session_state.test_state['waiting_for_stimulus'] = False
-        st.session_state.test_state['test_started'] = True
-        st.session_state.test_state['stimulus_start_time'] = time.time()
+    def test_stopped(self):
+        # 提交中途停止的轮次已完成的试次
+        st.session_state.engine_core.store.flush()
 
-        st.rerun()
+    def test_completed(self, statistics):
+        if not statistics:
+            return
+        core = st.session_state.engine_core
 
-    def record_response(self, response_data):
-        if not st.session_state.test_state['is_running']:
-            return False
+        # 添加到历史记录
+        if 'test_history' not in st.session_state:
+            st.session_state.test_history = []
 
-        # 计算反应时间
-        reaction_time = (time.time() - st.session_state.test_state['stimulus_start_time']) * 1000
-
-        # 判断是否正确（简化处理）
-        is_correct = True
-        if st.session_state.test_state['current_test'] == 'choice':
-            # 选择反应时：检查选择的选项
-            correct_index = st.session_state.test_state['current_stimulus']['target']['index']
-            is_correct = (response_data.get('selected_option') == correct_index)
-
-        # 保存记录
-        record_data = {
-            'user_id': st.session_state.test_state['user_data']['user_id'],
-            'test_type': st.session_state.test_state['current_test'],
-            'stimulus_type': st.session_state.test_state['current_stimulus_type'],
-            'trial_index': st.session_state.test_state['current_trial'],
-            'stimulus_content': st.session_state.test_state['current_stimulus'],
-            'reaction_time': reaction_time,
-            'is_correct': is_correct
-        }
+        st.session_state.test_history.append({
+            'test_type': core.current_test_type,
+            'stimulus_type': core.current_stimulus_type,
+            'statistics': statistics,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
 
-        self.db_manager.save_test_record(record_data)
 
-        # 更新状态
-        st.session_state.test_state['reaction_times'].append(reaction_time)
-        st.session_state.test_state['correct_responses'].append(is_correct)
-        st.session_state.test_state['current_trial'] += 1
+class WebTestEngine:
+    """engine_core.TestEngineCore 的Streamlit适配
 
-        # 准备下一个试次
-        self.prepare_next_trial()
+    引擎核心保存在会话状态中跨脚本重新运行存活；调度器在每次重新运行时轮询，
+    到期的前置期与超时在此时生效。界面读取的 test_state 由 publish_state() 从核心同步。
+    """
 
-        return True
+    def __init__(self, db_manager=None):
+        self.stimulus_generator = WebStimulusGenerator()
+        self.db_manager = db_manager or WebDatabaseManager()
+        # 时钟（秒），回放时替换为虚拟时钟
+        self.clock = time.time
+
+    @property
+    def core(self):
+        return st.session_state.get('engine_core')
+
+    def start_test(self, test_type, stimulus_type, user_data, trials=10, requeue_invalid=False):
+        # 先停止上一个核心并提交其缓存的试次，再替换
+        old_core = self.core
+        if old_core is not None:
+            old_core.stop_test()
+            old_core.store.flush()
+
+        # 用户信息随第一次提交写入（未变化时不写）
+        store = WebRunWriter(self.db_manager, dict(user_data))
+        core = TestEngineCore(self.stimulus_generator, PollingScheduler(self.clock), clock=self.clock,
+                              store=store, sink=WebSessionSink())
+        core.setup_test(test_type, stimulus_type, user_data, trials, requeue_invalid)
+        attach_feed(core)
+        st.session_state.engine_core = core
+
+        core.start_test()
+        self.publish_state()
+        st.rerun()
 
-    def complete_test(self):
-        if not st.session_state.test_state['is_running']:
+    def poll(self):
+        """执行已到期的前置期/超时并同步界面状态（每次脚本运行开始时调用）"""
+        core = self.core
+        if core is not None and core.is_test_running:
+            core.scheduler.poll()
+            core.store.checkpoint()
+            self.publish_state()
+
+    def publish_state(self):
+        """把核心状态同步到界面读取的 test_state"""
+        core = self.core
+        test_state = st.session_state.test_state
+        test_state.update({
+            'is_running': core.is_test_running,
+            'current_test': core.current_test_type,
+            'current_stimulus_type': core.current_stimulus_type,
+            'run_buffer': core.run_buffer,
+            'quality_filter': core.quality_filter,
+            'current_trial': core.current_trial,
+            'total_trials': core.total_trials,
+            'stimulus_start_time': core.stimulus_start_time,
+            'user_data': core.user_data,
+            'current_stimulus': core.current_stimulus if core.phase == PHASE_STIMULUS else None,
+            'test_started': core.phase == PHASE_STIMULUS,
+            'waiting_for_stimulus': core.is_test_running and core.phase != PHASE_STIMULUS
+        })
+
+    def show_stimulus(self, rerun=True):
+        """跳过剩余等待，立即显示刺激
+
+        在按钮回调中调用时 rerun=False，由按钮所在片段随后重新运行
+        """
+        core = self.core
+        if core is None or not core.is_test_running:
             return
+        core.skip_wait()
+        self.publish_state()
+        if rerun:
+            st.rerun()
+
+    def record_response(self, response_data, rerun=True):
+        core = self.core
+        if core is None or not core.is_test_running:
+            return False
 
-        # 计算统计结果
-        stats = self.calculate_statistics()
-
-        # 保存统计结果
-        if stats:
-            stat_data = {
-                'user_id': st.session_state.test_state['user_data']['user_id'],
-                'test_type': st.session_state.test_state['current_test'],
-                'stimulus_type': st.session_state.test_state['current_stimulus_type'],
-                'avg_reaction_time': stats['average'],
-                'std_reaction_time': stats['std'],
-                'min_reaction_time': stats['min'],
-                'max_reaction_time': stats['max'],
-                'accuracy_rate': stats['accuracy'],
-                'total_trials': st.session_state.test_state['total_trials'],
-                'test_date': datetime.now().strftime('%Y-%m-%d')
-            }
-
-            self.db_manager.save_test_statistics(stat_data)
-
-            # 添加到历史记录
-            if 'test_history' not in st.session_state:
-                st.session_state.test_history = []
-
-            st.session_state.test_history.append({
-                'test_type': st.session_state.test_state['current_test'],
-                'stimulus_type': st.session_state.test_state['current_stimulus_type'],
-                'statistics': stats,
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            })
-
-        # 结束测试
-        st.session_state.test_state['is_running'] = False
-        st.rerun()
+        # 选择反应时：比较选择的选项；其余测试只要有反应就正确
+        recorded = core.record_response(response_data.get('selected_option'))
+        self.publish_state()
+        if rerun:
+            st.rerun()
+        return recorded
 
     def calculate_statistics(self):
-        reaction_times = st.session_state.test_state['reaction_times']
-        correct_responses = st.session_state.test_state['correct_responses']
-
-        if not reaction_times:
-            return None
-
-        # 只计算正确反应的反应时
-        valid_times = []
-        for rt, correct in zip(reaction_times, correct_responses):
-            if correct:
-                valid_times.append(rt)
-
-        if valid_times:
-            avg_rt = np.mean(valid_times)
-            std_rt = np.std(valid_times)
-            min_rt = np.min(valid_times)
-            max_rt = np.max(valid_times)
-        else:
-            avg_rt = std_rt = min_rt = max_rt = 0
-
-        # 计算正确率
-        if correct_responses:
-            accuracy = sum(correct_responses) / len(correct_responses) * 100
-        else:
-            accuracy = 0
-
-        return {
-            'average': avg_rt,
-            'std': std_rt,
-            'min': min_rt,
-            'max': max_rt,
-            'accuracy': accuracy,
-            'total_trials': len(reaction_times),
-            'valid_trials': len(valid_times)
-        }
+        core = self.core
+        return core.calculate_statistics() if core is not None else None
 
     def stop_test(self):
+        if self.core is not None:
+            self.core.stop_test()
+            self.publish_state()
         st.session_state.test_state['is_running'] = False
         st.rerun()
 
 
+@st.cache_resource
+def get_database_manager(db_path='reaction_test_web.db'):
+    """服务进程内所有会话共用的数据库管理对象"""
+    db_manager = WebDatabaseManager(db_path)
+    db_manager.stats_path = os.environ.get(DB_STATS_ENV)
+    return db_manager
+
+
 # 主应用
 def main():
     # 初始化
     init_session_state()
-    test_engine = WebTestEngine()
-    db_manager = WebDatabaseManager()
+    db_manager = get_database_manager()
+    test_engine = WebTestEngine(db_manager)
 
     # 标题
     st.markdown('<h1 class="main-header">👁️🖐️ 眼手匹配性能测试系统</h1>', unsafe_allow_html=True)
@@ -680,6 +769,8 @@ def main():
 
         trials = st.slider("测试次数", min_value=5, max_value=30, value=10)
         difficulty = st.select_slider("难度级别", options=["简单", "中等", "困难"], value="中等")
+        requeue_invalid = st.checkbox("无效试次重测", value=False,
+                                      help="过早反应、注意力失误和超时的试次自动追加重测")
 
         st.divider()
 
@@ -689,7 +780,8 @@ def main():
                 if not st.session_state.user_data['name']:
                     st.warning("请先输入姓名")
                 else:
-                    test_engine.start_test(test_type, stimulus_type, st.session_state.user_data, trials)
+                    test_engine.start_test(test_type, stimulus_type, st.session_state.user_data, trials,
+                                           requeue_invalid)
 
         with col2:
             if st.button("停止测试", type="secondary", use_container_width=True):
@@ -697,71 +789,105 @@ def main():
 
         st.divider()
 
-        st.header("历史用户")
-        users = db_manager.get_all_users()
-        if users:
-            for user_id, user_name in users[:5]:
-                st.text(f"{user_name} ({user_id[:8]}...)")
-        else:
-            st.text("暂无历史用户")
+        display_participant_directory(db_manager.directory)
+
+        st.divider()
+
+        st.header("测试厅监控")
+        feed_address = st.text_input("监控服务地址", value=os.environ.get(FEED_ENV, f"127.0.0.1:{DEFAULT_PORT}"))
+        show_monitor = st.checkbox("显示监控面板", value=False)
+
+    # 执行已到期的前置期与超时
+    test_engine.poll()
 
     # 主内容区
-    if st.session_state.test_state['is_running']:
+    if show_monitor:
+        display_monitor_interface(feed_address)
+    elif st.session_state.test_state['is_running']:
         display_test_interface(test_engine)
     else:
         display_home_interface(test_engine, db_manager)
 
 
-def display_test_interface(test_engine):
-    """显示测试界面"""
-    test_state = st.session_state.test_state
+def select_participant(participant):
+    """选中参与者：下次运行时侧边栏填入其登记信息"""
+    st.session_state.user_data = {
+        'user_id': participant['user_id'],
+        'name': participant.get('name') or '',
+        'age': int(participant.get('age') or 25),
+        'gender': participant.get('gender') if participant.get('gender') in ("男", "女", "其他") else "男",
+        'occupation': participant.get('occupation') or ''
+    }
 
-    # 测试状态信息
-    col1, col2, col3, col4 = st.columns(4)
 
-    with col1:
-        test_type_display = {
-            "simple": "简单反应时",
-            "choice": "选择反应时",
-            "disjunctive": "析取反应时"
-        }.get(test_state['current_test'], "未知")
+def display_participant_directory(directory, page_size=5):
+    """参与者查找（按用户ID、姓名或职业的开头，键集分页）"""
+    st.header("历史用户")
+    query = st.text_input("查找用户", placeholder="输入用户ID、姓名或职业的开头")
 
-        st.metric("测试类型", test_type_display)
+    if not query.strip():
+        participants = directory.recent(page_size)
+        if not participants:
+            st.text("暂无历史用户")
+    else:
+        # 各页起点的键集位置，查询词变化时回到第一页
+        pages = st.session_state.get('directory_pages')
+        if pages is None or pages['query'] != query:
+            pages = st.session_state.directory_pages = {'query': query, 'cursors': [None]}
+        participants = directory.search(query, after=pages['cursors'][-1], limit=page_size + 1)
+        has_next = len(participants) > page_size
+        participants = participants[:page_size]
+        if not participants:
+            st.text("没有匹配的用户")
+
+    for participant in participants:
+        label = f"{participant.get('name') or '未填写姓名'} ({participant['user_id']})"
+        st.button(label, key=f"participant_{participant['user_id']}", use_container_width=True,
+                  on_click=select_participant, args=(participant,))
+
+    if query.strip():
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("上一页", disabled=len(pages['cursors']) == 1, use_container_width=True):
+                pages['cursors'].pop()
+                st.rerun()
+        with col2:
+            if st.button("下一页", disabled=not has_next, use_container_width=True):
+                pages['cursors'].append(directory.next_cursor(participants))
+                st.rerun()
 
-    with col2:
-        stimulus_type_display = {
-            "color": "颜色刺激",
-            "shape": "图形刺激",
-            "symbol": "符号刺激",
-            "text": "语言引导"
-        }.get(test_state['current_stimulus_type'], "未知")
 
-        st.metric("刺激类型", stimulus_type_display)
+def on_response_click(test_engine, response_data):
+    """反应按钮回调：在片段重新运行之前记录反应并计时"""
+    start = time.perf_counter()
+    test_engine.record_response(response_data, rerun=False)
+    st.session_state.pending_response_ms = (time.perf_counter() - start) * 1000
 
-    with col3:
-        st.metric("当前进度", f"{test_state['current_trial']}/{test_state['total_trials']}")
 
-    with col4:
-        if test_state['reaction_times']:
-            avg_time = np.mean(test_state['reaction_times'][-5:]) if len(
-                test_state['reaction_times']) >= 5 else np.mean(test_state['reaction_times'])
-            st.metric("平均反应时", f"{avg_time:.0f} ms")
-        else:
-            st.metric("平均反应时", "-- ms")
+def on_show_stimulus_click(test_engine):
+    test_engine.show_stimulus(rerun=False)
 
-    st.divider()
 
-    # 刺激显示区域
+@st.fragment(run_every=0.2)
+def display_stimulus_area(test_engine):
+    """刺激与反应区域（独立片段：反应点击与定时轮询只重新运行本片段）"""
+    start = time.perf_counter()
+
+    # 执行已到期的前置期与超时
+    test_engine.poll()
+    test_state = st.session_state.test_state
+    if not test_state['is_running']:
+        # 本轮结束，切换回主界面
+        st.rerun()
+
     st.markdown("### 刺激显示区域")
 
     if test_state['waiting_for_stimulus']:
-        # 显示等待提示
+        # 显示等待提示（前置期结束后自动出现刺激）
         st.markdown('<div class="stimulus-display">准备...<br><small>刺激即将出现</small></div>',
                     unsafe_allow_html=True)
 
-        # 添加一个按钮来触发刺激显示（模拟等待后自动显示）
-        if st.button("显示刺激", type="primary"):
-            test_engine.show_stimulus()
+        st.button("显示刺激", type="primary", on_click=on_show_stimulus_click, args=(test_engine,))
 
     elif test_state['test_started'] and test_state['current_stimulus']:
         # 显示刺激物
@@ -775,8 +901,8 @@ def display_test_interface(test_engine):
             # 简单反应时：单个反应按钮
             col1, col2, col3 = st.columns([1, 2, 1])
             with col2:
-                if st.button("点击反应", type="primary", use_container_width=True, key="simple_reaction"):
-                    test_engine.record_response({})
+                st.button("点击反应", type="primary", use_container_width=True, key="simple_reaction",
+                          on_click=on_response_click, args=(test_engine, {}))
 
         elif test_state['current_test'] == 'choice':
             # 选择反应时：多个选项按钮
@@ -787,10 +913,9 @@ def display_test_interface(test_engine):
 
             for i, opt in enumerate(options):
                 with cols[i]:
-                    button_text = f"选项 {opt['index']}"
-                    if st.button(button_text, use_container_width=True,
-                                 key=f"choice_{opt['index']}"):
-                        test_engine.record_response({'selected_option': opt['index']})
+                    st.button(f"选项 {opt['index']}", use_container_width=True, key=f"choice_{opt['index']}",
+                              on_click=on_response_click,
+                              args=(test_engine, {'selected_option': opt['index']}))
 
         else:  # disjunctive
             # 析取反应时：目标选择
@@ -799,58 +924,123 @@ def display_test_interface(test_engine):
             # 由于Streamlit的限制，我们使用按钮来模拟点击
             st.info(f"目标类型：{stimulus['target_type']} - {stimulus['target']['value']}")
 
-            if st.button("选择目标", type="primary", key="disjunctive_target"):
-                test_engine.record_response({'selected_target': True})
+            st.button("选择目标", type="primary", key="disjunctive_target",
+                      on_click=on_response_click, args=(test_engine, {'selected_target': True}))
+
+    # 每次反应的服务端耗时 = 回调记录反应 + 本片段重新渲染
+    pending = st.session_state.pop('pending_response_ms', None)
+    if pending is not None:
+        timings = st.session_state.setdefault('response_timings_ms', [])
+        timings.append(pending + (time.perf_counter() - start) * 1000)
+
+
+def _reaction_time_figure(buffer):
+    """反应时曲线（只在有新试次时重建）"""
+    cache_key = (id(buffer), len(buffer))
+    cached = st.session_state.get('rt_figure_cache')
+    if cached is not None and cached[0] == cache_key:
+        return cached[1]
+
+    reaction_times = buffer.reaction_times
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=np.arange(1, len(buffer) + 1),
+        y=reaction_times,
+        mode='lines+markers',
+        name='反应时',
+        line=dict(color='blue', width=2)
+    ))
+
+    # 添加平均线
+    if len(buffer) > 1:
+        avg_line = reaction_times.mean()
+        fig.add_hline(y=avg_line, line_dash="dash", line_color="red",
+                      annotation_text=f"平均: {avg_line:.0f}ms")
+
+    fig.update_layout(
+        title="反应时变化曲线",
+        xaxis_title="试次",
+        yaxis_title="反应时 (ms)",
+        height=300
+    )
+    st.session_state.rt_figure_cache = (cache_key, fig)
+    return fig
+
+
+@st.fragment(run_every=1.0)
+def display_live_stats():
+    """进度与实时统计（独立片段，每秒刷新）"""
+    test_state = st.session_state.test_state
+    buffer = test_state['run_buffer']
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("当前进度", f"{test_state['current_trial']}/{test_state['total_trials']}")
+
+    with col2:
+        if len(buffer):
+            avg_time = buffer.last(5).mean()
+            st.metric("平均反应时", f"{avg_time:.0f} ms")
+        else:
+            st.metric("平均反应时", "-- ms")
 
-    # 实时统计
-    st.divider()
     st.markdown("### 实时统计")
 
-    if test_state['reaction_times']:
+    if len(buffer):
+        reaction_times = buffer.reaction_times
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            latest_time = test_state['reaction_times'][-1]
+            latest_time = reaction_times[-1]
             st.metric("上次反应时", f"{latest_time:.0f} ms")
 
         with col2:
-            if test_state['correct_responses']:
-                accuracy = sum(test_state['correct_responses']) / len(test_state['correct_responses']) * 100
-                st.metric("当前准确率", f"{accuracy:.1f}%")
-            else:
-                st.metric("当前准确率", "--")
+            accuracy = float(np.count_nonzero(buffer.correct)) / len(buffer) * 100
+            st.metric("当前准确率", f"{accuracy:.1f}%")
 
         with col3:
-            if len(test_state['reaction_times']) >= 2:
-                trend = "↑" if test_state['reaction_times'][-1] > test_state['reaction_times'][-2] else "↓"
+            if len(buffer) >= 2:
+                trend = "↑" if reaction_times[-1] > reaction_times[-2] else "↓"
                 st.metric("趋势", trend)
             else:
                 st.metric("趋势", "--")
 
-        # 反应时折线图
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=list(range(1, len(test_state['reaction_times']) + 1)),
-            y=test_state['reaction_times'],
-            mode='lines+markers',
-            name='反应时',
-            line=dict(color='blue', width=2)
-        ))
+        st.plotly_chart(_reaction_time_figure(buffer), use_container_width=True)
 
-        # 添加平均线
-        if len(test_state['reaction_times']) > 1:
-            avg_line = np.mean(test_state['reaction_times'])
-            fig.add_hline(y=avg_line, line_dash="dash", line_color="red",
-                          annotation_text=f"平均: {avg_line:.0f}ms")
-
-        fig.update_layout(
-            title="反应时变化曲线",
-            xaxis_title="试次",
-            yaxis_title="反应时 (ms)",
-            height=300
-        )
 
-        st.plotly_chart(fig, use_container_width=True)
+def display_test_interface(test_engine):
+    """显示测试界面（刺激区与统计区为独立片段，侧边栏等只在整页运行时渲染）"""
+    test_state = st.session_state.test_state
+
+    # 测试状态信息
+    col1, col2 = st.columns(2)
+
+    with col1:
+        test_type_display = {
+            "simple": "简单反应时",
+            "choice": "选择反应时",
+            "disjunctive": "析取反应时"
+        }.get(test_state['current_test'], "未知")
+
+        st.metric("测试类型", test_type_display)
+
+    with col2:
+        stimulus_type_display = {
+            "color": "颜色刺激",
+            "shape": "图形刺激",
+            "symbol": "符号刺激",
+            "text": "语言引导"
+        }.get(test_state['current_stimulus_type'], "未知")
+
+        st.metric("刺激类型", stimulus_type_display)
+
+    st.divider()
+
+    display_stimulus_area(test_engine)
+
+    st.divider()
+
+    display_live_stats()
 
     # 测试说明
     with st.expander("测试说明"):
@@ -877,6 +1067,51 @@ def display_test_interface(test_engine):
             """)
 
 
+@st.cache_resource
+def get_feed_subscriber(address):
+    """每个服务进程对同一监控服务只保留一个订阅连接，所有浏览器会话共用"""
+    subscriber = FeedSubscriber(address)
+    subscriber.start()
+    return subscriber
+
+
+@st.fragment(run_every=1.0)
+def display_monitor_board(address):
+    """监控面板（每秒只重新运行本片段）"""
+    subscriber = get_feed_subscriber(address)
+    rows = subscriber.board.rows()
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("工作站", len(rows))
+    with col2:
+        st.metric("测试中", sum(1 for row in rows if row['status'] in ('running', 'stimulus')))
+    with col3:
+        st.metric("已完成轮次", sum(row['runs_completed'] for row in rows))
+    with col4:
+        st.metric("已接收事件", subscriber.board.events)
+
+    if not subscriber.connected:
+        st.warning(f"未连接到监控服务 {address}" + (f"：{subscriber.last_error}" if subscriber.last_error else ""))
+    if not rows:
+        st.info("暂无工作站事件")
+        return
+
+    df = pd.DataFrame(rows).rename(columns={
+        'station': '工作站', 'status': '状态', 'user_id': '用户ID', 'test_type': '测试类型',
+        'progress': '进度', 'last_rt': '上次反应时(ms)', 'mean_rt': '平均反应时(ms)', 'errors': '错误',
+        'timeouts': '超时', 'runs_completed': '完成轮次', 'age_s': '距上次事件(秒)'
+    })
+    st.dataframe(df.round(1), use_container_width=True, hide_index=True)
+
+
+def display_monitor_interface(address):
+    """测试厅实时监控"""
+    st.markdown("### 📡 测试厅实时监控")
+    st.caption("各工作站推送的实时事件（不读取数据库），启动服务: python live_feed.py serve")
+    display_monitor_board(address)
+
+
 def display_home_interface(test_engine, db_manager):
     """显示主界面"""
     # 功能介绍
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+热点路径微基准测试
+固定随机种子生成输入，计时以下路径：
+    - gen.*    StimulusGenerator / WebStimulusGenerator 按刺激种类生成刺激
+    - stats.*  两个引擎的 calculate_statistics（10 至 10^6 个试次）
+    - db.*     DatabaseManager 写入与历史查询（预先填充到实际规模的数据表）
+    - html.*   WebStimulusGenerator 的选择/析取反应时HTML生成
+    - paint.*  StimulusDisplayWidget.paintEvent（离屏渲染）
+
+每次运行追加到JSON历史文件，并与保存的基线比较（按每次调用的最小耗时），
+超过阈值的变慢标记为回归，退出码为1。
+
+用法:
+    python benchmarks.py run --filter stats --save-baseline
+    python benchmarks.py run --threshold 0.25
+    python benchmarks.py history stats.qt.n=1000000
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BENCH_SEED = 20240601
+
+DEFAULT_HISTORY = 'benchmark_history.json'
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_REPEAT = 5
+DEFAULT_MIN_TIME = 0.05
+
+STATISTICS_SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+
+# 数据库基准的表规模：用户数 × 每人轮次 × 每轮试次
+DB_USERS = 200
+DB_RUNS_PER_USER = 25
+DB_TRIALS_PER_RUN = 20
+
+PAINT_SIZE = (800, 600)
+
+
+class BenchCase:
+    """一个基准用例：setup 在计时前执行一次，返回被计时的无参函数"""
+
+    def __init__(self, name: str, setup: Callable[[], Callable[[], Any]]):
+        self.name = name
+        self.setup = setup
+
+
+def _time_callable(func: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, Any]:
+    """自动确定每轮调用次数（每轮至少 min_time 秒），返回每次调用的耗时（微秒）"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    per_call = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        per_call.append((time.perf_counter() - start) / number * 1e6)
+
+    return {
+        'min_us': min(per_call),
+        'median_us': float(np.median(per_call)),
+        'number': number,
+        'repeat': repeat
+    }
+
+
+# ---------------------------------------------------------------- 刺激生成
+
+def _seeded(func: Callable[[], Any]) -> Callable[[], Callable[[], Any]]:
+    def setup():
+        random.seed(BENCH_SEED)
+        return func
+    return setup
+
+
+def _generator_cases() -> List[BenchCase]:
+    from safe_test import StimulusGenerator
+    from Qt_2_web import WebStimulusGenerator
+
+    qt_generator = StimulusGenerator()
+    web_generator = WebStimulusGenerator()
+    cases = []
+    for kind in ('color', 'shape', 'symbol', 'text'):
+        cases.append(BenchCase(f'gen.qt.simple.{kind}',
+                               _seeded(lambda kind=kind: qt_generator.generate_simple_stimulus(kind))))
+    cases.append(BenchCase('gen.qt.choice', _seeded(lambda: qt_generator.generate_choice_stimuli(4))))
+    for kind in ('color', 'shape'):
+        cases.append(BenchCase(f'gen.qt.disjunctive.{kind}',
+                               _seeded(lambda kind=kind: qt_generator.generate_disjunctive_stimuli(kind))))
+
+    for kind in ('color', 'shape', 'symbol', 'text'):
+        cases.append(BenchCase(f'gen.web.simple.{kind}',
+                               _seeded(lambda kind=kind: web_generator.generate_stimulus('simple', kind))))
+    cases.append(BenchCase('gen.web.choice', _seeded(lambda: web_generator.generate_stimulus('choice', 'color'))))
+    cases.append(BenchCase('gen.web.disjunctive',
+                           _seeded(lambda: web_generator.generate_stimulus('disjunctive', 'color'))))
+    return cases
+
+
+# ---------------------------------------------------------------- 统计计算
+
+BENCH_USER = {'user_id': 'bench', 'name': 'bench', 'age': 25, 'gender': '男', 'occupation': ''}
+
+
+def _fill_run_buffer(core, trials: int):
+    """按固定种子填充 trials 个试次（对数正态反应时，含错误、预期反应与超时）"""
+    from quality_control import QC_ANTICIPATION, QC_SLOW_OUTLIER, QC_VALID
+
+    rng = np.random.default_rng(BENCH_SEED)
+    reaction_times = rng.lognormal(np.log(350.0), 0.25, trials)
+    correct = rng.random(trials) >= 0.05
+    labels = rng.choice([QC_VALID, QC_ANTICIPATION, QC_SLOW_OUTLIER], trials, p=[0.95, 0.03, 0.02])
+
+    core.setup_test('simple', 'color', BENCH_USER, trials)
+    buffer = core.run_buffer
+    buffer.reset(trials)
+    for rt, ok, label in zip(reaction_times.tolist(), correct.tolist(), labels.tolist()):
+        buffer.append(rt, ok, label)
+
+
+def _statistics_cases(work_dir: str) -> List[BenchCase]:
+    def qt_setup(trials):
+        def setup():
+            from safe_test import DatabaseManager, TestEngine
+            engine = TestEngine(DatabaseManager(os.path.join(work_dir, 'stats_qt.db')))
+            _fill_run_buffer(engine.core, trials)
+            return engine.calculate_statistics
+        return setup
+
+    def web_setup(trials):
+        def setup():
+            import streamlit as st
+            from Qt_2_web import WebDatabaseManager, WebTestEngine
+            from engine_core import PollingScheduler, TestEngineCore
+
+            engine = WebTestEngine(WebDatabaseManager(os.path.join(work_dir, 'stats_web.db')))
+            core = TestEngineCore(engine.stimulus_generator, PollingScheduler(engine.clock), clock=engine.clock)
+            _fill_run_buffer(core, trials)
+            st.session_state.engine_core = core
+            return engine.calculate_statistics
+        return setup
+
+    cases = []
+    for trials in STATISTICS_SIZES:
+        cases.append(BenchCase(f'stats.qt.n={trials}', qt_setup(trials)))
+        cases.append(BenchCase(f'stats.web.n={trials}', web_setup(trials)))
+    return cases
+
+
+# ---------------------------------------------------------------- 数据库
+
+def _populate_database(db_path: str):
+    """填充 DB_USERS × DB_RUNS_PER_USER 轮统计与对应试次记录"""
+    from storage import DatabaseManager
+
+    DatabaseManager(db_path)
+    rng = random.Random(BENCH_SEED)
+    users, statistics, records = [], [], []
+    for u in range(DB_USERS):
+        user_id = f'user_{u:04d}'
+        users.append((user_id, f'被试{u}', rng.randint(18, 60), rng.choice(['男', '女']), '工人'))
+        for r in range(DB_RUNS_PER_USER):
+            test_type = rng.choice(['simple', 'choice', 'disjunctive'])
+            rts = [rng.lognormvariate(5.85, 0.25) for _ in range(DB_TRIALS_PER_RUN)]
+            test_date = f'2025-{1 + r % 12:02d}-{1 + r % 28:02d}'
+            statistics.append((user_id, test_type, 'color', float(np.mean(rts)), float(np.std(rts)),
+                               min(rts), max(rts), 95.0, DB_TRIALS_PER_RUN, test_date))
+            for i, rt in enumerate(rts):
+                records.append((user_id, test_type, 'color', i, '{"type": "color"}', rt, 1, 'valid', 0.0))
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany('INSERT INTO users (user_id, name, age, gender, occupation) VALUES (?, ?, ?, ?, ?)',
+                         users)
+        conn.executemany('''
+            INSERT INTO test_statistics (user_id, test_type, stimulus_type, avg_reaction_time, std_reaction_time,
+                                         min_reaction_time, max_reaction_time, accuracy_rate, total_trials, test_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', statistics)
+        conn.executemany('''
+            INSERT INTO test_records (user_id, test_type, stimulus_type, trial_index, stimulus_content,
+                                      reaction_time, is_correct, qc_label, latency_correction)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', records)
+    conn.close()
+
+
+def _database_cases(work_dir: str) -> List[BenchCase]:
+    db_path = os.path.join(work_dir, 'bench.db')
+    state = {}
+
+    def manager():
+        if 'db' not in state:
+            from storage import DatabaseManager
+            _populate_database(db_path)
+            state['db'] = DatabaseManager(db_path)
+        return state['db']
+
+    def insert_record():
+        from trial_records import TrialRecord
+        db = manager()
+        record = TrialRecord('user_0001', 'simple', 'color', 0, {'type': 'color', 'name': 'red'},
+                             352.5, True, 'valid')
+        return lambda: db.save_test_record(record)
+
+    def insert_statistics():
+        db = manager()
+        stat = {'user_id': 'user_0001', 'test_type': 'simple', 'stimulus_type': 'color',
+                'avg_reaction_time': 350.0, 'std_reaction_time': 40.0, 'min_reaction_time': 280.0,
+                'max_reaction_time': 460.0, 'accuracy_rate': 95.0, 'total_trials': 20,
+                'test_date': '2025-06-01'}
+        return lambda: db.save_test_statistics(stat)
+
+    def uncached(query):
+        # 每次调用前递增写入版本号使缓存失效，计时的是实际查询
+        def setup():
+            db = manager()
+
+            def run():
+                db._bump_write_version()
+                return query(db)
+            return run
+        return setup
+
+    def cached(query):
+        def setup():
+            db = manager()
+            query(db)
+            return lambda: query(db)
+        return setup
+
+    def second_page(db):
+        first = db.get_user_history_page('user_0100', limit=10)
+        last = first[-1]
+        return db.get_user_history_page('user_0100', after=(last['test_date'], last['stat_id']), limit=10)
+
+    return [
+        BenchCase('db.insert_record', insert_record),
+        BenchCase('db.insert_statistics', insert_statistics),
+        BenchCase('db.history', uncached(lambda db: db.get_user_history('user_0100', limit=50))),
+        BenchCase('db.history.cached', cached(lambda db: db.get_user_history('user_0100', limit=50))),
+        BenchCase('db.history_page.keyset', uncached(second_page)),
+        BenchCase('db.trial_details', uncached(lambda db: db.get_trial_details('user_0100', 'simple', limit=100)))
+    ]
+
+
+# ---------------------------------------------------------------- HTML生成
+
+def _html_cases() -> List[BenchCase]:
+    from Qt_2_web import WebStimulusGenerator
+
+    generator = WebStimulusGenerator()
+
+    def choice():
+        random.seed(BENCH_SEED)
+        stimulus = generator.generate_stimulus('choice', 'color')
+        return lambda: generator._generate_choice_display(stimulus['options'], stimulus['target'])
+
+    def disjunctive():
+        random.seed(BENCH_SEED)
+        stimulus = generator.generate_stimulus('disjunctive', 'color')
+        return lambda: generator._generate_disjunctive_display(stimulus['target'], stimulus['distractors'])
+
+    return [BenchCase('html.choice', choice), BenchCase('html.disjunctive', disjunctive)]
+
+
+# ---------------------------------------------------------------- 离屏绘制
+
+def _paint_cases() -> List[BenchCase]:
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtGui import QImage
+    from PyQt6.QtWidgets import QApplication
+    from safe_test import QtStimulusSource, StimulusDisplayWidget
+
+    state = {}
+
+    def widget_for(stimulus_factory):
+        def setup():
+            if 'app' not in state:
+                state['app'] = QApplication.instance() or QApplication([])
+            widget = StimulusDisplayWidget()
+            widget.resize(*PAINT_SIZE)
+            random.seed(BENCH_SEED)
+            widget.current_stimulus = stimulus_factory()
+            image = QImage(PAINT_SIZE[0], PAINT_SIZE[1], QImage.Format.Format_ARGB32_Premultiplied)
+            state.setdefault('widgets', []).append(widget)
+            # render() 同步调用 paintEvent 绘制到图像
+            return lambda: widget.render(image)
+        return setup
+
+    source = QtStimulusSource()
+    return [
+        BenchCase('paint.idle', widget_for(lambda: None)),
+        BenchCase('paint.simple.color', widget_for(lambda: source.generate_stimulus('simple', 'color'))),
+        BenchCase('paint.simple.shape', widget_for(lambda: source.generate_stimulus('simple', 'shape'))),
+        BenchCase('paint.simple.symbol', widget_for(lambda: source.generate_stimulus('simple', 'symbol'))),
+        BenchCase('paint.choice', widget_for(lambda: source.generate_stimulus('choice', 'color'))),
+        BenchCase('paint.disjunctive', widget_for(lambda: source.generate_stimulus('disjunctive', 'color')))
+    ]
+
+
+# ---------------------------------------------------------------- 运行与比较
+
+# 用例族 -> 构造函数（gen / stats 中含Qt引擎的用例，paint 需要 PyQt6）
+FAMILIES = {
+    'gen': lambda work_dir: _generator_cases(),
+    'stats': _statistics_cases,
+    'db': _database_cases,
+    'html': lambda work_dir: _html_cases(),
+    'paint': lambda work_dir: _paint_cases()
+}
+
+# 只依赖存储层、不导入 PyQt6 / Streamlit 的用例族（无界面服务器上运行）
+HEADLESS_FAMILIES = ('db',)
+
+
+def collect_cases(work_dir: str, families: Optional[Iterable[str]] = None) -> List[BenchCase]:
+    """全部基准用例（按名称排序前的定义顺序），families 限定用例族"""
+    cases = []
+    for family, build in FAMILIES.items():
+        if families is None or family in families:
+            cases.extend(build(work_dir))
+    return cases
+
+
+def run_benchmarks(name_filter: Optional[str] = None, repeat: int = DEFAULT_REPEAT,
+                   min_time: float = DEFAULT_MIN_TIME, verbose: bool = True,
+                   families: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """运行名称包含 name_filter 的用例（在临时目录中运行，不写入工作数据库）"""
+    results = {}
+    old_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            for case in collect_cases(work_dir, families):
+                if name_filter and name_filter not in case.name:
+                    continue
+                func = case.setup()
+                results[case.name] = _time_callable(func, repeat, min_time)
+                if verbose:
+                    print(f"{case.name:<28} {_format_us(results[case.name]['min_us']):>12}")
+        finally:
+            os.chdir(old_cwd)
+    return results
+
+
+def _format_us(value: float) -> str:
+    if value >= 1000:
+        return f"{value / 1000:.2f} ms"
+    return f"{value:.2f} µs"
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'sqlite': sqlite3.sqlite_version
+    }
+
+
+def _load_json(path: str, default):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        print(f"读取 {path} 失败: {e}")
+        return default
+
+
+def _write_json(path: str, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def append_history(path: str, entry: Dict[str, Any]):
+    """追加一次运行到历史文件（JSON数组）"""
+    history = _load_json(path, [])
+    history.append(entry)
+    _write_json(path, history)
+
+
+def compare_to_baseline(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any],
+                        threshold: float = DEFAULT_THRESHOLD) -> List[Tuple[str, float, float, float, str]]:
+    """与基线比较每次调用的最小耗时，返回 (名称, 基线µs, 当前µs, 比值, 标记)"""
+    rows = []
+    baseline_results = baseline.get('results', {})
+    for name, result in results.items():
+        if name not in baseline_results:
+            continue
+        base = baseline_results[name]['min_us']
+        ratio = result['min_us'] / base if base > 0 else 1.0
+        if ratio > 1 + threshold:
+            flag = '回归'
+        elif ratio < 1 - threshold:
+            flag = '改进'
+        else:
+            flag = ''
+        rows.append((name, base, result['min_us'], ratio, flag))
+    return rows
+
+
+def record_results(results: Dict[str, Dict[str, Any]], history_path: str, baseline_path: str,
+                   threshold: float, save_baseline: bool = False) -> int:
+    """追加历史、与基线比较并打印，返回回归用例数"""
+    entry = dict(_environment(), results=results)
+    append_history(history_path, entry)
+
+    regressions = 0
+    baseline = _load_json(baseline_path, None)
+    if baseline is None:
+        print(f"\n没有基线文件 {baseline_path}，跳过比较")
+    else:
+        print(f"\n与基线比较（{baseline.get('timestamp', '')} {baseline.get('commit', '')}，阈值 {threshold:.0%}）")
+        for name, base, current, ratio, flag in compare_to_baseline(results, baseline, threshold):
+            print(f"{name:<28} {_format_us(base):>12} -> {_format_us(current):>12}  {ratio:5.2f}x  {flag}")
+            regressions += flag == '回归'
+        if regressions:
+            print(f"\n{regressions} 个用例超过回归阈值")
+
+    if save_baseline:
+        if baseline is not None:
+            # 只更新本次运行的用例，保留基线中的其他用例
+            entry['results'] = dict(baseline.get('results', {}), **results)
+        _write_json(baseline_path, entry)
+        print(f"已保存基线: {baseline_path}")
+    return regressions
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="热点路径微基准测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="运行基准并与基线比较")
+    run_parser.add_argument('--filter', default=None, help="只运行名称包含该字符串的用例")
+    run_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="每个用例的计时轮数")
+    run_parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME, help="每轮最短时长（秒）")
+    run_parser.add_argument('--history', default=DEFAULT_HISTORY, help="历史文件路径")
+    run_parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="基线文件路径")
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="回归阈值（比例）")
+    run_parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+
+    subparsers.add_parser('list', help="列出全部用例名称")
+
+    history_parser = subparsers.add_parser('history', help="显示某个用例的历史结果")
+    history_parser.add_argument('name', help="用例名称")
+    history_parser.add_argument('--history', default=DEFAULT_HISTORY, help="历史文件路径")
+
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        with tempfile.TemporaryDirectory() as work_dir:
+            for case in collect_cases(work_dir):
+                print(case.name)
+        return
+
+    if args.command == 'history':
+        for entry in _load_json(args.history, []):
+            result = entry['results'].get(args.name)
+            if result is not None:
+                print(f"{entry['timestamp']}  {entry.get('commit', ''):<10} {_format_us(result['min_us']):>12}")
+        return
+
+    results = run_benchmarks(args.filter, args.repeat, args.min_time)
+    regressions = record_results(results, args.history, args.baseline, args.threshold, args.save_baseline)
+    sys.exit(1 if regressions and not args.save_baseline else 0)
+
+
+if __name__ == "__main__":
+    main()
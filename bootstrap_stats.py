@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量Bootstrap置信区间统计
+按 用户 × 测试类型 × 刺激类型 计算平均/中位反应时与正确率的置信区间，
+重采样以索引矩阵向量化完成，用户分块分发到进程池并行计算，
+结果写入 test_statistics_ci 表（与 test_statistics 并列）
+
+用法: python bootstrap_stats.py --db reaction_test.db --workers 8
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from db_maintenance import merge_ordered, open_partitions
+
+TIMEOUT_MS = 3000
+
+# 单次重采样索引矩阵的元素上限，超过则分批生成以控制内存
+MAX_MATRIX_ELEMENTS = 4_000_000
+
+CI_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS test_statistics_ci (
+        ci_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        test_type TEXT,
+        stimulus_type TEXT,
+        n_trials INTEGER,
+        n_boot INTEGER,
+        confidence REAL,
+        mean_rt REAL,
+        mean_rt_ci_low REAL,
+        mean_rt_ci_high REAL,
+        median_rt REAL,
+        median_rt_ci_low REAL,
+        median_rt_ci_high REAL,
+        accuracy_rate REAL,
+        accuracy_ci_low REAL,
+        accuracy_ci_high REAL,
+        computed_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, test_type, stimulus_type),
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    )
+'''
+
+CI_COLUMNS = [
+    'user_id', 'test_type', 'stimulus_type', 'n_trials', 'n_boot', 'confidence',
+    'mean_rt', 'mean_rt_ci_low', 'mean_rt_ci_high',
+    'median_rt', 'median_rt_ci_low', 'median_rt_ci_high',
+    'accuracy_rate', 'accuracy_ci_low', 'accuracy_ci_high'
+]
+
+
+def bootstrap_ci(values: np.ndarray, n_boot: int, confidence: float,
+                 rng: np.random.Generator, statistics=("mean",)) -> Dict[str, Tuple[float, float]]:
+    """向量化Bootstrap百分位置信区间
+
+    一次生成 (n_boot, n) 的重采样索引矩阵，按行求统计量，避免Python层循环。
+    """
+    n = len(values)
+    if n == 0:
+        return {name: (float('nan'), float('nan')) for name in statistics}
+
+    batch = max(1, min(n_boot, MAX_MATRIX_ELEMENTS // n))
+    results = {name: [] for name in statistics}
+
+    remaining = n_boot
+    while remaining > 0:
+        size = min(batch, remaining)
+        idx = rng.integers(0, n, size=(size, n))
+        samples = values[idx]
+        if "mean" in results:
+            results["mean"].append(samples.mean(axis=1))
+        if "median" in results:
+            results["median"].append(np.median(samples, axis=1))
+        remaining -= size
+
+    alpha = (1 - confidence) / 2
+    intervals = {}
+    for name, parts in results.items():
+        dist = np.concatenate(parts)
+        low, high = np.quantile(dist, [alpha, 1 - alpha])
+        intervals[name] = (float(low), float(high))
+    return intervals
+
+
+def cell_seed(base_seed: int, user_id: str, test_type: str, stimulus_type: str) -> int:
+    """由单元标识派生随机种子，保证结果可复现且与分块方式无关"""
+    key = f"{user_id}|{test_type}|{stimulus_type}".encode('utf-8')
+    return (base_seed * 1_000_003 + zlib.crc32(key)) & 0xFFFFFFFF
+
+
+def compute_cell(user_id: str, test_type: str, stimulus_type: str,
+                 reaction_times: np.ndarray, correct: np.ndarray, valid: np.ndarray,
+                 n_boot: int, confidence: float, base_seed: int) -> Dict[str, Any]:
+    """计算单个 用户×条件 单元的置信区间"""
+    rng = np.random.default_rng(cell_seed(base_seed, user_id, test_type, stimulus_type))
+
+    valid_rts = reaction_times[valid & correct]
+    rt_ci = bootstrap_ci(valid_rts, n_boot, confidence, rng, statistics=("mean", "median"))
+    acc_ci = bootstrap_ci(correct.astype(np.float64) * 100, n_boot, confidence, rng)
+
+    return {
+        'user_id': user_id,
+        'test_type': test_type,
+        'stimulus_type': stimulus_type,
+        'n_trials': int(len(reaction_times)),
+        'n_boot': n_boot,
+        'confidence': confidence,
+        'mean_rt': float(valid_rts.mean()) if len(valid_rts) else None,
+        'mean_rt_ci_low': rt_ci['mean'][0] if len(valid_rts) else None,
+        'mean_rt_ci_high': rt_ci['mean'][1] if len(valid_rts) else None,
+        'median_rt': float(np.median(valid_rts)) if len(valid_rts) else None,
+        'median_rt_ci_low': rt_ci['median'][0] if len(valid_rts) else None,
+        'median_rt_ci_high': rt_ci['median'][1] if len(valid_rts) else None,
+        'accuracy_rate': float(correct.mean() * 100) if len(correct) else None,
+        'accuracy_ci_low': acc_ci['mean'][0] if len(correct) else None,
+        'accuracy_ci_high': acc_ci['mean'][1] if len(correct) else None,
+    }
+
+
+def iter_user_cells(conn: sqlite3.Connection, user_ids: List[str],
+                    partitions: Sequence[sqlite3.Connection] = ()) -> Iterator[Tuple]:
+    """按单元顺序读取试次（合并主库与各月分区），逐个产出 (user_id, test_type, stimulus_type, rts, correct, valid)"""
+    placeholders = ','.join('?' * len(user_ids))
+    sql = f'''
+        SELECT user_id, test_type, stimulus_type, record_id, reaction_time, is_correct, qc_label
+        FROM test_records
+        WHERE user_id IN ({placeholders})
+        ORDER BY user_id, test_type, stimulus_type, record_id
+    '''
+    # 单元内按 record_id 排序，重采样结果与试次移入哪个分区无关（固定种子下可复现）
+    cursor = merge_ordered([source.execute(sql, user_ids) for source in (conn, *partitions)], 4)
+
+    current_key = None
+    rts, correct, valid = [], [], []
+    for user_id, test_type, stimulus_type, _, rt, is_correct, qc_label in cursor:
+        key = (user_id, test_type, stimulus_type)
+        if key != current_key:
+            if current_key is not None:
+                yield current_key + (np.asarray(rts, dtype=np.float64),
+                                     np.asarray(correct, dtype=bool),
+                                     np.asarray(valid, dtype=bool))
+            current_key = key
+            rts, correct, valid = [], [], []
+
+        rts.append(rt if rt is not None else TIMEOUT_MS)
+        correct.append(bool(is_correct))
+        # 旧记录没有质量控制标签时退回到超时判断
+        if qc_label is None:
+            valid.append(rt is not None and rt < TIMEOUT_MS)
+        else:
+            valid.append(qc_label == 'valid')
+
+    if current_key is not None:
+        yield current_key + (np.asarray(rts, dtype=np.float64),
+                             np.asarray(correct, dtype=bool),
+                             np.asarray(valid, dtype=bool))
+
+
+def process_user_chunk(db_path: str, user_ids: List[str], n_boot: int,
+                       confidence: float, base_seed: int) -> List[Dict[str, Any]]:
+    """进程池任务：各进程自行只读打开数据库，处理一批用户
+
+    先读完整块再计算，读事务不跨越重采样，不阻塞其他进程提交
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    partitions = open_partitions(db_path)
+    try:
+        cells = list(iter_user_cells(conn, user_ids, partitions))
+    finally:
+        for source in (conn, *partitions):
+            source.close()
+
+    return [
+        compute_cell(user_id, test_type, stimulus_type, rts, correct, valid,
+                     n_boot, confidence, base_seed)
+        for user_id, test_type, stimulus_type, rts, correct, valid in cells
+    ]
+
+
+def save_ci_rows(conn: sqlite3.Connection, rows: List[Dict[str, Any]]):
+    """写入置信区间结果（同一单元覆盖旧结果）并提交，写事务只覆盖一块结果"""
+    placeholders = ', '.join('?' * len(CI_COLUMNS))
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO test_statistics_ci ({', '.join(CI_COLUMNS)}) VALUES ({placeholders})",
+            [tuple(row[col] for col in CI_COLUMNS) for row in rows]
+        )
+
+
+def run_bootstrap_job(db_path: str, n_boot: int = 2000, confidence: float = 0.95,
+                      workers: Optional[int] = None, chunk_size: Optional[int] = None,
+                      seed: int = 0, user_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """执行批量Bootstrap统计任务，返回运行摘要"""
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute(CI_TABLE_SQL)
+    conn.commit()
+
+    if user_ids is None:
+        partitions = open_partitions(db_path)
+        try:
+            user_ids = sorted({row[0] for source in (conn, *partitions)
+                               for row in source.execute('SELECT DISTINCT user_id FROM test_records')
+                               if row[0] is not None})
+        finally:
+            for source in partitions:
+                source.close()
+
+    # 默认每个进程分到约4个任务，兼顾负载均衡与调度开销
+    if not chunk_size:
+        chunk_size = max(1, min(500, -(-len(user_ids) // (workers * 4))))
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    cells = 0
+
+    # 每块结果单独提交：不长时间占用写锁，任务中断时已完成的块保留在库中
+    try:
+        if workers <= 1:
+            for chunk in chunks:
+                rows = process_user_chunk(db_path, chunk, n_boot, confidence, seed)
+                save_ci_rows(conn, rows)
+                cells += len(rows)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(process_user_chunk, db_path, chunk, n_boot, confidence, seed)
+                           for chunk in chunks]
+                for future in as_completed(futures):
+                    rows = future.result()
+                    save_ci_rows(conn, rows)
+                    cells += len(rows)
+    finally:
+        conn.close()
+
+    return {
+        'users': len(user_ids),
+        'cells': cells,
+        'workers': workers,
+        'elapsed_seconds': time.perf_counter() - start
+    }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="批量计算反应时Bootstrap置信区间")
+    parser.add_argument('--db', default='reaction_test.db', help="数据库路径")
+    parser.add_argument('--boot', type=int, default=2000, help="重采样次数")
+    parser.add_argument('--confidence', type=float, default=0.95, help="置信水平")
+    parser.add_argument('--workers', type=int, default=None, help="进程数（默认CPU核数）")
+    parser.add_argument('--chunk-size', type=int, default=None, help="每个任务包含的用户数（默认自动）")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--user', action='append', dest='users', help="只计算指定用户（可重复）")
+    args = parser.parse_args()
+
+    summary = run_bootstrap_job(args.db, n_boot=args.boot, confidence=args.confidence,
+                                workers=args.workers, chunk_size=args.chunk_size,
+                                seed=args.seed, user_ids=args.users)
+    print(f"完成: {summary['users']} 个用户, {summary['cells']} 个单元, "
+          f"{summary['workers']} 个进程, 耗时 {summary['elapsed_seconds']:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量参与者报告
+按群体条件（日期范围、职业、测试类型）选出参与者，为每人生成 HTML / PDF / PNG 报告：
+基本信息、各测试类型的成绩与常模百分位、评价，以及历史统计图（与统计图表窗口相同）。
+
+- 用户分块分发到进程池并行绘制，各进程使用Agg后端、只读打开数据库
+- 常模表（各 测试类型×刺激类型 下每人平均成绩的百分位）保存为 norms.json，
+  重新生成前所有报告使用同一份常模
+- 报告按 用户数据版本 + 常模 + 筛选条件 + 输出格式 计算缓存键，记录在 _manifest.json，
+  数据未变化的用户直接跳过；中途中断后再次运行从未完成的用户继续
+
+用法: python cohort_reports.py run --db reaction_test.db --out reports --start 2026-01-01 --occupation 学生
+      python cohort_reports.py norms --db reaction_test.db --out reports
+"""
+
+import argparse
+import base64
+import hashlib
+import html
+import io
+import json
+import os
+import re
+import sqlite3
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from report_charts import draw_history_chart, evaluate_performance, CJK_FONTS, TEST_TYPE_NAMES, STIMULUS_TYPE_NAMES
+
+# 报告版式变化时递增，使全部缓存失效
+REPORT_VERSION = 1
+
+FORMATS = ('html', 'pdf', 'png')
+MANIFEST_FILE = '_manifest.json'
+NORMS_FILE = 'norms.json'
+
+# 常模组至少需要的参与者数，不足时报告中不给百分位
+MIN_NORM_SIZE = 30
+NORM_PERCENTILES = np.arange(101)
+
+# 历史图表使用的最近轮次数（与统计图表窗口一致）
+HISTORY_RUNS = 20
+
+A4_INCHES = (8.27, 11.69)
+
+
+def _write_json(path: str, data: Any):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str, default: Any) -> Any:
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _filter_sql(filters: Dict[str, Optional[str]], alias: str = 's') -> Tuple[str, List[Any]]:
+    """群体条件 -> (WHERE子句, 参数)；职业条件需要连接 users 表（别名 u）"""
+    conditions, params = [], []
+    if filters.get('start'):
+        conditions.append(f"date({alias}.test_date) >= ?")
+        params.append(filters['start'])
+    if filters.get('end'):
+        conditions.append(f"date({alias}.test_date) <= ?")
+        params.append(filters['end'])
+    if filters.get('test_type'):
+        conditions.append(f"{alias}.test_type = ?")
+        params.append(filters['test_type'])
+    if filters.get('occupation'):
+        conditions.append("u.occupation = ?")
+        params.append(filters['occupation'])
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ''), params
+
+
+def cohort_user_ids(conn: sqlite3.Connection, filters: Dict[str, Optional[str]]) -> List[str]:
+    """满足群体条件的参与者"""
+    where, params = _filter_sql(filters)
+    return [row[0] for row in conn.execute(f'''
+        SELECT DISTINCT s.user_id FROM test_statistics s
+        LEFT JOIN users u ON u.user_id = s.user_id
+        {where}
+        ORDER BY s.user_id
+    ''', params) if row[0] is not None]
+
+
+def user_data_versions(conn: sqlite3.Connection, user_ids: List[str]) -> Dict[str, str]:
+    """各参与者的数据版本（登记信息与统计结果的摘要，任何增删改都会改变）"""
+    wanted = set(user_ids)
+    parts: Dict[str, list] = {user_id: [] for user_id in user_ids}
+    for row in conn.execute('SELECT user_id, name, age, gender, occupation FROM users'):
+        if row[0] in wanted:
+            parts[row[0]].append(row[1:])
+    for row in conn.execute('''
+        SELECT user_id, COUNT(*), MAX(stat_id), TOTAL(avg_reaction_time), TOTAL(accuracy_rate),
+               MAX(test_date)
+        FROM test_statistics GROUP BY user_id
+    '''):
+        if row[0] in wanted:
+            parts[row[0]].append(row[1:])
+    return {user_id: hashlib.sha1(repr(values).encode('utf-8')).hexdigest()[:16]
+            for user_id, values in parts.items()}
+
+
+def build_norms(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """由全体参与者每人的平均成绩建立常模表（各 测试类型×刺激类型 的百分位点）"""
+    frame = pd.read_sql_query('''
+        SELECT user_id, test_type, stimulus_type,
+               AVG(avg_reaction_time) AS mean_rt, AVG(accuracy_rate) AS accuracy
+        FROM test_statistics
+        WHERE user_id IS NOT NULL AND avg_reaction_time IS NOT NULL
+        GROUP BY user_id, test_type, stimulus_type
+    ''', conn)
+    groups = {}
+    for (test_type, stimulus_type), group in frame.groupby(['test_type', 'stimulus_type']):
+        if len(group) < MIN_NORM_SIZE:
+            continue
+        groups[f"{test_type}/{stimulus_type}"] = {
+            'n': int(len(group)),
+            'rt': np.round(np.percentile(group['mean_rt'], NORM_PERCENTILES), 2).tolist(),
+            'accuracy': np.round(np.percentile(group['accuracy'].fillna(0), NORM_PERCENTILES), 2).tolist()
+        }
+    return {'created': datetime.now().isoformat(timespec='seconds'), 'groups': groups}
+
+
+def load_norms(db_path: str, norms_path: str, rebuild: bool = False) -> Tuple[Dict[str, Any], str]:
+    """读取常模表（不存在或要求重建时重新计算），返回 (常模, 摘要)"""
+    norms = None if rebuild else _read_json(norms_path, None)
+    if norms is None:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            norms = build_norms(conn)
+        finally:
+            conn.close()
+        _write_json(norms_path, norms)
+    digest = hashlib.sha1(json.dumps(norms['groups'], sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return norms, digest
+
+
+def norm_percentile(grid: List[float], value: float) -> float:
+    """成绩在常模中的百分位（grid为0~100百分位点）"""
+    return float(np.interp(value, grid, NORM_PERCENTILES))
+
+
+def summarize_user(history: List[Dict[str, Any]], norms: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """按 测试类型×刺激类型 汇总参与者成绩并查常模百分位
+
+    速度百分位 = 反应比常模中多少百分比的人快；正确率百分位 = 正确率不低于多少百分比的人。
+    """
+    cells: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for run in history:
+        cells.setdefault((run.get('test_type'), run.get('stimulus_type')), []).append(run)
+
+    rows = []
+    for (test_type, stimulus_type), runs in sorted(cells.items(), key=lambda item: tuple(map(str, item[0]))):
+        mean_rt = float(np.mean([run.get('avg_reaction_time') or 0 for run in runs]))
+        accuracy = float(np.mean([run.get('accuracy_rate') or 0 for run in runs]))
+        norm = norms['groups'].get(f"{test_type}/{stimulus_type}")
+        rows.append({
+            'test_type': test_type,
+            'stimulus_type': stimulus_type,
+            'runs': len(runs),
+            'mean_rt': mean_rt,
+            'accuracy': accuracy,
+            'speed_percentile': 100 - norm_percentile(norm['rt'], mean_rt) if norm else None,
+            'accuracy_percentile': norm_percentile(norm['accuracy'], accuracy) if norm else None,
+            'norm_size': norm['n'] if norm else 0
+        })
+    return rows
+
+
+def _percent_text(value: Optional[float]) -> str:
+    return f"{value:.0f}" if value is not None else "—"
+
+
+def _summary_table(rows: List[Dict[str, Any]]) -> Tuple[List[str], List[List[str]]]:
+    header = ["测试类型", "刺激类型", "轮次", "平均反应时", "正确率", "速度百分位", "正确率百分位"]
+    cells = [[
+        TEST_TYPE_NAMES.get(row['test_type'], str(row['test_type'])),
+        STIMULUS_TYPE_NAMES.get(row['stimulus_type'], str(row['stimulus_type'])),
+        str(row['runs']),
+        f"{row['mean_rt']:.1f} ms",
+        f"{row['accuracy']:.1f}%",
+        _percent_text(row['speed_percentile']),
+        _percent_text(row['accuracy_percentile'])
+    ] for row in rows]
+    return header, cells
+
+
+def _safe_name(user_id: str) -> str:
+    return re.sub(r'[^\w.-]', '_', user_id) or '_'
+
+
+def _init_worker():
+    """进程池初始化：离屏Agg后端与中文字体回退，忽略缺字体的逐字警告"""
+    os.environ['MPLBACKEND'] = 'Agg'
+    import logging
+    import matplotlib
+    matplotlib.use('Agg')
+    matplotlib.rcParams['font.sans-serif'] = CJK_FONTS
+    matplotlib.rcParams['axes.unicode_minus'] = False
+    logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+    warnings.filterwarnings('ignore', message='Glyph .* missing from font')
+
+
+def render_report_figure(user: Dict[str, Any], history: List[Dict[str, Any]], rows: List[Dict[str, Any]],
+                         filters: Dict[str, Optional[str]]):
+    """绘制A4单页报告（不经过pyplot）"""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=A4_INCHES)
+    grid = fig.add_gridspec(3, 1, height_ratios=[1.0, 1.4, 4.6], hspace=0.25,
+                            left=0.08, right=0.95, top=0.95, bottom=0.05)
+
+    header = fig.add_subplot(grid[0])
+    header.axis('off')
+    header.text(0, 0.85, f"反应时测试报告 — {user.get('name') or '未填写姓名'} ({user['user_id']})",
+                fontsize=16, fontweight='bold')
+    period = f"{filters.get('start') or '最早'} 至 {filters.get('end') or '最近'}"
+    header.text(0, 0.5, f"年龄 {user.get('age') or '—'}   性别 {user.get('gender') or '—'}   "
+                        f"职业 {user.get('occupation') or '—'}   统计期间 {period}   共 {len(history)} 轮",
+                fontsize=10)
+    latest = history[-1]
+    evaluation, color = evaluate_performance(latest.get('avg_reaction_time') or 0, latest.get('accuracy_rate') or 0)
+    header.text(0, 0.15, f"最近一次（{str(latest.get('test_date', ''))[:10]}）：{evaluation}",
+                fontsize=11, color=color, fontweight='bold')
+
+    table_ax = fig.add_subplot(grid[1])
+    table_ax.axis('off')
+    column_labels, cells = _summary_table(rows)
+    table = table_ax.table(cellText=cells, colLabels=column_labels, loc='upper center', cellLoc='center')
+    table.auto_set_font_size(False)
+    table.set_fontsize(9)
+    table_ax.set_title("各测试成绩与常模百分位", fontsize=11, loc='left')
+
+    draw_history_chart(fig, history[-HISTORY_RUNS:], subplot_spec=grid[2])
+    return fig
+
+
+def _render_html(user: Dict[str, Any], rows: List[Dict[str, Any]], image_src: str,
+                 filters: Dict[str, Optional[str]], history: List[Dict[str, Any]]) -> str:
+    column_labels, cells = _summary_table(rows)
+    latest = history[-1]
+    evaluation, color = evaluate_performance(latest.get('avg_reaction_time') or 0, latest.get('accuracy_rate') or 0)
+    head = ''.join(f"<th>{html.escape(label)}</th>" for label in column_labels)
+    body = ''.join('<tr>' + ''.join(f"<td>{html.escape(cell)}</td>" for cell in row) + '</tr>' for row in cells)
+    name = html.escape(user.get('name') or '未填写姓名')
+    return f"""<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>反应时测试报告 - {name}</title>
+<style>
+    body {{ font-family: sans-serif; margin: 2rem; color: #2c3e50; }}
+    table {{ border-collapse: collapse; margin: 1rem 0; }}
+    th, td {{ border: 1px solid #ccc; padding: 0.3rem 0.8rem; text-align: center; }}
+    th {{ background: #f0f2f6; }}
+    .evaluation {{ color: {color}; font-weight: bold; }}
+    img {{ max-width: 100%; }}
+</style>
+</head>
+<body>
+<h1>反应时测试报告 — {name} ({html.escape(user['user_id'])})</h1>
+<p>年龄 {html.escape(str(user.get('age') or '—'))} · 性别 {html.escape(user.get('gender') or '—')} ·
+职业 {html.escape(user.get('occupation') or '—')} ·
+统计期间 {html.escape(filters.get('start') or '最早')} 至 {html.escape(filters.get('end') or '最近')} · 共 {len(history)} 轮</p>
+<p class="evaluation">最近一次（{html.escape(str(latest.get('test_date', ''))[:10])}）：{html.escape(evaluation)}</p>
+<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>
+<p>速度百分位：反应比常模中多少百分比的人快；正确率百分位：正确率不低于多少百分比的人。</p>
+<img src="{image_src}" alt="报告图表">
+</body>
+</html>
+"""
+
+
+def render_user_report(conn: sqlite3.Connection, user_id: str, filters: Dict[str, Optional[str]],
+                       norms: Dict[str, Any], out_dir: str, formats: List[str], dpi: int) -> List[str]:
+    """生成一个参与者的报告，返回写出的文件"""
+    conn.row_factory = sqlite3.Row
+    user_row = conn.execute('SELECT user_id, name, age, gender, occupation FROM users WHERE user_id = ?',
+                            (user_id,)).fetchone()
+    user = dict(user_row) if user_row else {'user_id': user_id}
+    where, params = _filter_sql(dict(filters, occupation=None))
+    history = [dict(row) for row in conn.execute(f'''
+        SELECT * FROM test_statistics s
+        {where + ' AND' if where else 'WHERE'} s.user_id = ?
+        ORDER BY s.test_date, s.stat_id
+    ''', params + [user_id])]
+    if not history:
+        return []
+
+    rows = summarize_user(history, norms)
+    fig = render_report_figure(user, history, rows, filters)
+
+    user_dir = os.path.join(out_dir, _safe_name(user_id))
+    os.makedirs(user_dir, exist_ok=True)
+    files = []
+    if 'png' in formats:
+        path = os.path.join(user_dir, 'report.png')
+        fig.savefig(path, dpi=dpi)
+        files.append(path)
+    if 'pdf' in formats:
+        path = os.path.join(user_dir, 'report.pdf')
+        fig.savefig(path, format='pdf')
+        files.append(path)
+    if 'html' in formats:
+        if 'png' in formats:
+            image_src = 'report.png'
+        else:
+            # 没有单独的PNG时以较低分辨率内嵌
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png', dpi=100)
+            image_src = 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+        path = os.path.join(user_dir, 'report.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(_render_html(user, rows, image_src, filters, history))
+        files.append(path)
+    return files
+
+
+def process_user_chunk(db_path: str, user_ids: List[str], filters: Dict[str, Optional[str]],
+                       norms: Dict[str, Any], out_dir: str, formats: List[str],
+                       dpi: int) -> List[Tuple[str, List[str], Optional[str]]]:
+    """进程池任务：各进程自行只读打开数据库，为一批用户生成报告，返回 (用户, 文件, 错误)"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    results = []
+    try:
+        for user_id in user_ids:
+            try:
+                results.append((user_id, render_user_report(conn, user_id, filters, norms, out_dir, formats, dpi),
+                                None))
+            except Exception as e:
+                results.append((user_id, [], str(e)))
+    finally:
+        conn.close()
+    return results
+
+
+def run_report_job(db_path: str, out_dir: str, filters: Dict[str, Optional[str]],
+                   formats: Optional[List[str]] = None, workers: Optional[int] = None,
+                   chunk_size: Optional[int] = None, dpi: int = 300, force: bool = False,
+                   norms_path: Optional[str] = None, rebuild_norms: bool = False) -> Dict[str, Any]:
+    """执行批量报告任务，返回运行摘要"""
+    start = time.perf_counter()
+    formats = sorted(formats or FORMATS)
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+
+    norms, norms_digest = load_norms(db_path, norms_path or os.path.join(out_dir, NORMS_FILE), rebuild_norms)
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        user_ids = cohort_user_ids(conn, filters)
+        versions = user_data_versions(conn, user_ids)
+    finally:
+        conn.close()
+
+    # 缓存键：用户数据版本 + 常模 + 筛选条件 + 输出设置
+    settings = json.dumps([REPORT_VERSION, norms_digest, sorted(filters.items()), formats, dpi])
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    manifest = _read_json(manifest_path, {})
+    keys = {user_id: hashlib.sha1((settings + versions[user_id]).encode('utf-8')).hexdigest()[:16]
+            for user_id in user_ids}
+    pending = [user_id for user_id in user_ids
+               if force or manifest.get(user_id, {}).get('key') != keys[user_id]
+               or not all(os.path.exists(path) for path in manifest[user_id].get('files', []))]
+
+    if not chunk_size:
+        chunk_size = max(1, min(50, -(-len(pending) // (workers * 4))))
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    rendered, failed = 0, []
+
+    def collect(results):
+        nonlocal rendered
+        for user_id, files, error in results:
+            if error is not None:
+                failed.append((user_id, error))
+                manifest.pop(user_id, None)
+                continue
+            rendered += 1
+            manifest[user_id] = {'key': keys[user_id], 'files': files,
+                                 'rendered': datetime.now().isoformat(timespec='seconds')}
+        # 每块完成后保存清单，中断后再次运行可以跳过已完成的用户
+        _write_json(manifest_path, manifest)
+
+    if workers <= 1:
+        _init_worker()
+        for chunk in chunks:
+            collect(process_user_chunk(db_path, chunk, filters, norms, out_dir, formats, dpi))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = [executor.submit(process_user_chunk, db_path, chunk, filters, norms, out_dir, formats, dpi)
+                       for chunk in chunks]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    elapsed = time.perf_counter() - start
+    return {
+        'users': len(user_ids),
+        'rendered': rendered,
+        'skipped': len(user_ids) - len(pending),
+        'failed': failed,
+        'workers': workers,
+        'elapsed_seconds': elapsed,
+        'seconds_per_report': elapsed / rendered if rendered else 0.0
+    }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="批量生成参与者报告")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="按群体条件生成报告")
+    run_parser.add_argument('--db', default='reaction_test.db', help="数据库路径")
+    run_parser.add_argument('--out', default='reports', help="报告输出目录")
+    run_parser.add_argument('--start', help="开始日期 YYYY-MM-DD")
+    run_parser.add_argument('--end', help="结束日期 YYYY-MM-DD（含）")
+    run_parser.add_argument('--occupation', help="职业")
+    run_parser.add_argument('--test-type', choices=sorted(TEST_TYPE_NAMES), help="测试类型")
+    run_parser.add_argument('--formats', default=','.join(FORMATS), help="输出格式，逗号分隔（html,pdf,png）")
+    run_parser.add_argument('--dpi', type=int, default=300, help="PNG分辨率")
+    run_parser.add_argument('--workers', type=int, default=None, help="进程数（默认CPU核数）")
+    run_parser.add_argument('--chunk-size', type=int, default=None, help="每个任务包含的用户数（默认自动）")
+    run_parser.add_argument('--force', action='store_true', help="忽略缓存全部重新生成")
+    run_parser.add_argument('--norms', help="常模文件（默认输出目录下的 norms.json）")
+    run_parser.add_argument('--rebuild-norms', action='store_true', help="重新计算常模")
+
+    norms_parser = subparsers.add_parser('norms', help="重新计算常模表")
+    norms_parser.add_argument('--db', default='reaction_test.db', help="数据库路径")
+    norms_parser.add_argument('--out', default='reports', help="报告输出目录")
+    norms_parser.add_argument('--norms', help="常模文件（默认输出目录下的 norms.json）")
+
+    args = parser.parse_args()
+
+    if args.command == 'norms':
+        os.makedirs(args.out, exist_ok=True)
+        norms, digest = load_norms(args.db, args.norms or os.path.join(args.out, NORMS_FILE), rebuild=True)
+        for key, group in sorted(norms['groups'].items()):
+            print(f"{key:20s} {group['n']:6d} 人  反应时中位数 {group['rt'][50]:.1f} ms")
+        print(f"常模摘要 {digest}")
+        return
+
+    formats = [fmt.strip() for fmt in args.formats.split(',') if fmt.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"不支持的输出格式: {', '.join(sorted(unknown))}")
+
+    filters = {'start': args.start, 'end': args.end, 'occupation': args.occupation, 'test_type': args.test_type}
+    summary = run_report_job(args.db, args.out, filters, formats=formats, workers=args.workers,
+                             chunk_size=args.chunk_size, dpi=args.dpi, force=args.force,
+                             norms_path=args.norms, rebuild_norms=args.rebuild_norms)
+    for user_id, error in summary['failed']:
+        print(f"生成报告失败 {user_id}: {error}")
+    print(f"完成: {summary['users']} 个参与者, 生成 {summary['rendered']} 份, 跳过未变化 {summary['skipped']} 份, "
+          f"失败 {len(summary['failed'])} 份, {summary['workers']} 个进程, 耗时 {summary['elapsed_seconds']:.1f} 秒")
+    if summary['rendered']:
+        print(f"平均每份 {summary['seconds_per_report']:.2f} 秒，按此速度5000份约需 "
+              f"{summary['seconds_per_report'] * 5000 / 3600:.1f} 小时")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库维护与按月分区
+试次记录按测试时间（UTC）分为热数据与冷数据：主库只保留最近 hot_months 个月，
+更早的月份整月移入分区文件，主库大小与查询耗时不随年份增长：
+
+    reaction_test.db                  用户、统计结果、最近几个月的试次
+    reaction_test_partitions/
+        trials_2026-07.db             一个月的试次（test_records 表，列与旧结构相同，record_id 不变）
+        trials_2026-06.db
+
+- 移入：把分区文件 ATTACH 到主库，同一事务内复制并删除该月行；重复执行是幂等的
+- 保留期与清除：删除整个分区文件，耗时与数据量无关，不需要大批量 DELETE
+- 定期任务（maintenance_log 记录上次运行时间）：移入分区、保留期清理、增量整理、ANALYZE、PRAGMA optimize
+  （只做 PRAGMA incremental_vacuum；旧库转换为增量整理模式需要完整VACUUM，由 reaction_cli.py vacuum 执行）
+
+SQLite 单连接最多附加10个数据库，读取时逐个打开分区文件：DatabaseManager 的试次查询与
+bootstrap_stats / model_fitting / session_archive 会合并主库与各分区的结果。
+统计结果（每轮一行）数据量小，始终保留在主库中。
+
+用法: python db_maintenance.py --db reaction_test.db run
+      python db_maintenance.py --db reaction_test.db run --force --retention-months 36
+      python db_maintenance.py --db reaction_test.db status
+"""
+
+import argparse
+import heapq
+import os
+import re
+import sqlite3
+import time
+from calendar import timegm
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from participant_directory import ParticipantDirectory, TRIGGER_NAMES
+from schema_migration import is_normalized
+
+PARTITION_SUFFIX = '_partitions'
+PARTITION_PATTERN = re.compile(r'^trials_(\d{4}-\d{2})\.db$')
+
+# 主库保留的月数（含当月）
+DEFAULT_HOT_MONTHS = 3
+
+# 分区表与旧结构的 test_records 相同（不使用 AUTOINCREMENT，保留原 record_id）
+PARTITION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS test_records (
+        record_id INTEGER PRIMARY KEY,
+        user_id TEXT,
+        test_type TEXT,
+        stimulus_type TEXT,
+        trial_index INTEGER,
+        stimulus_content TEXT,
+        reaction_time REAL,
+        is_correct INTEGER,
+        qc_label TEXT,
+        latency_correction REAL,
+        test_time TIMESTAMP
+    )
+'''
+
+# 按用户键集分页，以及按单元读取（统计任务）
+PARTITION_INDEX_SQL = [
+    'CREATE INDEX IF NOT EXISTS idx_records_user ON test_records (user_id, record_id)',
+    'CREATE INDEX IF NOT EXISTS idx_records_cell ON test_records (user_id, test_type, stimulus_type, record_id)'
+]
+
+RECORD_COLUMNS = ('record_id', 'user_id', 'test_type', 'stimulus_type', 'trial_index', 'stimulus_content',
+                  'reaction_time', 'is_correct', 'qc_label', 'latency_correction', 'test_time')
+
+MAINTENANCE_LOG_SQL = '''
+    CREATE TABLE IF NOT EXISTS maintenance_log (
+        task TEXT PRIMARY KEY,
+        last_run INTEGER,
+        result TEXT
+    )
+'''
+
+DAY_SECONDS = 86400
+
+# 定期任务（按执行顺序）及运行间隔
+TASK_INTERVALS = {
+    'roll': DAY_SECONDS,
+    'retention': DAY_SECONDS,
+    'incremental_vacuum': DAY_SECONDS,
+    'analyze': 7 * DAY_SECONDS,
+    'optimize': DAY_SECONDS
+}
+
+# 由试次/统计派生的结果表，清除数据时一并清空
+DERIVED_TABLES = ('test_statistics_ci', 'model_parameters')
+
+
+# ---------------------------------------------------------------- 月份与分区文件
+
+def month_of(epoch: float) -> str:
+    return time.strftime('%Y-%m', time.gmtime(epoch))
+
+
+def add_months(month: str, delta: int) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    index = year * 12 + mon - 1 + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def month_bounds(month: str) -> Tuple[str, str, int, int]:
+    """月份 -> (起始文本, 次月起始文本, 起始epoch秒, 次月起始epoch秒)"""
+    following = add_months(month, 1)
+    start, end = f"{month}-01", f"{following}-01"
+    return (start, end, timegm(time.strptime(start, '%Y-%m-%d')), timegm(time.strptime(end, '%Y-%m-%d')))
+
+
+def partition_dir(db_path: str) -> str:
+    return os.path.splitext(db_path)[0] + PARTITION_SUFFIX
+
+
+def partition_path(db_path: str, month: str) -> str:
+    return os.path.join(partition_dir(db_path), f"trials_{month}.db")
+
+
+def list_partitions(db_path: str) -> List[Tuple[str, str]]:
+    """已有分区 [(月份, 文件路径)]，按月份升序"""
+    directory = partition_dir(db_path)
+    if not os.path.isdir(directory):
+        return []
+    partitions = []
+    for name in os.listdir(directory):
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            partitions.append((match.group(1), os.path.join(directory, name)))
+    return sorted(partitions)
+
+
+def open_partitions(db_path: str) -> List[sqlite3.Connection]:
+    """以只读方式打开全部分区（按月份升序），调用方负责关闭"""
+    return [sqlite3.connect(f"file:{path}?mode=ro", uri=True) for _, path in list_partitions(db_path)]
+
+
+def merge_ordered(cursors: Sequence[Iterable[Tuple]], key_columns: int) -> Iterator[Tuple]:
+    """合并多个已按前 key_columns 列排序的结果（空值排在最前，与SQLite一致）"""
+    if len(cursors) == 1:
+        return iter(cursors[0])
+
+    def key(row):
+        return tuple((value is not None, value) for value in row[:key_columns])
+
+    return heapq.merge(*cursors, key=key)
+
+
+def _create_partition(path: str):
+    """新建分区文件（启用增量整理，建表与索引）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute(PARTITION_TABLE_SQL)
+        for sql in PARTITION_INDEX_SQL:
+            conn.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _remove_database_file(path: str):
+    """删除数据库文件及其日志文件"""
+    for suffix in ('', '-journal', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+class DatabaseMaintenance:
+    """主库与月分区的维护"""
+
+    def __init__(self, db_path: str = "reaction_test.db", hot_months: int = DEFAULT_HOT_MONTHS,
+                 retention_months: Optional[int] = None):
+        if hot_months < 1:
+            raise ValueError("主库至少保留当月数据")
+        if retention_months is not None and retention_months < hot_months:
+            raise ValueError("保留期不能短于主库保留的月数")
+        self.db_path = db_path
+        self.hot_months = hot_months
+        self.retention_months = retention_months
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute(MAINTENANCE_LOG_SQL)
+        conn.commit()
+        return conn
+
+    # ------------------------------------------------------------ 分区
+
+    def _months_to_roll(self, conn: sqlite3.Connection, cutoff: str) -> List[str]:
+        """主库中早于 cutoff 月份、需要移入分区的月份"""
+        _, _, cutoff_epoch, _ = month_bounds(cutoff)
+        if is_normalized(conn):
+            rows = conn.execute('''
+                SELECT DISTINCT strftime('%Y-%m', test_time, 'unixepoch') FROM trials
+                WHERE test_time < ?
+            ''', (cutoff_epoch,))
+        else:
+            rows = conn.execute('''
+                SELECT DISTINCT substr(test_time, 1, 7) FROM test_records
+                WHERE test_time < ?
+            ''', (f"{cutoff}-01",))
+        return sorted(row[0] for row in rows if row[0])
+
+    def _ensure_time_index(self, conn: sqlite3.Connection):
+        """按测试时间选出待移入的行"""
+        if is_normalized(conn):
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_trials_time ON trials (test_time)')
+        else:
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_records_time ON test_records (test_time)')
+        conn.commit()
+
+    def _roll_month(self, conn: sqlite3.Connection, month: str) -> int:
+        """把一个月的试次移入分区，返回移动的行数"""
+        path = partition_path(self.db_path, month)
+        if not os.path.exists(path):
+            _create_partition(path)
+
+        start_text, end_text, start_epoch, end_epoch = month_bounds(month)
+        columns = ', '.join(RECORD_COLUMNS)
+        conn.execute("ATTACH DATABASE ? AS part", (path,))
+        try:
+            with conn:
+                # 分区中已有的行（上次中断时已复制）忽略，重复执行结果相同
+                if is_normalized(conn):
+                    moved = conn.execute(f'''
+                        INSERT OR IGNORE INTO part.test_records ({columns})
+                        SELECT {columns} FROM main.test_records
+                        WHERE record_id IN (SELECT record_id FROM main.trials
+                                            WHERE test_time >= ? AND test_time < ?)
+                    ''', (start_epoch, end_epoch)).rowcount
+                    conn.execute('DELETE FROM main.trials WHERE test_time >= ? AND test_time < ?',
+                                 (start_epoch, end_epoch))
+                else:
+                    moved = conn.execute(f'''
+                        INSERT OR IGNORE INTO part.test_records ({columns})
+                        SELECT {columns} FROM main.test_records
+                        WHERE test_time >= ? AND test_time < ?
+                    ''', (start_text, end_text)).rowcount
+                    conn.execute('DELETE FROM main.test_records WHERE test_time >= ? AND test_time < ?',
+                                 (start_text, end_text))
+            # 分区写入后不再变化，移入时统计一次即可
+            conn.execute('ANALYZE part')
+        finally:
+            conn.execute('DETACH DATABASE part')
+        return moved
+
+    def roll_partitions(self, now: Optional[float] = None) -> Dict[str, int]:
+        """把主库中早于热数据窗口的月份移入分区，返回 {月份: 行数}"""
+        cutoff = add_months(month_of(now or time.time()), -(self.hot_months - 1))
+        conn = self._connect()
+        try:
+            self._ensure_time_index(conn)
+            return {month: self._roll_month(conn, month) for month in self._months_to_roll(conn, cutoff)}
+        finally:
+            conn.close()
+
+    def drop_partition(self, month: str) -> bool:
+        """删除一个月的分区文件"""
+        path = partition_path(self.db_path, month)
+        if not os.path.exists(path):
+            return False
+        _remove_database_file(path)
+        return True
+
+    def apply_retention(self, now: Optional[float] = None) -> List[str]:
+        """删除超出保留期的分区，返回删除的月份（未设置保留期时不删除）"""
+        if self.retention_months is None:
+            return []
+        cutoff = add_months(month_of(now or time.time()), -(self.retention_months - 1))
+        dropped = []
+        for month, _ in list_partitions(self.db_path):
+            if month >= cutoff:
+                break
+            try:
+                if self.drop_partition(month):
+                    dropped.append(month)
+            except OSError as e:
+                # 文件仍被其他进程打开（Windows）时下次再删
+                print(f"删除分区失败 {month}: {e}")
+        return dropped
+
+    # ------------------------------------------------------------ 清除
+
+    def clear_data(self) -> Dict[str, Any]:
+        """清除全部测试数据（用户、试次、统计与派生结果），保留工作站延迟档案
+
+        主库清空提交后才删除分区文件：主库事务失败时分区保持原样，数据不会只丢一半。
+        """
+        conn = self._connect()
+        try:
+            normalized = is_normalized(conn)
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            tables = ['trials', 'run_statistics', 'participants'] if normalized \
+                else ['test_records', 'test_statistics', 'users']
+            tables += ['participant_terms', *DERIVED_TABLES]
+            cleared = {}
+            try:
+                # 去掉触发器与清空各表在同一事务中（DDL不会隐式开始事务，需显式 BEGIN），中途失败全部回滚
+                conn.execute('BEGIN')
+                with conn:
+                    # 去掉目录索引的逐行同步触发器，整表删除走SQLite的清空优化
+                    for name in TRIGGER_NAMES:
+                        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                    for table in tables:
+                        if table in existing:
+                            cleared[table] = conn.execute(f'DELETE FROM {table}').rowcount
+            finally:
+                # 无论成功与否都恢复同步触发器，并按参与者表重建目录索引
+                ParticipantDirectory(self.db_path).ensure_index(conn)
+        finally:
+            conn.close()
+
+        dropped = []
+        for month, _ in list_partitions(self.db_path):
+            if self.drop_partition(month):
+                dropped.append(month)
+
+        return {'partitions': dropped, 'tables': cleared, 'freed_pages': self.incremental_vacuum()}
+
+    # ------------------------------------------------------------ 整理与统计信息
+
+    def incremental_vacuum(self, pages: Optional[int] = None) -> int:
+        """归还空闲页（默认全部），返回归还的页数"""
+        conn = self._connect()
+        try:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                return 0
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            # execute() 只单步执行一次（每步归还一页），executescript() 执行到结束
+            argument = '' if pages is None else f'({int(pages)})'
+            conn.executescript(f'PRAGMA incremental_vacuum{argument};')
+            return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        finally:
+            conn.close()
+
+    def analyze(self):
+        conn = self._connect()
+        try:
+            conn.execute('ANALYZE')
+        finally:
+            conn.close()
+
+    def optimize(self):
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA optimize')
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------ 定期任务
+
+    def _run_task(self, task: str, now: float) -> Any:
+        if task == 'roll':
+            return self.roll_partitions(now)
+        if task == 'retention':
+            return self.apply_retention(now)
+        if task == 'incremental_vacuum':
+            # 未转换为增量整理模式的库不做任何事（不在定期任务中做完整VACUUM）
+            return {'freed_pages': self.incremental_vacuum()}
+        if task == 'analyze':
+            return self.analyze()
+        return self.optimize()
+
+    def last_runs(self) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            return {task: last_run for task, last_run in conn.execute('SELECT task, last_run FROM maintenance_log')}
+        finally:
+            conn.close()
+
+    def run_due(self, now: Optional[float] = None, tasks: Optional[Iterable[str]] = None,
+                force: bool = False) -> Dict[str, Any]:
+        """运行到期的定期任务（force 为True时忽略间隔），返回 {任务: 结果}"""
+        now = now or time.time()
+        last_runs = self.last_runs()
+        results = {}
+        for task, interval in TASK_INTERVALS.items():
+            if tasks is not None and task not in tasks:
+                continue
+            if not force and now - last_runs.get(task, 0) < interval:
+                continue
+            results[task] = self._run_task(task, now)
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute('INSERT OR REPLACE INTO maintenance_log (task, last_run, result) VALUES (?, ?, ?)',
+                                 (task, int(now), repr(results[task])))
+            finally:
+                conn.close()
+        return results
+
+    def status(self) -> Dict[str, Any]:
+        """主库与各分区的大小、空闲页与任务上次运行时间"""
+        conn = self._connect()
+        try:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            main = {
+                'bytes': conn.execute('PRAGMA page_count').fetchone()[0] * page_size,
+                'free_bytes': conn.execute('PRAGMA freelist_count').fetchone()[0] * page_size,
+                'auto_vacuum': conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+            }
+        finally:
+            conn.close()
+        return {
+            'main': main,
+            'partitions': [(month, os.path.getsize(path)) for month, path in list_partitions(self.db_path)],
+            'last_runs': self.last_runs()
+        }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="数据库维护与按月分区")
+    parser.add_argument('--db', default='reaction_test.db', help="数据库路径")
+    parser.add_argument('--hot-months', type=int, default=DEFAULT_HOT_MONTHS, help="主库保留的月数（含当月）")
+    parser.add_argument('--retention-months', type=int, default=None, help="试次保留的月数（默认永久保留）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="运行到期的维护任务")
+    run_parser.add_argument('--task', action='append', dest='tasks', choices=list(TASK_INTERVALS),
+                            help="只运行指定任务（可重复）")
+    run_parser.add_argument('--force', action='store_true', help="忽略运行间隔")
+
+    subparsers.add_parser('status', help="显示主库与分区状态")
+
+    drop_parser = subparsers.add_parser('drop', help="删除一个月的分区")
+    drop_parser.add_argument('month', help="月份 YYYY-MM")
+
+    args = parser.parse_args()
+    if not os.path.isfile(args.db):
+        print(f"数据库不存在: {args.db}")
+        return
+
+    maintenance = DatabaseMaintenance(args.db, args.hot_months, args.retention_months)
+    if args.command == 'run':
+        for task, result in maintenance.run_due(tasks=args.tasks, force=args.force).items():
+            print(f"{task:<20} {result if result is not None else '完成'}")
+    elif args.command == 'drop':
+        print("已删除" if maintenance.drop_partition(args.month) else "分区不存在")
+    else:
+        status = maintenance.status()
+        main_status = status['main']
+        print(f"主库 {main_status['bytes'] / 1e6:.1f} MB（空闲 {main_status['free_bytes'] / 1e6:.1f} MB，"
+              f"auto_vacuum={main_status['auto_vacuum']}）")
+        for month, size in status['partitions']:
+            print(f"  {month}  {size / 1e6:.1f} MB")
+        for task, last_run in sorted(status['last_runs'].items()):
+            print(f"{task:<20} {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_run))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+与界面无关的测试引擎核心
+桌面端 TestEngine 与Web端 WebTestEngine 共用的试次状态机：
+空闲 -> 试次间隔 -> 前置期（随机等待）-> 刺激（反应窗口）-> 试次间隔 ... -> 完成。
+
+时钟、调度器、刺激物来源、数据存储与事件接收器均可替换：
+- 时钟: 返回秒的可调用对象（默认 time.time，无界面运行时用 VirtualClock）
+- 调度器: call_later(delay_ms, callback) / cancel(handle)
+  （桌面端为QTimer，Web端在每次重新运行脚本时轮询，无界面运行时为虚拟时间事件队列）
+- 刺激物来源: generate_stimulus(test_type, stimulus_type) / expected_response(test_type, stimulus)
+- 数据存储: save_test_record(record) / save_test_statistics(stat_data)，可为None
+- 事件接收器: EngineSink 子类
+
+用法: python engine_core.py --runs 2000 --trials 10   （虚拟时钟下的无界面模拟与吞吐量）
+"""
+
+import argparse
+import heapq
+import random
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from quality_control import TrialQualityFilter
+from trial_records import TrialRecord, RunBuffer
+from realtime_mode import RealtimeRunGuard, TrialTimingProbe
+
+# 时间参数（ms）
+START_DELAY_MS = 1000
+INTER_TRIAL_MS = 1000
+FOREPERIOD_RANGE_MS = (1000, 3000)
+TIMEOUT_MS = 3000
+
+# 试次状态
+PHASE_IDLE = 'idle'
+PHASE_INTER_TRIAL = 'inter_trial'
+PHASE_FOREPERIOD = 'foreperiod'
+PHASE_STIMULUS = 'stimulus'
+
+
+class VirtualClock:
+    """虚拟时钟（秒），替代 time.time，由调度器或调用方显式推进"""
+
+    def __init__(self, start: float = 1.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance_ms(self, ms: float):
+        self.now += ms / 1000
+
+
+class PollingScheduler:
+    """轮询调度器
+
+    到期的回调只在 poll() 时执行，适用于没有事件循环、每次交互重新运行脚本的Web端。
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._queue = []
+        self._sequence = 0
+
+    def call_later(self, delay_ms: float, callback: Callable[[], Any]) -> list:
+        """delay_ms 后执行回调，返回可用于取消的句柄"""
+        self._sequence += 1
+        entry = [self.clock() * 1000 + delay_ms, self._sequence, callback]
+        heapq.heappush(self._queue, entry)
+        return entry
+
+    def cancel(self, handle: list):
+        """取消尚未执行的回调（惰性删除）"""
+        handle[2] = None
+
+    def next_due(self) -> Optional[float]:
+        """最早待执行回调的到期时刻（epoch毫秒），没有时为None"""
+        while self._queue and self._queue[0][2] is None:
+            heapq.heappop(self._queue)
+        return self._queue[0][0] if self._queue else None
+
+    def poll(self) -> int:
+        """执行所有已到期的回调，返回执行个数"""
+        fired = 0
+        now_ms = self.clock() * 1000
+        while True:
+            due = self.next_due()
+            if due is None or due > now_ms:
+                return fired
+            _, _, callback = heapq.heappop(self._queue)
+            callback()
+            fired += 1
+
+
+class VirtualScheduler(PollingScheduler):
+    """虚拟时间调度器：直接把虚拟时钟推进到下一个回调的到期时刻"""
+
+    def __init__(self, clock: Optional[VirtualClock] = None):
+        super().__init__(clock or VirtualClock())
+
+    def run_next(self) -> bool:
+        """执行下一个回调，没有待执行回调时返回False"""
+        due = self.next_due()
+        if due is None:
+            return False
+        if due > self.clock.now * 1000:
+            self.clock.now = due / 1000
+        _, _, callback = heapq.heappop(self._queue)
+        callback()
+        return True
+
+    def run(self, until: Optional[Callable[[], bool]] = None):
+        """连续执行回调，直到队列为空或 until() 为真"""
+        while not (until is not None and until()) and self.run_next():
+            pass
+
+
+class EngineSink:
+    """引擎事件接收器（默认全部为空操作，前端按需覆盖）"""
+
+    def test_started(self, message: str):
+        pass
+
+    def stimulus_shown(self, stimulus: Any):
+        pass
+
+    def response_recorded(self, record: TrialRecord):
+        pass
+
+    def trial_timeout(self, record: TrialRecord):
+        pass
+
+    def test_completed(self, statistics: Dict[str, Any]):
+        pass
+
+    def test_stopped(self):
+        pass
+
+
+class CompositeSink(EngineSink):
+    """把事件依次转发给多个接收器（界面 + 监控推送等）"""
+
+    def __init__(self, *sinks: EngineSink):
+        self.sinks = list(sinks)
+
+    def test_started(self, message: str):
+        for sink in self.sinks:
+            sink.test_started(message)
+
+    def stimulus_shown(self, stimulus: Any):
+        for sink in self.sinks:
+            sink.stimulus_shown(stimulus)
+
+    def response_recorded(self, record: TrialRecord):
+        for sink in self.sinks:
+            sink.response_recorded(record)
+
+    def trial_timeout(self, record: TrialRecord):
+        for sink in self.sinks:
+            sink.trial_timeout(record)
+
+    def test_completed(self, statistics: Dict[str, Any]):
+        for sink in self.sinks:
+            sink.test_completed(statistics)
+
+    def test_stopped(self):
+        for sink in self.sinks:
+            sink.test_stopped()
+
+
+class DataStimulusSource:
+    """纯数据刺激物来源（无界面模拟用，不生成任何绘制信息）"""
+
+    colors = ['red', 'green', 'blue', 'yellow']
+    shapes = ['circle', 'triangle', 'square', 'diamond']
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
+
+    def generate_stimulus(self, test_type: str, stimulus_type: str) -> Dict[str, Any]:
+        if test_type == 'choice':
+            index = self.rng.randint(1, 4)
+            return {'type': 'choice', 'name': self.colors[index - 1], 'index': index}
+        if test_type == 'disjunctive':
+            target_type = self.rng.choice(['color', 'shape'])
+            pool = self.colors if target_type == 'color' else self.shapes
+            return {'type': 'disjunctive', 'target_type': target_type, 'value': self.rng.choice(pool),
+                    'distractors': self.rng.randint(3, 6)}
+        return {'type': stimulus_type, 'name': self.rng.choice(self.colors)}
+
+    def expected_response(self, test_type: str, stimulus: Dict[str, Any]) -> Any:
+        return stimulus.get('index') if test_type == 'choice' else None
+
+
+class TestEngineCore:
+    """试次状态机（单线程；所有方法都应在同一线程中调用）"""
+
+    def __init__(self, stimulus_source, scheduler, clock: Callable[[], float] = time.time,
+                 store=None, sink: Optional[EngineSink] = None, rng=random):
+        self.stimulus_source = stimulus_source
+        self.scheduler = scheduler
+        self.clock = clock
+        self.store = store
+        self.sink = sink or EngineSink()
+        self.rng = rng
+
+        # 测试状态变量
+        self.current_test_type = None
+        self.current_stimulus_type = None
+        self.run_buffer = RunBuffer(10)
+        self.current_trial = 0
+        self.total_trials = 10
+        self.stimulus_start_time = 0
+        self.is_test_running = False
+        self.current_stimulus = None
+        self.user_data = {}
+        self.phase = PHASE_IDLE
+        self._timer = None
+
+        # 试次质量控制
+        self.quality_filter = TrialQualityFilter(timeout_ms=TIMEOUT_MS)
+
+        # 实时模式与计时探针
+        self.realtime_mode = False
+        self.latency_correction_ms = 0.0
+        self.realtime_guard = RealtimeRunGuard()
+        self.timing_probe = TrialTimingProbe()
+
+    def add_sink(self, sink: EngineSink):
+        """追加事件接收器"""
+        if isinstance(self.sink, CompositeSink):
+            self.sink.sinks.append(sink)
+        else:
+            self.sink = CompositeSink(self.sink, sink)
+
+    def setup_test(self, test_type: str, stimulus_type: str, user_data: Dict[str, Any],
+                   trials: int = 10, requeue_invalid: bool = False, realtime: bool = False,
+                   latency_correction: float = 0.0):
+        """设置测试参数
+
+        latency_correction 为工作站延迟校准值（ms），记录反应时前扣除
+        """
+        self.current_test_type = test_type
+        self.current_stimulus_type = stimulus_type
+        self.user_data = user_data
+        self.total_trials = trials
+        self.quality_filter.requeue_invalid = requeue_invalid
+        self.realtime_mode = realtime
+        self.latency_correction_ms = latency_correction
+
+        # 重置状态（按试次数预分配缓冲）
+        self.run_buffer.reset(trials)
+        self.current_trial = 0
+        self.is_test_running = False
+
+    def start_test(self) -> bool:
+        """开始测试"""
+        if not self.current_test_type or not self.user_data:
+            return False
+
+        # 上一轮未完成时先退出实时模式，避免重复进入
+        self.leave_realtime_mode()
+
+        self.run_buffer.reset(self.total_trials)
+        self.current_trial = 0
+        self.stimulus_start_time = 0
+        self.current_stimulus = None
+        self.is_test_running = True
+        self.quality_filter.reset()
+
+        # 实时模式：冻结GC、提高优先级并绑定CPU；GC回调是进程级的，只在实时模式下注册
+        self.timing_probe.reset()
+        if self.realtime_mode:
+            self.timing_probe.attach()
+            self.realtime_guard.enter()
+
+        self.sink.test_started(f"{self.current_test_type}测试开始")
+
+        # 开始第一个试次
+        self.phase = PHASE_INTER_TRIAL
+        self._schedule(START_DELAY_MS, self.prepare_trial)
+        return True
+
+    def _schedule(self, delay_ms: float, callback: Callable[[], Any]):
+        """同一时刻只有一个待执行的状态转换（下一步或超时）"""
+        if self._timer is not None:
+            self.scheduler.cancel(self._timer)
+        self._timer = self.scheduler.call_later(delay_ms, callback)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self.scheduler.cancel(self._timer)
+            self._timer = None
+
+    def prepare_trial(self):
+        """准备试次（随机前置期）"""
+        if not self.is_test_running or self.current_trial >= self.total_trials:
+            return
+
+        wait_time = int(self.rng.uniform(FOREPERIOD_RANGE_MS[0], FOREPERIOD_RANGE_MS[1]))
+        self.phase = PHASE_FOREPERIOD
+        self.timing_probe.stimulus_scheduled(wait_time)
+        self._schedule(wait_time, self.show_stimulus)
+
+    def skip_wait(self):
+        """跳过试次间隔与前置期，立即显示刺激（Web端手动触发）"""
+        if self.is_test_running and self.phase in (PHASE_INTER_TRIAL, PHASE_FOREPERIOD):
+            self.show_stimulus()
+
+    def show_stimulus(self):
+        """显示刺激物并开始反应窗口"""
+        if not self.is_test_running:
+            return
+
+        self.current_stimulus = self.stimulus_source.generate_stimulus(
+            self.current_test_type, self.current_stimulus_type)
+
+        # 记录刺激显示时间
+        self.stimulus_start_time = self.clock() * 1000
+        self.phase = PHASE_STIMULUS
+        self.timing_probe.stimulus_shown()
+
+        self._schedule(TIMEOUT_MS, self.handle_timeout)
+        self.sink.stimulus_shown(self.current_stimulus)
+
+    def record_response(self, response: Any = None, response_time: Optional[float] = None) -> bool:
+        """记录用户反应
+
+        response 与刺激物来源的 expected_response 比较（只有选择反应时判断对错）；
+        response_time 为反应发生时刻（epoch毫秒，如evdev内核时间戳），缺省取当前时间。
+        反应晚于超时期限（例如Web端在超时后才重新运行脚本）时按超时记录。
+        """
+        if not self.is_test_running or self.phase != PHASE_STIMULUS:
+            return False
+
+        if response_time is None:
+            response_time = self.clock() * 1000
+        elapsed = response_time - self.stimulus_start_time
+        if elapsed >= TIMEOUT_MS:
+            self.handle_timeout()
+            return False
+
+        self._cancel_timer()
+        # 扣除工作站显示/输入延迟
+        reaction_time = elapsed - self.latency_correction_ms
+        self.timing_probe.window_closed()
+
+        expected = self.stimulus_source.expected_response(self.current_test_type, self.current_stimulus)
+        is_correct = self.current_test_type != 'choice' or response == expected
+
+        qc_label = self.quality_filter.classify(reaction_time)
+        record = self._record_trial(reaction_time, is_correct, qc_label, expected, self.latency_correction_ms)
+        self.sink.response_recorded(record)
+
+        self.advance_trial(qc_label)
+        return True
+
+    def handle_timeout(self):
+        """处理反应超时（按超时时长、错误记录；未扣除延迟）"""
+        if not self.is_test_running or self.phase != PHASE_STIMULUS:
+            return
+
+        self._cancel_timer()
+        self.timing_probe.window_closed()
+
+        qc_label = self.quality_filter.classify(None)
+        record = self._record_trial(TIMEOUT_MS, False, qc_label)
+        self.sink.trial_timeout(record)
+
+        self.advance_trial(qc_label)
+
+    def _record_trial(self, reaction_time: float, is_correct: bool, qc_label: str,
+                      correct_key: Any = None, latency_correction: float = 0.0) -> TrialRecord:
+        """写入本轮缓冲并保存"""
+        record = TrialRecord(
+            self.user_data.get('user_id', ''),
+            self.current_test_type,
+            self.current_stimulus_type,
+            self.current_trial,
+            self.current_stimulus,
+            reaction_time,
+            is_correct,
+            qc_label,
+            correct_key,
+            latency_correction
+        )
+        self.run_buffer.append_record(record)
+        if self.store is not None:
+            self.store.save_test_record(record)
+        return record
+
+    def advance_trial(self, qc_label: str):
+        """进入下一个试次或结束测试（无效试次可按设置重测）"""
+        self.stimulus_start_time = 0
+        if not self.quality_filter.should_requeue(qc_label):
+            self.current_trial += 1
+
+        if self.current_trial < self.total_trials:
+            self.phase = PHASE_INTER_TRIAL
+            self._schedule(INTER_TRIAL_MS, self.prepare_trial)
+            # 实时模式下在试次间隔中回收垃圾
+            self.realtime_guard.collect_gap()
+        else:
+            self.complete_test()
+
+    def complete_test(self):
+        """完成测试"""
+        self.is_test_running = False
+        self.stimulus_start_time = 0
+        self.phase = PHASE_IDLE
+        self._cancel_timer()
+        self.leave_realtime_mode()
+
+        statistics = self.calculate_statistics()
+
+        if statistics and self.store is not None:
+            stat_data = {
+                'user_id': self.user_data.get('user_id', ''),
+                'test_type': self.current_test_type,
+                'stimulus_type': self.current_stimulus_type,
+                'avg_reaction_time': statistics['average'],
+                'std_reaction_time': statistics['std'],
+                'min_reaction_time': statistics['min'],
+                'max_reaction_time': statistics['max'],
+                'accuracy_rate': statistics['accuracy'],
+                'total_trials': self.total_trials,
+                'test_date': datetime.now().strftime('%Y-%m-%d')
+            }
+            self.store.save_test_statistics(stat_data)
+
+        self.sink.test_completed(statistics or {})
+
+    def calculate_statistics(self) -> Optional[Dict[str, Any]]:
+        """计算统计结果"""
+        buffer = self.run_buffer
+        if not len(buffer):
+            return None
+
+        # 只计算正确且通过质量控制的反应时（排除预期反应、慢速离群和超时）
+        valid_times = buffer.reaction_times[buffer.valid_mask()]
+
+        if valid_times.size:
+            avg_rt = float(valid_times.mean())
+            std_rt = float(valid_times.std())
+            min_rt = float(valid_times.min())
+            max_rt = float(valid_times.max())
+        else:
+            avg_rt = std_rt = min_rt = max_rt = 0
+
+        # 计算正确率（超时计为错误）
+        accuracy = float(np.count_nonzero(buffer.correct)) / len(buffer) * 100
+
+        return {
+            'average': avg_rt,
+            'std': std_rt,
+            'min': min_rt,
+            'max': max_rt,
+            'accuracy': accuracy,
+            'total_trials': self.total_trials,
+            'recorded_trials': len(buffer),
+            'valid_trials': int(valid_times.size),
+            'qc_counts': self.quality_filter.summary(),
+            'realtime_mode': self.realtime_mode,
+            'timing': self.timing_probe.summary(),
+            'latency_correction_ms': self.latency_correction_ms
+        }
+
+    def leave_realtime_mode(self):
+        """恢复GC、优先级与CPU绑定，移除计时探针"""
+        try:
+            self.realtime_guard.exit()
+        finally:
+            self.timing_probe.detach()
+
+    def stop_test(self):
+        """停止测试"""
+        was_running = self.is_test_running
+        self.is_test_running = False
+        self.stimulus_start_time = 0
+        self.phase = PHASE_IDLE
+        self._cancel_timer()
+        self.leave_realtime_mode()
+        if was_running:
+            self.sink.test_stopped()
+
+
+class SimulatedParticipant(EngineSink):
+    """模拟被试：刺激出现后按对数正态分布的反应时作答（无界面运行用）"""
+
+    def __init__(self, engine: TestEngineCore, rng: random.Random, median_rt: float = 350.0,
+                 sigma: float = 0.25, error_rate: float = 0.05, lapse_rate: float = 0.02,
+                 anticipation_rate: float = 0.02):
+        self.engine = engine
+        self.rng = rng
+        self.median_rt = median_rt
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.lapse_rate = lapse_rate
+        self.anticipation_rate = anticipation_rate
+        self.completed: List[Dict[str, Any]] = []
+
+    def stimulus_shown(self, stimulus: Any):
+        engine = self.engine
+        roll = self.rng.random()
+        if roll < self.lapse_rate:
+            return  # 不作答，等待超时
+        if roll < self.lapse_rate + self.anticipation_rate:
+            rt = self.rng.uniform(20, 100)
+        else:
+            rt = self.rng.lognormvariate(np.log(self.median_rt), self.sigma)
+
+        response = engine.stimulus_source.expected_response(engine.current_test_type, stimulus)
+        if response is not None and self.rng.random() < self.error_rate:
+            response = 1 + response % 4
+        # 迟到的反应（超时之后）不能落到下一个试次上
+        engine.scheduler.call_later(
+            rt, lambda: engine.current_stimulus is stimulus and engine.record_response(response))
+
+    def test_completed(self, statistics: Dict[str, Any]):
+        self.completed.append(statistics)
+
+
+def simulate_runs(runs: int = 1000, trials: int = 10, test_type: str = 'choice',
+                  stimulus_type: str = 'color', requeue_invalid: bool = False, seed: int = 0,
+                  store=None) -> Dict[str, Any]:
+    """在虚拟时钟上连续模拟多轮测试，返回吞吐量与汇总"""
+    rng = random.Random(seed)
+    scheduler = VirtualScheduler()
+    engine = TestEngineCore(DataStimulusSource(rng), scheduler, clock=scheduler.clock, store=store, rng=rng)
+    participant = SimulatedParticipant(engine, rng)
+    engine.sink = participant
+
+    start = time.perf_counter()
+    for run in range(runs):
+        engine.setup_test(test_type, stimulus_type, {'user_id': f"sim_{run % 100:03d}"}, trials,
+                          requeue_invalid=requeue_invalid)
+        engine.start_test()
+        scheduler.run(until=lambda: not engine.is_test_running)
+    elapsed = time.perf_counter() - start
+
+    averages = [stats['average'] for stats in participant.completed]
+    return {
+        'runs': len(participant.completed),
+        'trials': sum(stats['recorded_trials'] for stats in participant.completed),
+        'elapsed_seconds': elapsed,
+        'runs_per_second': runs / elapsed if elapsed > 0 else float('inf'),
+        'virtual_seconds': scheduler.clock.now - 1.0,
+        'mean_average_rt': float(np.mean(averages)) if averages else 0.0
+    }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="无界面测试引擎模拟（虚拟时钟）")
+    parser.add_argument('--runs', type=int, default=2000, help="模拟轮数")
+    parser.add_argument('--trials', type=int, default=10, help="每轮试次数")
+    parser.add_argument('--test-type', choices=['simple', 'choice', 'disjunctive'], default='choice')
+    parser.add_argument('--requeue', action='store_true', help="无效试次重测")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    result = simulate_runs(args.runs, args.trials, args.test_type, requeue_invalid=args.requeue, seed=args.seed)
+    print(f"模拟 {result['runs']} 轮 / {result['trials']} 个试次, 耗时 {result['elapsed_seconds']:.2f} 秒 "
+          f"({result['runs_per_second']:.0f} 轮/秒, 虚拟时长 {result['virtual_seconds']:.0f} 秒), "
+          f"平均反应时均值 {result['mean_average_rt']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+独立线程的输入采集（Linux evdev）
+在专用线程中直接读取 /dev/input/event* 设备，使用内核事件时间戳作为反应时刻，
+不受GUI线程繁忙（绘制、数据库提交、图表对话框）的影响。
+内核时间戳默认基于CLOCK_REALTIME，与测试引擎使用的 time.time() 同一时间基准。
+
+用法: python input_capture.py --self-test   （通过uinput虚拟设备自检，需要 /dev/uinput 写权限）
+"""
+
+import argparse
+import os
+import selectors
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+try:
+    import evdev
+    from evdev import ecodes
+except ImportError:  # evdev为可选依赖，仅Linux可用
+    evdev = None
+    ecodes = None
+
+# 测试中关心的按键（空格、数字1-4）与鼠标左键
+RESPONSE_KEY_NAMES = ['KEY_SPACE', 'KEY_1', 'KEY_2', 'KEY_3', 'KEY_4', 'BTN_LEFT']
+
+
+def is_available() -> bool:
+    """当前平台是否支持evdev输入后端"""
+    return evdev is not None and sys.platform.startswith('linux')
+
+
+class InputEvent:
+    """一次按下事件（内核时间戳，ms）"""
+
+    __slots__ = ('code', 'name', 'timestamp', 'device')
+
+    def __init__(self, code: int, name: str, timestamp: float, device: str):
+        self.code = code
+        self.name = name
+        self.timestamp = timestamp
+        self.device = device
+
+
+class EvdevInputBackend(threading.Thread):
+    """evdev输入采集线程
+
+    只把按下事件（value == 1）转交回调；回调在采集线程中执行，
+    调用方负责转发到引擎所在线程（Qt中用信号即可自动排队）。
+    """
+
+    def __init__(self, on_event: Callable[[InputEvent], None], device_paths: Optional[List[str]] = None):
+        super().__init__(name="evdev-input", daemon=True)
+        if evdev is None:
+            raise RuntimeError("未安装evdev，无法使用内核输入后端")
+
+        self.on_event = on_event
+        self.device_paths = device_paths
+        self.devices = []
+        self._watched_codes = {ecodes.ecodes[name] for name in RESPONSE_KEY_NAMES}
+        self._stop_read, self._stop_write = os.pipe()
+        self._running = False
+
+    def open_devices(self) -> List[str]:
+        """打开指定设备，未指定时自动发现带响应按键的设备"""
+        paths = self.device_paths if self.device_paths is not None else evdev.list_devices()
+        for path in paths:
+            try:
+                device = evdev.InputDevice(path)
+            except OSError as e:
+                print(f"打开输入设备失败 {path}: {e}")
+                continue
+
+            keys = set(device.capabilities().get(ecodes.EV_KEY, []))
+            if keys & self._watched_codes:
+                self.devices.append(device)
+            else:
+                device.close()
+
+        return [device.path for device in self.devices]
+
+    def start(self):
+        if not self.devices:
+            self.open_devices()
+        if not self.devices:
+            raise RuntimeError("没有可用的输入设备（需要 /dev/input/event* 读权限）")
+        self._running = True
+        super().start()
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._stop_read, selectors.EVENT_READ)
+        for device in self.devices:
+            selector.register(device.fd, selectors.EVENT_READ, device)
+
+        try:
+            while self._running:
+                for key, _ in selector.select():
+                    device = key.data
+                    if device is None:
+                        return
+                    try:
+                        events = device.read()
+                    except (BlockingIOError, OSError):
+                        continue
+                    for event in events:
+                        if event.type == ecodes.EV_KEY and event.value == 1 and event.code in self._watched_codes:
+                            name = ecodes.KEY.get(event.code) or ecodes.BTN.get(event.code)
+                            if isinstance(name, list):
+                                name = name[0]
+                            timestamp = event.sec * 1000 + event.usec / 1000
+                            self.on_event(InputEvent(event.code, name, timestamp, device.path))
+        finally:
+            selector.close()
+
+    def stop(self):
+        """停止采集并关闭设备"""
+        self._running = False
+        if self._stop_write is not None:
+            os.write(self._stop_write, b'x')
+        if self.is_alive():
+            self.join(timeout=1.0)
+        for device in self.devices:
+            try:
+                device.close()
+            except OSError:
+                pass
+        self.devices = []
+        if self._stop_write is not None:
+            os.close(self._stop_read)
+            os.close(self._stop_write)
+            self._stop_read = self._stop_write = None
+
+
+class DeliveryLatencyTracker:
+    """统计内核时间戳到Qt事件送达之间的延迟"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._pending: Dict[int, float] = {}
+        self.latencies_ms = []
+
+    def kernel_event(self, key: int, timestamp: float):
+        """记录内核事件（key为调用方统一后的按键编号）"""
+        self._pending[key] = timestamp
+
+    def qt_event(self, key: int, delivered_at: Optional[float] = None):
+        """记录Qt事件送达时刻，与同一按键最近的内核事件配对"""
+        kernel_ts = self._pending.pop(key, None)
+        if kernel_ts is None:
+            return None
+        latency = (delivered_at if delivered_at is not None else time.time() * 1000) - kernel_ts
+        self.latencies_ms.append(latency)
+        return latency
+
+    def summary(self) -> Dict[str, float]:
+        """延迟汇总（ms）"""
+        if not self.latencies_ms:
+            return {'count': 0, 'mean': 0.0, 'p95': 0.0, 'max': 0.0}
+        ordered = sorted(self.latencies_ms)
+        return {
+            'count': len(ordered),
+            'mean': sum(ordered) / len(ordered),
+            'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            'max': ordered[-1]
+        }
+
+
+def create_virtual_device(name: str = "reaction-test-virtual"):
+    """创建uinput虚拟输入设备（测试用）"""
+    if evdev is None:
+        raise RuntimeError("未安装evdev")
+    keys = [ecodes.ecodes[key_name] for key_name in RESPONSE_KEY_NAMES]
+    return evdev.UInput({ecodes.EV_KEY: keys}, name=name)
+
+
+def self_test(presses: int = 20) -> Dict[str, float]:
+    """用uinput虚拟设备注入按键，检查采集线程收到的内核时间戳"""
+    received = []
+    done = threading.Event()
+
+    def on_event(event: InputEvent):
+        received.append((event, time.time() * 1000))
+        if len(received) >= presses:
+            done.set()
+
+    with create_virtual_device() as uinput:
+        # 等待udev创建设备节点
+        time.sleep(0.3)
+        backend = EvdevInputBackend(on_event, device_paths=[uinput.device.path])
+        backend.start()
+        try:
+            sent = []
+            for _ in range(presses):
+                sent.append(time.time() * 1000)
+                uinput.write(ecodes.EV_KEY, ecodes.KEY_SPACE, 1)
+                uinput.write(ecodes.EV_KEY, ecodes.KEY_SPACE, 0)
+                uinput.syn()
+                time.sleep(0.01)
+            done.wait(timeout=2.0)
+        finally:
+            backend.stop()
+
+    if len(received) != presses:
+        raise AssertionError(f"注入 {presses} 次按键，只收到 {len(received)} 次")
+
+    # 内核时间戳应不早于注入时刻，且线程送达延迟很小
+    stamp_offsets = [event.timestamp - sent_at for (event, _), sent_at in zip(received, sent)]
+    thread_delays = [arrived - event.timestamp for event, arrived in received]
+    return {
+        'presses': presses,
+        'max_stamp_offset_ms': max(stamp_offsets),
+        'mean_thread_delay_ms': sum(thread_delays) / len(thread_delays),
+        'max_thread_delay_ms': max(thread_delays)
+    }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="evdev输入采集后端")
+    parser.add_argument('--self-test', action='store_true', help="通过uinput虚拟设备自检")
+    parser.add_argument('--list', action='store_true', help="列出可用输入设备")
+    args = parser.parse_args()
+
+    if not is_available():
+        print("当前环境不支持evdev输入后端（需要Linux并安装evdev）")
+        return
+
+    if args.list:
+        backend = EvdevInputBackend(lambda event: None)
+        for path in backend.open_devices():
+            print(path)
+        backend.stop()
+    if args.self_test:
+        result = self_test()
+        print(f"自检通过: {result['presses']} 次按键, 内核时间戳与注入时刻最大偏差 "
+              f"{result['max_stamp_offset_ms']:.3f} ms, 线程送达延迟 均值 "
+              f"{result['mean_thread_delay_ms']:.3f} ms / 最大 {result['max_thread_delay_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
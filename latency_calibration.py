@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+显示与输入延迟校准
+测得的反应时包含与工作站相关的固定延迟：显示扫描输出、窗口合成与输入栈。
+校准时注入合成输入、用屏幕回读（光电二极管的替代）检测刺激实际上屏，
+得到每台工作站的延迟档案，测试时自动从反应时中扣除。
+本模块只包含与界面无关的档案与估计逻辑，测量过程见 safe_test.LatencyCalibrator
+"""
+
+import os
+import socket
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+PROFILE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS station_latency_profiles (
+        station_id TEXT PRIMARY KEY,
+        display_latency_ms REAL,
+        display_sd_ms REAL,
+        display_method TEXT,
+        input_latency_ms REAL,
+        input_sd_ms REAL,
+        input_method TEXT,
+        samples INTEGER,
+        calibrated_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+PROFILE_COLUMNS = [
+    'station_id', 'display_latency_ms', 'display_sd_ms', 'display_method',
+    'input_latency_ms', 'input_sd_ms', 'input_method', 'samples'
+]
+
+# 显示延迟测量方式
+DISPLAY_METHOD_LOOPBACK = 'screen_loopback'  # 回读屏幕像素确认刺激已上屏
+DISPLAY_METHOD_PAINT = 'paint'               # 无法回读时退回到绘制完成时刻
+
+# 输入延迟测量方式
+INPUT_METHOD_UINPUT = 'uinput'               # 经内核输入栈注入（evdev/uinput）
+INPUT_METHOD_POSTED = 'posted_event'         # Qt事件队列注入
+
+
+def station_id() -> str:
+    """当前工作站标识（可用环境变量 REACTION_TEST_STATION 覆盖）"""
+    return os.environ.get('REACTION_TEST_STATION') or socket.gethostname()
+
+
+def robust_estimate(samples: List[float]) -> Dict[str, float]:
+    """中位数与MAD标准差估计，不受偶发调度抖动影响"""
+    if not samples:
+        return {'median': 0.0, 'sd': 0.0}
+    values = np.asarray(samples, dtype=np.float64)
+    median = float(np.median(values))
+    mad = float(np.median(np.abs(values - median)))
+    return {'median': median, 'sd': mad * 1.4826}
+
+
+class LatencyProfile:
+    """单台工作站的延迟档案"""
+
+    __slots__ = tuple(PROFILE_COLUMNS) + ('calibrated_time',)
+
+    def __init__(self, station_id: str, display_latency_ms: float = 0.0, display_sd_ms: float = 0.0,
+                 display_method: str = DISPLAY_METHOD_PAINT, input_latency_ms: float = 0.0,
+                 input_sd_ms: float = 0.0, input_method: str = INPUT_METHOD_POSTED,
+                 samples: int = 0, calibrated_time: Optional[str] = None):
+        self.station_id = station_id
+        self.display_latency_ms = display_latency_ms
+        self.display_sd_ms = display_sd_ms
+        self.display_method = display_method
+        self.input_latency_ms = input_latency_ms
+        self.input_sd_ms = input_sd_ms
+        self.input_method = input_method
+        self.samples = samples
+        self.calibrated_time = calibrated_time
+
+    @classmethod
+    def from_samples(cls, station: str, display_samples: List[float], display_method: str,
+                     input_samples: List[float], input_method: str) -> 'LatencyProfile':
+        """由校准样本生成档案"""
+        display = robust_estimate(display_samples)
+        input_ = robust_estimate(input_samples)
+        return cls(station, display['median'], display['sd'], display_method,
+                   input_['median'], input_['sd'], input_method,
+                   min(len(display_samples), len(input_samples)),
+                   time.strftime('%Y-%m-%d %H:%M:%S'))
+
+    def correction_ms(self, kernel_input: bool = False) -> float:
+        """需要从反应时中扣除的延迟
+
+        使用evdev内核时间戳时，输入栈延迟已不在测得的反应时中，只扣除显示延迟。
+        以Qt事件注入测得的输入延迟只包含事件队列耗时、不含内核与设备延迟，不予扣除。
+        """
+        correction = self.display_latency_ms
+        if not kernel_input and self.input_method != INPUT_METHOD_POSTED:
+            correction += self.input_latency_ms
+        return max(correction, 0.0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return (f"LatencyProfile(station_id={self.station_id!r}, "
+                f"display={self.display_latency_ms:.2f}±{self.display_sd_ms:.2f} ms ({self.display_method}), "
+                f"input={self.input_latency_ms:.2f}±{self.input_sd_ms:.2f} ms ({self.input_method}))")
+
+
+def save_profile(conn: sqlite3.Connection, profile: LatencyProfile):
+    """保存档案（同一工作站覆盖旧档案）"""
+    conn.execute(PROFILE_TABLE_SQL)
+    placeholders = ', '.join('?' * len(PROFILE_COLUMNS))
+    conn.execute(
+        f"INSERT OR REPLACE INTO station_latency_profiles ({', '.join(PROFILE_COLUMNS)}) "
+        f"VALUES ({placeholders})",
+        tuple(getattr(profile, col) for col in PROFILE_COLUMNS)
+    )
+
+
+def load_profile(conn: sqlite3.Connection, station: str) -> Optional[LatencyProfile]:
+    """读取工作站档案，未校准时返回None"""
+    conn.execute(PROFILE_TABLE_SQL)
+    row = conn.execute(
+        f"SELECT {', '.join(PROFILE_COLUMNS)}, calibrated_time FROM station_latency_profiles "
+        f"WHERE station_id = ?", (station,)
+    ).fetchone()
+    if row is None:
+        return None
+    return LatencyProfile(*row)
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试厅实时监控推送
+各工作站的测试引擎把试次与轮次事件（开始、刺激出现、反应、超时、完成）推送到
+本地发布/订阅服务，监控面板通过SSE订阅并按工作站汇总，全程不轮询SQLite。
+
+协议（同一端口）:
+- 工作站: 建立TCP连接后发送 "PUB <station>\\n"，之后每行一个JSON事件
+- 订阅者: GET /events   SSE事件流（连接后先收到全部工作站的当前状态）
+          GET /snapshot 全部工作站当前状态（JSON）
+
+工作站设置环境变量 REACTION_TEST_FEED=host:port 后自动推送。
+
+用法: python live_feed.py serve --port 8765
+      python live_feed.py simulate --stations 40 --rate 20   （多工作站满速压测）
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from engine_core import EngineSink
+from latency_calibration import station_id
+from trial_records import TrialRecord
+
+DEFAULT_PORT = 8765
+FEED_ENV = 'REACTION_TEST_FEED'
+
+# 事件类型
+EVENT_STARTED = 'started'
+EVENT_STIMULUS = 'stimulus'
+EVENT_RESPONSE = 'response'
+EVENT_TIMEOUT = 'timeout'
+EVENT_COMPLETED = 'completed'
+EVENT_STOPPED = 'stopped'
+
+# 每个订阅者最多积压的事件数，超过后丢弃最旧事件（慢订阅者不拖慢其他订阅者）
+SUBSCRIBER_QUEUE_SIZE = 5000
+HEARTBEAT_SECONDS = 15
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """'host:port' 或 'port' -> (host, port)"""
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class StationBoard:
+    """按工作站汇总的实时状态（服务端快照与监控面板共用，线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stations: Dict[str, Dict[str, Any]] = {}
+        self.events = 0
+
+    def apply(self, event: Dict[str, Any]):
+        """合并一个事件"""
+        with self._lock:
+            self.events += 1
+            if event.get('type') == 'snapshot':
+                for name, state in event['stations'].items():
+                    self.stations[name] = dict(state)
+                return
+
+            state = self.stations.setdefault(event['station'], {
+                'station': event['station'], 'status': 'idle', 'user_id': '', 'test_type': '',
+                'trial': 0, 'total_trials': 0, 'last_rt': None, 'rt_sum': 0.0, 'rt_count': 0,
+                'errors': 0, 'timeouts': 0, 'runs_completed': 0, 'last_event_ts': 0.0
+            })
+            kind = event['type']
+            state['last_event_ts'] = event.get('ts', 0.0)
+            if kind == EVENT_STARTED:
+                state.update(status='running', user_id=event.get('user_id', ''),
+                             test_type=event.get('test_type', ''), trial=0,
+                             total_trials=event.get('total_trials', 0), last_rt=None,
+                             rt_sum=0.0, rt_count=0, errors=0, timeouts=0)
+            elif kind == EVENT_STIMULUS:
+                state.update(status='stimulus', trial=event.get('trial', state['trial']))
+            elif kind == EVENT_RESPONSE:
+                state.update(status='running', trial=event['trial'], last_rt=event['reaction_time'])
+                if event.get('qc_label') == 'valid' and event.get('is_correct'):
+                    state['rt_sum'] += event['reaction_time']
+                    state['rt_count'] += 1
+                if not event.get('is_correct'):
+                    state['errors'] += 1
+            elif kind == EVENT_TIMEOUT:
+                state.update(status='running', trial=event['trial'], last_rt=None)
+                state['timeouts'] += 1
+            elif kind == EVENT_COMPLETED:
+                state.update(status='completed', trial=state['total_trials'])
+                state['runs_completed'] += 1
+            elif kind == EVENT_STOPPED:
+                state['status'] = 'stopped'
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: dict(state) for name, state in self.stations.items()}
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """面板表格行（按工作站名排序）"""
+        rows = []
+        for name, state in sorted(self.snapshot().items()):
+            rows.append({
+                'station': name,
+                'status': state['status'],
+                'user_id': state['user_id'],
+                'test_type': state['test_type'],
+                'progress': f"{state['trial']}/{state['total_trials']}",
+                'last_rt': state['last_rt'],
+                'mean_rt': state['rt_sum'] / state['rt_count'] if state['rt_count'] else None,
+                'errors': state['errors'],
+                'timeouts': state['timeouts'],
+                'runs_completed': state['runs_completed'],
+                'age_s': max(time.time() - state['last_event_ts'] / 1000, 0.0) if state['last_event_ts'] else None
+            })
+        return rows
+
+
+class FeedHub:
+    """发布/订阅中心（asyncio，单线程）
+
+    每个事件只编码一次，放入各订阅者的有界队列；订阅者积压过多时丢弃其最旧事件。
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.board = StationBoard()
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, event: Dict[str, Any]):
+        self.board.apply(event)
+        self.published += 1
+        message = b'data: ' + json.dumps(event, ensure_ascii=False).encode('utf-8') + b'\n\n'
+        for subscriber in self.subscribers:
+            if subscriber.full():
+                subscriber.get_nowait()
+                self.dropped += 1
+            subscriber.put_nowait(message)
+
+    def subscribe(self) -> asyncio.Queue:
+        subscriber = asyncio.Queue(self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: asyncio.Queue):
+        self.subscribers.discard(subscriber)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            first_line = await reader.readline()
+            if first_line.startswith(b'PUB '):
+                await self._handle_publisher(reader)
+            elif first_line.startswith(b'GET '):
+                path = first_line.split()[1].decode('ascii', 'replace')
+                # 跳过请求头
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                await self._handle_http(path, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_publisher(self, reader: asyncio.StreamReader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"丢弃无法解析的事件: {e}")
+                continue
+            self.publish(event)
+
+    async def _handle_http(self, path: str, writer: asyncio.StreamWriter):
+        if path == '/snapshot':
+            body = json.dumps(self.board.snapshot(), ensure_ascii=False).encode('utf-8')
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=utf-8\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+            return
+        if path != '/events':
+            writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+            return
+
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                     b'Connection: keep-alive\r\nAccess-Control-Allow-Origin: *\r\n\r\n')
+        snapshot = {'type': 'snapshot', 'stations': self.board.snapshot()}
+        writer.write(b'data: ' + json.dumps(snapshot, ensure_ascii=False).encode('utf-8') + b'\n\n')
+        subscriber = self.subscribe()
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    message = b': ping\n\n'
+                # 一次写出积压的全部事件
+                chunks = [message]
+                while not subscriber.empty():
+                    chunks.append(subscriber.get_nowait())
+                writer.write(b''.join(chunks))
+                await writer.drain()
+        finally:
+            self.unsubscribe(subscriber)
+
+
+async def serve(host: str = '127.0.0.1', port: int = DEFAULT_PORT, hub: Optional[FeedHub] = None,
+                ready: Optional[threading.Event] = None):
+    """运行推送服务（直到被取消）"""
+    hub = hub or FeedHub()
+    server = await asyncio.start_server(hub.handle_connection, host, port)
+    if ready is not None:
+        ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+def start_server_thread(host: str = '127.0.0.1', port: int = DEFAULT_PORT) -> FeedHub:
+    """在后台线程中运行推送服务（嵌入其他程序或压测用）"""
+    hub = FeedHub()
+    ready = threading.Event()
+    thread = threading.Thread(target=lambda: asyncio.run(serve(host, port, hub, ready)),
+                              name="live-feed-server", daemon=True)
+    thread.start()
+    if not ready.wait(5.0):
+        raise RuntimeError(f"推送服务启动失败: {host}:{port}")
+    return hub
+
+
+class FeedPublisher(threading.Thread):
+    """工作站端推送线程
+
+    publish() 只把事件放入内存队列，不阻塞测试引擎；后台线程批量发送，
+    连接断开时自动重连，队列满时丢弃新事件。
+    """
+
+    def __init__(self, address: str, station: Optional[str] = None, max_queue: int = 10000):
+        super().__init__(name="live-feed-publisher", daemon=True)
+        self.host, self.port = parse_address(address)
+        self.station = station or station_id()
+        self.queue: queue.Queue = queue.Queue(max_queue)
+        self.sent = 0
+        self.dropped = 0
+        self._seq = 0
+        self._running = True
+
+    def publish(self, event_type: str, **fields):
+        self._seq += 1
+        event = {'type': event_type, 'station': self.station, 'seq': self._seq, 'ts': time.time() * 1000}
+        event.update(fields)
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        sock = None
+        while self._running:
+            event = self.queue.get()
+            if event is None:
+                break
+            batch = [event]
+            while len(batch) < 500:
+                try:
+                    event = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    self._running = False
+                    break
+                batch.append(event)
+            payload = b''.join(json.dumps(e, ensure_ascii=False).encode('utf-8') + b'\n' for e in batch)
+            try:
+                if sock is None:
+                    sock = socket.create_connection((self.host, self.port), timeout=2.0)
+                    sock.sendall(f"PUB {self.station}\n".encode('utf-8'))
+                sock.sendall(payload)
+                self.sent += len(batch)
+            except OSError as e:
+                self.dropped += len(batch)
+                if sock is not None:
+                    sock.close()
+                    sock = None
+                print(f"推送事件失败（{self.host}:{self.port}）: {e}")
+                time.sleep(1.0)
+        if sock is not None:
+            sock.close()
+
+    def stop(self):
+        """发送完已排队的事件后停止"""
+        self.queue.put(None)
+        if self.is_alive():
+            self.join(timeout=2.0)
+
+
+class FeedSink(EngineSink):
+    """把测试引擎事件推送到监控服务"""
+
+    def __init__(self, engine, publisher: FeedPublisher):
+        self.engine = engine
+        self.publisher = publisher
+
+    def test_started(self, message: str):
+        engine = self.engine
+        self.publisher.publish(EVENT_STARTED, user_id=engine.user_data.get('user_id', ''),
+                               test_type=engine.current_test_type, stimulus_type=engine.current_stimulus_type,
+                               total_trials=engine.total_trials)
+
+    def stimulus_shown(self, stimulus: Any):
+        self.publisher.publish(EVENT_STIMULUS, trial=self.engine.current_trial + 1)
+
+    def response_recorded(self, record: TrialRecord):
+        self.publisher.publish(EVENT_RESPONSE, trial=record.trial, reaction_time=record.reaction_time,
+                               is_correct=bool(record.is_correct), qc_label=record.qc_label)
+
+    def trial_timeout(self, record: TrialRecord):
+        self.publisher.publish(EVENT_TIMEOUT, trial=record.trial)
+
+    def test_completed(self, statistics: Dict[str, Any]):
+        self.publisher.publish(EVENT_COMPLETED, average=statistics.get('average'),
+                               accuracy=statistics.get('accuracy'))
+
+    def test_stopped(self):
+        self.publisher.publish(EVENT_STOPPED)
+
+
+_publisher: Optional[FeedPublisher] = None
+
+
+def publisher_from_env() -> Optional[FeedPublisher]:
+    """按环境变量 REACTION_TEST_FEED 创建（进程内共用）推送线程，未设置时返回None"""
+    global _publisher
+    address = os.environ.get(FEED_ENV)
+    if not address:
+        return None
+    if _publisher is None or not _publisher.is_alive():
+        _publisher = FeedPublisher(address)
+        _publisher.start()
+    return _publisher
+
+
+def attach_feed(engine) -> Optional[FeedSink]:
+    """为引擎核心挂接推送（未配置推送服务时不做任何事）"""
+    publisher = publisher_from_env()
+    if publisher is None:
+        return None
+    sink = FeedSink(engine, publisher)
+    engine.add_sink(sink)
+    return sink
+
+
+class FeedSubscriber(threading.Thread):
+    """监控端订阅线程：读取SSE事件流并合并到 StationBoard，断线自动重连"""
+
+    def __init__(self, address: str, board: Optional[StationBoard] = None):
+        super().__init__(name="live-feed-subscriber", daemon=True)
+        self.host, self.port = parse_address(address)
+        self.board = board or StationBoard()
+        self.connected = False
+        self.last_error = None
+        self._running = True
+
+    def run(self):
+        while self._running:
+            try:
+                with socket.create_connection((self.host, self.port), timeout=HEARTBEAT_SECONDS * 2) as sock:
+                    sock.sendall(b'GET /events HTTP/1.1\r\nHost: feed\r\nAccept: text/event-stream\r\n\r\n')
+                    stream = sock.makefile('rb')
+                    if b' 200 ' not in stream.readline():
+                        raise ConnectionError("订阅请求被拒绝")
+                    while stream.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    self.connected = True
+                    for line in stream:
+                        if line.startswith(b'data: '):
+                            self.board.apply(json.loads(line[6:]))
+                        if not self._running:
+                            return
+            except (OSError, ValueError) as e:
+                self.last_error = str(e)
+            self.connected = False
+            time.sleep(1.0)
+
+    def stop(self):
+        self._running = False
+
+
+def simulate_stations(stations: int = 40, rate: float = 20.0, seconds: float = 5.0,
+                      port: int = DEFAULT_PORT + 1) -> Dict[str, Any]:
+    """多工作站满速推送压测：本进程内启动服务、若干工作站推送线程与一个订阅者"""
+    hub = start_server_thread('127.0.0.1', port)
+    address = f"127.0.0.1:{port}"
+    subscriber = FeedSubscriber(address)
+    latencies = []
+    apply = subscriber.board.apply
+
+    def measure(event):
+        if event.get('type') != 'snapshot':
+            latencies.append(time.time() * 1000 - event['ts'])
+        apply(event)
+
+    subscriber.board.apply = measure
+    subscriber.start()
+    while not subscriber.connected:
+        time.sleep(0.01)
+
+    publishers = [FeedPublisher(address, f"station-{i:02d}") for i in range(stations)]
+    for publisher in publishers:
+        publisher.start()
+
+    # 每个工作站每秒 rate 个事件（一个试次约2-3个事件）
+    interval = 1.0 / rate
+    end = time.perf_counter() + seconds
+    trial = 0
+    while time.perf_counter() < end:
+        trial += 1
+        tick = time.perf_counter()
+        for publisher in publishers:
+            publisher.publish(EVENT_RESPONSE, trial=trial, reaction_time=300.0, is_correct=True, qc_label='valid')
+        time.sleep(max(interval - (time.perf_counter() - tick), 0))
+    for publisher in publishers:
+        publisher.stop()
+    sent = sum(p.sent for p in publishers)
+
+    deadline = time.time() + 5.0
+    while len(latencies) < sent and time.time() < deadline:
+        time.sleep(0.05)
+    subscriber.stop()
+
+    ordered = sorted(latencies)
+    return {
+        'stations': stations,
+        'sent': sent,
+        'received': len(latencies),
+        'hub_dropped': hub.dropped,
+        'events_per_second': sent / seconds,
+        'latency_p50_ms': ordered[len(ordered) // 2] if ordered else 0.0,
+        'latency_p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] if ordered else 0.0
+    }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="测试厅实时监控推送服务")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="运行推送服务")
+    serve_parser.add_argument('--host', default='127.0.0.1', help="监听地址（测试厅内网可用0.0.0.0）")
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="监听端口")
+
+    sim_parser = subparsers.add_parser('simulate', help="多工作站推送压测")
+    sim_parser.add_argument('--stations', type=int, default=40, help="工作站数")
+    sim_parser.add_argument('--rate', type=float, default=20.0, help="每个工作站每秒事件数")
+    sim_parser.add_argument('--seconds', type=float, default=5.0, help="压测时长")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        print(f"监控推送服务: {args.host}:{args.port} （订阅: GET /events）")
+        try:
+            asyncio.run(serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        result = simulate_stations(args.stations, args.rate, args.seconds)
+        print(f"{result['stations']} 个工作站, 发送 {result['sent']} / 收到 {result['received']} 个事件 "
+              f"({result['events_per_second']:.0f} 事件/秒, 服务端丢弃 {result['hub_dropped']}), "
+              f"送达延迟 P50 {result['latency_p50_ms']:.2f} ms / P99 {result['latency_p99_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Web端并发会话负载测试
+每个并发级别启动一个独立的 Streamlit 服务进程（临时目录、临时数据库），
+再用 N 个 websocket 客户端模拟浏览器：每个虚拟被试按浏览器的协议发送重新运行请求，
+完成 开始测试 → 显示刺激 → 反应 → 完成 的整轮流程。按钮点击在所属片段内重新运行，
+并按服务端下发的 run_every 间隔发送片段自动重新运行，与真实浏览器的负载一致。
+
+AppTest 不能在同一进程内并发运行（每次运行都会替换全局 Runtime 实例），
+因此这里直接驱动真实服务端。
+
+每个并发级别输出：
+    - 重新运行延迟 P50/P95/P99（请求发出到 script_finished）与点击重新运行的P95
+    - 数据库锁等待总时长与提交次数（服务端通过 REACTION_TEST_DB_STATS 写出）
+    - 每个会话的服务端内存增量（所有会话完成但保持连接时的进程RSS增量/会话数）
+    - 吞吐量（完成轮次/秒、重新运行/秒）
+
+依赖: pip install -r requirements-dev.txt（websockets）
+
+用法: python load_test.py --levels 1,4,16 --trials 5 --think-ms 300 --max-p95-ms 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Qt_2_web.py')
+DB_STATS_ENV = 'REACTION_TEST_DB_STATS'
+DB_FILE = 'reaction_test_web.db'
+
+TEST_TYPE_LABELS = {
+    'simple': '简单反应时',
+    'choice': '选择反应时',
+    'disjunctive': '析取反应时'
+}
+
+RESPONSE_BUTTONS = {
+    'simple': '点击反应',
+    'choice': '选项 1',
+    'disjunctive': '选择目标'
+}
+
+SHOW_STIMULUS_BUTTON = '显示刺激'
+START_BUTTON = '开始测试'
+# 测试界面刺激区片段的标题（出现即表示本轮仍在进行）
+RUNNING_MARKER = '### 刺激显示区域'
+
+SERVER_START_TIMEOUT = 60.0
+RERUN_TIMEOUT = 60.0
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _rss_mb(pid: int) -> float:
+    """进程常驻内存（MB，读取 /proc）"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError):
+        return 0.0
+
+
+class AppServer:
+    """在临时目录中运行的 Streamlit 服务进程"""
+
+    def __init__(self, work_dir: str):
+        self.work_dir = work_dir
+        self.port = _free_port()
+        self.stats_path = os.path.join(work_dir, 'db_stats.json')
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f'ws://127.0.0.1:{self.port}/_stcore/stream'
+
+    def start(self):
+        env = dict(os.environ, **{DB_STATS_ENV: self.stats_path})
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'streamlit', 'run', APP_PATH,
+             '--server.headless', 'true', '--server.port', str(self.port),
+             '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false'],
+            cwd=self.work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Streamlit 服务启动失败（退出码 {self.process.returncode}）")
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{self.port}/_stcore/health', timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError("Streamlit 服务启动超时")
+
+    def rss_mb(self) -> float:
+        return _rss_mb(self.process.pid)
+
+    def db_stats(self) -> Dict[str, float]:
+        try:
+            with open(self.stats_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'commits': 0, 'lock_wait_ms': 0.0}
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class VirtualParticipant:
+    """一个虚拟被试（一个websocket会话，按浏览器协议发送重新运行请求）"""
+
+    def __init__(self, user_id: str, test_type: str, trials: int, think_ms: float = 300.0):
+        self.user_id = user_id
+        self.test_type = test_type
+        self.trials = trials
+        self.think_ms = think_ms
+        self.ws = None
+        # 当前页面上的元素：delta路径 -> (类型, 标签或正文, 控件ID, 片段ID)
+        self.elements: Dict[tuple, tuple] = {}
+        # 片段自动重新运行：片段ID -> [间隔秒, 下次到期时间]
+        self.auto_reruns: Dict[str, list] = {}
+        # 侧边栏输入：标签 -> (值类型, 值)
+        self.inputs: Dict[str, tuple] = {}
+        self.click_ms: List[float] = []
+        self.auto_ms: List[float] = []
+        self.completed = False
+        self.error: Optional[str] = None
+
+    async def connect(self, url: str):
+        import websockets
+        self.ws = await websockets.connect(url, subprotocols=['streamlit'], max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    def _widget_states(self, trigger_id: Optional[str] = None):
+        from streamlit.proto.WidgetStates_pb2 import WidgetStates
+
+        states = WidgetStates()
+        for kind, label, widget_id, _ in self.elements.values():
+            if widget_id and label in self.inputs:
+                value_type, value = self.inputs[label]
+                state = states.widgets.add(id=widget_id)
+                if value_type == 'double_array_value':
+                    state.double_array_value.data.extend(value)
+                else:
+                    setattr(state, value_type, value)
+        if trigger_id:
+            states.widgets.add(id=trigger_id, trigger_value=True)
+        return states
+
+    async def _rerun(self, trigger_id: Optional[str] = None, fragment_id: str = '',
+                     auto: bool = False) -> float:
+        """发送一次重新运行请求并接收到 script_finished，返回耗时（ms）"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = ''
+        msg.rerun_script.page_script_hash = ''
+        msg.rerun_script.widget_states.CopyFrom(self._widget_states(trigger_id))
+        msg.rerun_script.fragment_id = fragment_id
+        msg.rerun_script.is_auto_rerun = auto
+        self._clear_elements(fragment_id)
+
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        while True:
+            raw = await asyncio.wait_for(self.ws.recv(), RERUN_TIMEOUT)
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof('type')
+            if kind == 'delta':
+                self._apply_delta(forward)
+            elif kind == 'auto_rerun':
+                interval = forward.auto_rerun.interval
+                self.auto_reruns[forward.auto_rerun.fragment_id] = [interval, time.monotonic() + interval]
+            elif kind == 'stop_auto_rerun':
+                self.auto_reruns.clear()
+            elif kind == 'script_finished':
+                status = forward.script_finished
+                if status == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    # 片段内调用了 st.rerun()，服务端紧接着整页重新运行
+                    self._clear_elements('')
+                    continue
+                if status == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("脚本编译错误")
+                return (time.perf_counter() - start) * 1000
+
+    def _clear_elements(self, fragment_id: str):
+        if fragment_id:
+            self.elements = {path: e for path, e in self.elements.items() if e[3] != fragment_id}
+        else:
+            self.elements = {}
+            self.auto_reruns.clear()
+
+    def _apply_delta(self, forward):
+        delta = forward.delta
+        if delta.WhichOneof('type') != 'new_element':
+            return
+        element_type = delta.new_element.WhichOneof('type')
+        element = getattr(delta.new_element, element_type)
+        if element_type == 'exception':
+            raise RuntimeError(element.message)
+        text = getattr(element, 'label', '') or getattr(element, 'body', '')
+        self.elements[tuple(forward.metadata.delta_path)] = (
+            element_type, text, getattr(element, 'id', ''), delta.fragment_id)
+
+    def _find_button(self, label: str) -> Optional[tuple]:
+        for kind, text, widget_id, fragment_id in self.elements.values():
+            if kind == 'button' and text == label:
+                return widget_id, fragment_id
+        return None
+
+    def _is_running(self) -> bool:
+        return any(text == RUNNING_MARKER for _, text, _, _ in self.elements.values())
+
+    async def setup(self):
+        """加载页面并填写侧边栏（不计入测量）"""
+        await self._rerun()
+        self.inputs = {
+            '姓名': ('string_value', self.user_id),
+            '测试类型': ('string_value', TEST_TYPE_LABELS[self.test_type]),
+            '测试次数': ('double_array_value', [float(min(max(self.trials, 5), 30))])
+        }
+        await self._rerun()
+        # 用户ID输入框的默认值在首次运行后才固定，之后输入才会保留
+        self.inputs['用户ID'] = ('string_value', self.user_id)
+        await self._rerun()
+        await self._rerun()
+
+    async def _click(self, label: str):
+        widget_id, fragment_id = self._find_button(label)
+        self.click_ms.append(await self._rerun(widget_id, fragment_id))
+
+    async def run(self):
+        """完成一整轮测试（按钮出现后等待思考时间再点击，其间按时执行片段自动重新运行）"""
+        try:
+            await self._click(START_BUTTON)
+            action_due = None
+            while self._is_running():
+                now = time.monotonic()
+                due = [(entry[1], fragment_id) for fragment_id, entry in self.auto_reruns.items()]
+                button = next((label for label in (SHOW_STIMULUS_BUTTON, RESPONSE_BUTTONS[self.test_type])
+                               if self._find_button(label)), None)
+                if button is None:
+                    action_due = None
+                elif action_due is None:
+                    action_due = now + random.uniform(0.5, 1.5) * self.think_ms / 1000
+
+                next_auto = min(due) if due else None
+                if action_due is not None and (next_auto is None or action_due <= next_auto[0]):
+                    if action_due > now:
+                        await asyncio.sleep(action_due - now)
+                    action_due = None
+                    await self._click(button)
+                elif next_auto is not None:
+                    if next_auto[0] > now:
+                        await asyncio.sleep(next_auto[0] - now)
+                    fragment_id = next_auto[1]
+                    entry = self.auto_reruns.get(fragment_id)
+                    if entry is not None:
+                        entry[1] = time.monotonic() + entry[0]
+                    self.auto_ms.append(await self._rerun(fragment_id=fragment_id, auto=True))
+                else:
+                    raise RuntimeError("测试界面既无按钮也无自动刷新")
+            self.completed = True
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+            print(f"虚拟被试 {self.user_id} 出错: {self.error}")
+
+
+async def _drive_level(server: AppServer, sessions: int, trials: int, test_type: str,
+                       think_ms: float) -> Dict[str, Any]:
+    # 预热：首次运行脚本会导入 pandas/plotly 等，不计入会话内存
+    warmup = VirtualParticipant('warmup', test_type, trials)
+    await warmup.connect(server.url)
+    await warmup._rerun()
+    await warmup.close()
+    await asyncio.sleep(0.5)
+    rss_before = server.rss_mb()
+
+    participants = [VirtualParticipant(f"load_{sessions}_{i}", test_type, trials, think_ms)
+                    for i in range(sessions)]
+    await asyncio.gather(*(p.connect(server.url) for p in participants))
+    await asyncio.gather(*(p.setup() for p in participants))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(p.run() for p in participants))
+    elapsed = time.perf_counter() - start
+    # 会话全部完成但仍保持连接时测量内存
+    rss_after = server.rss_mb()
+    await asyncio.gather(*(p.close() for p in participants))
+    return {
+        'participants': participants,
+        'elapsed_s': elapsed,
+        'memory_mb_per_session': max(rss_after - rss_before, 0.0) / sessions
+    }
+
+
+def run_level(sessions: int, trials: int = 5, test_type: str = 'simple',
+              think_ms: float = 300.0) -> Dict[str, Any]:
+    """以指定并发数运行一轮负载测试（独立服务进程与临时数据库）"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        server = AppServer(work_dir)
+        server.start()
+        try:
+            driven = asyncio.run(_drive_level(server, sessions, trials, test_type, think_ms))
+            db_stats = server.db_stats()
+        finally:
+            server.stop()
+
+        participants = driven['participants']
+        conn = sqlite3.connect(os.path.join(work_dir, DB_FILE))
+        try:
+            stored_records = conn.execute(
+                f"SELECT COUNT(*) FROM test_records WHERE user_id IN ({','.join('?' * sessions)})",
+                [p.user_id for p in participants]).fetchone()[0]
+        finally:
+            conn.close()
+
+    latencies = np.asarray([ms for p in participants for ms in p.click_ms + p.auto_ms], dtype=np.float64)
+    clicks = np.asarray([ms for p in participants for ms in p.click_ms], dtype=np.float64)
+    completed = sum(p.completed for p in participants)
+    elapsed = driven['elapsed_s']
+
+    def pct(values, q):
+        return float(np.percentile(values, q)) if values.size else 0.0
+
+    return {
+        'sessions': sessions,
+        'completed': completed,
+        'errors': sessions - completed,
+        'reruns': int(latencies.size),
+        'auto_reruns': int(latencies.size - clicks.size),
+        'p50_ms': pct(latencies, 50),
+        'p95_ms': pct(latencies, 95),
+        'p99_ms': pct(latencies, 99),
+        'click_p95_ms': pct(clicks, 95),
+        'lock_wait_ms': float(db_stats['lock_wait_ms']),
+        'commits': int(db_stats['commits']),
+        'stored_records': stored_records,
+        'memory_mb_per_session': driven['memory_mb_per_session'],
+        'elapsed_s': elapsed,
+        'runs_per_s': completed / elapsed if elapsed > 0 else 0.0,
+        'reruns_per_s': latencies.size / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def run_load_test(levels: List[int], trials: int = 5, test_type: str = 'simple',
+                  think_ms: float = 300.0) -> List[Dict[str, Any]]:
+    """依次运行各并发级别"""
+    return [run_level(sessions, trials, test_type, think_ms) for sessions in levels]
+
+
+def main():
+    """命令行入口（有会话失败、记录缺失，或点击P95超出 --max-p95-ms 时退出码为1）"""
+    parser = argparse.ArgumentParser(description="Web端并发会话负载测试")
+    parser.add_argument('--levels', default='1,4,16', help="并发会话数，逗号分隔")
+    parser.add_argument('--trials', type=int, default=5, help="每轮试次数（5-30）")
+    parser.add_argument('--test-type', choices=list(RESPONSE_BUTTONS), default='simple')
+    parser.add_argument('--think-ms', type=float, default=300.0, help="被试每次点击前的平均思考时间（ms）")
+    parser.add_argument('--max-p95-ms', type=float, default=None, help="点击重新运行延迟P95上限（ms）")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(',') if level.strip()]
+    results = run_load_test(levels, args.trials, args.test_type, args.think_ms)
+
+    print(f"{'会话':>4} {'完成':>4} {'重跑':>5} {'自动':>5} {'P50ms':>8} {'P95ms':>8} {'P99ms':>8} "
+          f"{'点击P95':>8} {'锁等待ms':>9} {'提交':>4} {'记录':>5} {'MB/会话':>8} {'轮/秒':>7} {'重跑/秒':>8}")
+    failed = False
+    for r in results:
+        print(f"{r['sessions']:>4} {r['completed']:>4} {r['reruns']:>5} {r['auto_reruns']:>5} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['click_p95_ms']:>8.1f} "
+              f"{r['lock_wait_ms']:>9.2f} {r['commits']:>4} {r['stored_records']:>5} "
+              f"{r['memory_mb_per_session']:>8.2f} {r['runs_per_s']:>7.2f} {r['reruns_per_s']:>8.1f}")
+        if r['errors'] or r['stored_records'] < r['completed'] * args.trials:
+            failed = True
+        if args.max_p95_ms is not None and r['click_p95_ms'] > args.max_p95_ms:
+            print(f"  并发 {r['sessions']} 的点击P95 {r['click_p95_ms']:.1f} ms 超出上限 {args.max_p95_ms:.0f} ms")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+长时间运行工作站的内存看门狗
+定时（默认5分钟）记录进程RSS、tracemalloc 快照与Qt对象数量，与基线比较后把增长最多的
+分配位置（文件:行号）和Qt类写入日志；增长超过预算时发出 budget_exceeded 信号，
+由主窗口释放对话框、图表与缓存等重量级组件（软重启）后重新建立基线。
+
+测试进行中暂停 tracemalloc（跟踪会拖慢每次分配，干扰计时），只在两轮测试之间跟踪与检查；
+tracemalloc 只记录1层调用栈以降低开销。暂停会丢弃已记录的分配，Python分配的增长从上一轮结束时算起，
+RSS 与Qt对象的增长始终相对启动（或软重启）时的基线。
+设置环境变量 REACTION_TEST_WATCHDOG=0 可关闭。
+
+用法: python memory_watchdog.py --runs 500   （离屏反复弹出结果对话框与统计图表，检查内存是否持平）
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QApplication
+
+WATCHDOG_ENV = 'REACTION_TEST_WATCHDOG'
+DEFAULT_INTERVAL_S = 300.0
+DEFAULT_BUDGET_MB = 150.0
+DEFAULT_LOG_PATH = 'memory_watchdog.log'
+
+# 快照中忽略的分配位置
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>')
+)
+
+
+def watchdog_enabled() -> bool:
+    """环境变量未关闭看门狗"""
+    return os.environ.get(WATCHDOG_ENV, '1').strip().lower() not in ('0', 'off', 'false', 'no')
+
+
+def process_rss_mb() -> float:
+    """当前进程常驻内存（MB）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            # 非Linux平台只能取峰值
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        except ImportError:
+            return 0.0
+
+
+def qt_object_counts() -> Counter:
+    """按类名统计所有顶层部件及其子对象"""
+    counts = Counter()
+    app = QApplication.instance()
+    if app is None:
+        return counts
+    for widget in app.topLevelWidgets():
+        if widget.parent() is not None:
+            # 有父对象的窗口（如对话框）会在父对象的子对象中统计
+            continue
+        counts[type(widget).__name__] += 1
+        for child in widget.findChildren(QObject):
+            counts[type(child).__name__] += 1
+    return counts
+
+
+class MemoryWatchdog(QObject):
+    """定时内存检查"""
+
+    budget_exceeded = pyqtSignal(dict)
+
+    def __init__(self, interval_s: float = DEFAULT_INTERVAL_S, budget_mb: float = DEFAULT_BUDGET_MB,
+                 log_path: Optional[str] = DEFAULT_LOG_PATH, top: int = 10,
+                 is_busy: Optional[Callable[[], bool]] = None, parent=None):
+        super().__init__(parent)
+        self.interval_s = interval_s
+        self.budget_mb = budget_mb
+        self.log_path = log_path
+        self.top = top
+        self.is_busy = is_busy
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+        self.checks = 0
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._baseline_snapshot = None
+        self._baseline_rss = 0.0
+        self._baseline_traced = 0
+        self._baseline_counts = Counter()
+        self._exceeded = False
+        self._started_tracing = False
+        self._paused = False
+
+    def start(self):
+        """开始跟踪分配并建立基线"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+            self._started_tracing = True
+        self.rebaseline()
+        self.timer.start(int(self.interval_s * 1000))
+        self.log(f"看门狗启动: 间隔 {self.interval_s:.0f} 秒, 预算 {self.budget_mb:.0f} MB, "
+                 f"RSS {self._baseline_rss:.1f} MB")
+
+    def stop(self):
+        self.timer.stop()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._paused = False
+
+    def pause(self):
+        """测试开始前停止分配跟踪（只停止看门狗自己开启的跟踪）"""
+        if self._started_tracing and not self._paused:
+            tracemalloc.stop()
+            self._paused = True
+
+    def resume(self):
+        """测试结束后恢复分配跟踪，Python分配的基线从此刻重新计算"""
+        if self._paused:
+            self._paused = False
+            tracemalloc.start(1)
+            self._rebaseline_traced()
+
+    def rebaseline(self):
+        """以当前状态为基线（启动时与软重启后调用）"""
+        self._rebaseline_traced()
+        self._baseline_rss = process_rss_mb()
+        self._baseline_counts = qt_object_counts()
+        self._exceeded = False
+
+    def _rebaseline_traced(self):
+        self._baseline_snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS) \
+            if tracemalloc.is_tracing() else None
+        self._baseline_traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    def check(self) -> Optional[Dict[str, Any]]:
+        """与基线比较并写入日志（测试进行中跳过）"""
+        if self._paused or (self.is_busy is not None and self.is_busy()):
+            return None
+
+        self.checks += 1
+        rss = process_rss_mb()
+        counts = qt_object_counts()
+        qt_growth = Counter(counts)
+        qt_growth.subtract(self._baseline_counts)
+
+        sites: List[Tuple[str, float, int]] = []
+        traced = 0
+        if tracemalloc.is_tracing() and self._baseline_snapshot is not None:
+            traced = tracemalloc.get_traced_memory()[0]
+            snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            for diff in snapshot.compare_to(self._baseline_snapshot, 'lineno'):
+                if diff.size_diff <= 0:
+                    continue
+                frame = diff.traceback[0]
+                sites.append((f"{frame.filename}:{frame.lineno}", diff.size_diff / 1024, diff.count_diff))
+                if len(sites) >= self.top:
+                    break
+
+        report = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'rss_mb': rss,
+            'rss_growth_mb': rss - self._baseline_rss,
+            'traced_mb': traced / 1024 / 1024,
+            'traced_growth_mb': (traced - self._baseline_traced) / 1024 / 1024,
+            'qt_objects': sum(counts.values()),
+            'qt_growth': [(name, n) for name, n in qt_growth.most_common(self.top) if n > 0],
+            'top_sites': sites
+        }
+        self.last_report = report
+        self._write_report(report)
+
+        over_budget = max(report['rss_growth_mb'], report['traced_growth_mb']) > self.budget_mb
+        if over_budget and not self._exceeded:
+            self._exceeded = True
+            self.log(f"超出内存预算 {self.budget_mb:.0f} MB，请求软重启")
+            self.budget_exceeded.emit(report)
+        return report
+
+    def _write_report(self, report: Dict[str, Any]):
+        lines = [f"RSS {report['rss_mb']:.1f} MB ({report['rss_growth_mb']:+.1f}), "
+                 f"Python分配 {report['traced_mb']:.1f} MB ({report['traced_growth_mb']:+.1f}), "
+                 f"Qt对象 {report['qt_objects']}"]
+        if report['qt_growth']:
+            lines.append("  Qt对象增长: " + ", ".join(f"{name} +{n}" for name, n in report['qt_growth']))
+        for site, size_kb, count in report['top_sites']:
+            lines.append(f"  {size_kb:+10.1f} KB {count:+7d} 个  {site}")
+        self.log("\n".join(lines))
+
+    def log(self, text: str):
+        """写入一行带时间的日志（未设置日志路径时忽略）"""
+        if not self.log_path:
+            return
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(f"[{datetime.now().isoformat(timespec='seconds')}] {text}\n")
+        except OSError as e:
+            print(f"写入内存日志失败: {e}")
+
+
+def _close_modal_dialog():
+    """关闭当前模态对话框（离屏浸泡测试用）"""
+    dialog = QApplication.activeModalWidget()
+    if dialog is not None:
+        dialog.reject()
+    else:
+        QTimer.singleShot(10, _close_modal_dialog)
+
+
+def soak_test(runs: int = 500, charts: bool = True, report_every: int = 100) -> List[Dict[str, Any]]:
+    """离屏反复弹出结果对话框（与统计图表），每 report_every 轮检查一次内存"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtCore import QEvent
+    from safe_test import ReactionTestApp
+
+    # 保持对应用对象的引用，测试期间不能被回收
+    app = QApplication.instance() or QApplication([])
+    reports = []
+    old_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            window = ReactionTestApp()
+            window.memory_watchdog.stop()
+            watchdog = MemoryWatchdog(log_path=None)
+
+            # 统计图表需要历史记录
+            window.user_id_input.setText('soak')
+            for i in range(5):
+                window.db_manager.save_test_statistics({
+                    'user_id': 'soak', 'test_type': 'simple', 'stimulus_type': 'color',
+                    'avg_reaction_time': 300.0 + i, 'std_reaction_time': 30.0, 'min_reaction_time': 250.0,
+                    'max_reaction_time': 380.0, 'accuracy_rate': 95.0, 'total_trials': 10,
+                    'test_date': f'2025-01-0{i + 1}'})
+            statistics = {'average': 320.0, 'min': 250.0, 'max': 380.0, 'accuracy': 95.0}
+
+            def one_run():
+                QTimer.singleShot(0, _close_modal_dialog)
+                window.show_result_dialog(statistics)
+                if charts:
+                    QTimer.singleShot(0, _close_modal_dialog)
+                    window.generate_chart()
+                app.sendPostedEvents(None, QEvent.Type.DeferredDelete.value)
+
+            # 预热（首次绘图会加载字体等）后建立基线
+            for _ in range(5):
+                one_run()
+            watchdog.start()
+            start = time.perf_counter()
+            for run in range(1, runs + 1):
+                one_run()
+                if run % report_every == 0 or run == runs:
+                    report = watchdog.check()
+                    report['run'] = run
+                    reports.append(report)
+                    print(f"第 {run:5d} 轮: RSS {report['rss_mb']:.1f} MB ({report['rss_growth_mb']:+.1f}), "
+                          f"Python分配 {report['traced_growth_mb']:+.2f} MB, Qt对象 {report['qt_objects']}"
+                          f"{'  增长: ' + ', '.join(f'{n} +{c}' for n, c in report['qt_growth'][:3]) if report['qt_growth'] else ''}")
+            print(f"耗时 {time.perf_counter() - start:.1f} 秒")
+            watchdog.stop()
+            window.input_bridge.stop()
+        finally:
+            os.chdir(old_cwd)
+    return reports
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="内存看门狗浸泡测试")
+    parser.add_argument('--runs', type=int, default=500, help="弹出结果对话框的轮数")
+    parser.add_argument('--no-charts', action='store_true', help="不生成统计图表")
+    parser.add_argument('--report-every', type=int, default=100, help="每多少轮检查一次")
+    args = parser.parse_args()
+
+    soak_test(args.runs, not args.no_charts, args.report_every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+反应时分布模型拟合
+对每个 用户 × 测试类型 × 刺激类型 单元拟合：
+- 指数高斯分布（ex-Gaussian）: mu / sigma / tau
+- EZ漂移扩散模型: 漂移率 / 边界间距 / 非决策时间
+单元按用户分块从数据库读出，分发到进程池；以单元试次集哈希做缓存，未变化的单元跳过，
+结果写入 model_parameters 表
+
+用法: python model_fitting.py --db reaction_test.db [--user U001] [--workers 4] [--force]
+"""
+
+import argparse
+import hashlib
+import math
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from scipy import optimize, special
+except ImportError:  # scipy为可选依赖，缺失时仅使用矩估计
+    optimize = special = None
+
+from db_maintenance import merge_ordered, open_partitions
+
+TIMEOUT_MS = 3000
+
+# EZ扩散模型的尺度参数（惯例取0.1）
+EZ_SCALE = 0.1
+
+# 单元至少需要的有效反应数
+MIN_TRIALS = 10
+
+# 每次读取的用户数（一块的试次读完后才开始拟合，读事务不跨越拟合与写入）
+USER_CHUNK = 50
+
+MODEL_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS model_parameters (
+        model_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        test_type TEXT,
+        stimulus_type TEXT,
+        trial_hash TEXT,
+        n_trials INTEGER,
+        n_valid INTEGER,
+        exg_mu REAL,
+        exg_sigma REAL,
+        exg_tau REAL,
+        exg_method TEXT,
+        ddm_drift REAL,
+        ddm_boundary REAL,
+        ddm_ndt REAL,
+        fitted_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, test_type, stimulus_type),
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    )
+'''
+
+MODEL_COLUMNS = [
+    'user_id', 'test_type', 'stimulus_type', 'trial_hash', 'n_trials', 'n_valid',
+    'exg_mu', 'exg_sigma', 'exg_tau', 'exg_method',
+    'ddm_drift', 'ddm_boundary', 'ddm_ndt'
+]
+
+
+def fit_ex_gaussian(rts: np.ndarray) -> Dict[str, Any]:
+    """拟合指数高斯分布（单位ms）
+
+    先用矩估计得到初值，有scipy时再做极大似然优化。
+    """
+    mean = rts.mean()
+    std = rts.std(ddof=1)
+    skew = float(np.mean((rts - mean) ** 3) / std ** 3) if std > 0 else 0.0
+
+    # 矩估计：偏度决定tau，偏度过小或为负时取一个小的正值
+    tau = std * (max(skew, 0.01) / 2) ** (1 / 3)
+    tau = min(tau, 0.9 * std)
+    sigma = math.sqrt(max(std ** 2 - tau ** 2, 1e-6))
+    mu = mean - tau
+    method = 'moments'
+
+    if optimize is not None:
+        def neg_log_likelihood(params):
+            m, log_s, log_t = params
+            s, t = math.exp(log_s), math.exp(log_t)
+            z = (rts - m) / s - s / t
+            log_pdf = -math.log(t) + (m - rts) / t + s ** 2 / (2 * t ** 2) + special.log_ndtr(z)
+            return -np.sum(log_pdf)
+
+        result = optimize.minimize(neg_log_likelihood, [mu, math.log(sigma), math.log(tau)],
+                                   method='Nelder-Mead', options={'maxiter': 2000, 'xatol': 1e-3})
+        if result.success:
+            mu, sigma, tau = result.x[0], math.exp(result.x[1]), math.exp(result.x[2])
+            method = 'mle'
+
+    return {'exg_mu': float(mu), 'exg_sigma': float(sigma), 'exg_tau': float(tau), 'exg_method': method}
+
+
+def fit_ez_diffusion(accuracy: float, n_trials: int, correct_rts: np.ndarray) -> Dict[str, Optional[float]]:
+    """EZ漂移扩散模型（Wagenmakers等, 2007），非决策时间以ms返回"""
+    # 正确率为0、0.5或1时做边缘校正
+    pc = accuracy
+    if pc >= 1.0:
+        pc = 1 - 1 / (2 * n_trials)
+    elif pc <= 0.0:
+        pc = 1 / (2 * n_trials)
+    if pc == 0.5:
+        pc = 0.5 + 1 / (2 * n_trials)
+
+    mrt = correct_rts.mean() / 1000
+    vrt = correct_rts.var(ddof=1) / 1000 ** 2
+    if vrt <= 0:
+        return {'ddm_drift': None, 'ddm_boundary': None, 'ddm_ndt': None}
+
+    s2 = EZ_SCALE ** 2
+    logit = math.log(pc / (1 - pc))
+    x = logit * (logit * pc ** 2 - logit * pc + pc - 0.5) / vrt
+    drift = math.copysign(1, pc - 0.5) * EZ_SCALE * x ** 0.25
+    boundary = s2 * logit / drift
+    y = -drift * boundary / s2
+    mdt = (boundary / (2 * drift)) * (1 - math.exp(y)) / (1 + math.exp(y))
+
+    return {'ddm_drift': drift, 'ddm_boundary': boundary, 'ddm_ndt': (mrt - mdt) * 1000}
+
+
+def fit_cell(cell: Dict[str, Any]) -> Dict[str, Any]:
+    """进程池任务：拟合单个单元"""
+    rts, correct, valid = cell['rts'], cell['correct'], cell['valid']
+    valid_rts = rts[valid & correct]
+
+    result = {key: cell[key] for key in ('user_id', 'test_type', 'stimulus_type', 'trial_hash')}
+    result.update({
+        'n_trials': int(len(rts)),
+        'n_valid': int(len(valid_rts)),
+        'exg_mu': None, 'exg_sigma': None, 'exg_tau': None, 'exg_method': None,
+        'ddm_drift': None, 'ddm_boundary': None, 'ddm_ndt': None
+    })
+
+    if len(valid_rts) >= MIN_TRIALS:
+        result.update(fit_ex_gaussian(valid_rts))
+        result.update(fit_ez_diffusion(float(correct.mean()), len(rts), valid_rts))
+
+    return result
+
+
+def trial_set_hash(record_ids: np.ndarray, rts: np.ndarray, correct: np.ndarray, valid: np.ndarray) -> str:
+    """单元试次集哈希，任何试次增删改都会改变哈希"""
+    digest = hashlib.sha1()
+    for array in (record_ids, rts, correct, valid):
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def iter_cells(conn: sqlite3.Connection, user_ids: Optional[List[str]] = None,
+               partitions: Sequence[sqlite3.Connection] = ()) -> Iterator[Dict[str, Any]]:
+    """按单元顺序流式读取试次（合并主库与各月分区），每次只在内存中保留一个单元"""
+    sql = '''
+        SELECT user_id, test_type, stimulus_type, record_id, reaction_time, is_correct, qc_label
+        FROM test_records
+    '''
+    params: Tuple = ()
+    if user_ids:
+        sql += f" WHERE user_id IN ({','.join('?' * len(user_ids))})"
+        params = tuple(user_ids)
+    sql += " ORDER BY user_id, test_type, stimulus_type, record_id"
+
+    def build(key, ids, rts, correct, valid):
+        arrays = (np.asarray(ids, dtype=np.int64), np.asarray(rts, dtype=np.float64),
+                  np.asarray(correct, dtype=bool), np.asarray(valid, dtype=bool))
+        return {
+            'user_id': key[0], 'test_type': key[1], 'stimulus_type': key[2],
+            'rts': arrays[1], 'correct': arrays[2], 'valid': arrays[3],
+            'trial_hash': trial_set_hash(*arrays)
+        }
+
+    current_key = None
+    ids, rts, correct, valid = [], [], [], []
+    # 各数据源都按 (单元, record_id) 排序，合并后单元与试次集哈希与数据所在位置无关
+    rows = merge_ordered([source.execute(sql, params) for source in (conn, *partitions)], 4)
+    for user_id, test_type, stimulus_type, record_id, rt, is_correct, qc_label in rows:
+        key = (user_id, test_type, stimulus_type)
+        if key != current_key:
+            if current_key is not None:
+                yield build(current_key, ids, rts, correct, valid)
+            current_key = key
+            ids, rts, correct, valid = [], [], [], []
+
+        ids.append(record_id)
+        rts.append(rt if rt is not None else TIMEOUT_MS)
+        correct.append(bool(is_correct))
+        # 旧记录没有质量控制标签时退回到超时判断
+        if qc_label is None:
+            valid.append(rt is not None and rt < TIMEOUT_MS)
+        else:
+            valid.append(qc_label == 'valid')
+
+    if current_key is not None:
+        yield build(current_key, ids, rts, correct, valid)
+
+
+def list_user_ids(conn: sqlite3.Connection, partitions: Sequence[sqlite3.Connection] = ()) -> List[str]:
+    """有试次记录的全部用户（合并主库与各月分区），按 user_id 排序"""
+    user_ids = set()
+    for source in (conn, *partitions):
+        user_ids.update(row[0] for row in source.execute('SELECT DISTINCT user_id FROM test_records'))
+    return sorted(user_ids, key=lambda user_id: (user_id is not None, user_id))
+
+
+def load_cached_hashes(conn: sqlite3.Connection) -> Dict[Tuple[str, str, str], str]:
+    """读取已拟合单元的试次集哈希"""
+    return {
+        (user_id, test_type, stimulus_type): trial_hash
+        for user_id, test_type, stimulus_type, trial_hash in conn.execute(
+            'SELECT user_id, test_type, stimulus_type, trial_hash FROM model_parameters')
+    }
+
+
+def save_model_rows(conn: sqlite3.Connection, rows: List[Dict[str, Any]]):
+    """写入拟合结果（同一单元覆盖旧结果）"""
+    placeholders = ', '.join('?' * len(MODEL_COLUMNS))
+    conn.executemany(
+        f"INSERT OR REPLACE INTO model_parameters ({', '.join(MODEL_COLUMNS)}) VALUES ({placeholders})",
+        [tuple(row[col] for col in MODEL_COLUMNS) for row in rows]
+    )
+    conn.commit()
+
+
+def run_fitting_job(db_path: str, user_ids: Optional[List[str]] = None,
+                    workers: Optional[int] = None, force: bool = False,
+                    chunk_users: int = USER_CHUNK) -> Dict[str, Any]:
+    """执行模型拟合任务，返回运行摘要
+
+    先取得用户列表，再按用户分块：每块的试次一次读完（读事务随即结束，不阻塞其他进程的写入），
+    拟合后立即提交该块结果，中断的任务重新运行时已提交的单元按哈希跳过
+    """
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute(MODEL_TABLE_SQL)
+    conn.commit()
+
+    cached = {} if force else load_cached_hashes(conn)
+    read_conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    partitions = open_partitions(db_path)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    # 限制在途任务数，避免一块内的单元一次性堆积在进程池队列中
+    max_in_flight = workers * 4
+
+    skipped = 0
+    fitted = 0
+    try:
+        users = sorted(set(user_ids)) if user_ids else list_user_ids(read_conn, partitions)
+        for offset in range(0, len(users), chunk_users):
+            cells = []
+            for cell in iter_cells(read_conn, users[offset:offset + chunk_users], partitions):
+                key = (cell['user_id'], cell['test_type'], cell['stimulus_type'])
+                if cached.get(key) == cell['trial_hash']:
+                    skipped += 1
+                    continue
+                cells.append(cell)
+
+            if executor is None:
+                rows = [fit_cell(cell) for cell in cells]
+            else:
+                rows = []
+                in_flight = set()
+                for cell in cells:
+                    in_flight.add(executor.submit(fit_cell, cell))
+                    if len(in_flight) >= max_in_flight:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        rows.extend(future.result() for future in done)
+                done, _ = wait(in_flight)
+                rows.extend(future.result() for future in done)
+
+            if rows:
+                save_model_rows(conn, rows)
+                fitted += len(rows)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        for source in (read_conn, *partitions):
+            source.close()
+        conn.close()
+
+    return {
+        'fitted': fitted,
+        'skipped': skipped,
+        'workers': workers,
+        'elapsed_seconds': time.perf_counter() - start
+    }
+
+
+def get_model_parameters(db_path: str, user_id: str) -> List[Dict[str, Any]]:
+    """获取用户的模型参数"""
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        conn.execute(MODEL_TABLE_SQL)
+        rows = conn.execute('''
+            SELECT * FROM model_parameters
+            WHERE user_id = ?
+            ORDER BY test_type, stimulus_type
+        ''', (user_id,)).fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+    except Exception as e:
+        print(f"获取模型参数失败: {e}")
+        return []
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="拟合反应时分布模型（ex-Gaussian / EZ扩散模型）")
+    parser.add_argument('--db', default='reaction_test.db', help="数据库路径")
+    parser.add_argument('--user', action='append', dest='users', help="只拟合指定用户（可重复）")
+    parser.add_argument('--workers', type=int, default=None, help="进程数（默认CPU核数）")
+    parser.add_argument('--force', action='store_true', help="忽略缓存，全部重新拟合")
+    args = parser.parse_args()
+
+    summary = run_fitting_job(args.db, user_ids=args.users, workers=args.workers, force=args.force)
+    print(f"完成: 拟合 {summary['fitted']} 个单元, 跳过未变化单元 {summary['skipped']} 个, "
+          f"{summary['workers']} 个进程, 耗时 {summary['elapsed_seconds']:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
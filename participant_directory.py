@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+参与者目录：按用户ID、姓名、职业前缀查找参与者（输入联想）
+participant_terms 表保存每个参与者的检索词（小写的ID、姓名、职业以及多词姓名的后续词），
+主键 (term, user_id) 即前缀索引，查找为一次B树范围扫描；用户表上的触发器负责同步，
+其他脚本直接写入用户表也会被索引。
+
+分页采用键集方式：结果按 (检索词, user_id) 排序，下一页从上一页最后一行之后开始，
+同一参与者只出现在其排序最靠前的匹配词下，翻页不会重复。
+
+用法: python participant_directory.py --db reaction_test.db --search 张
+      python participant_directory.py --benchmark --users 1000000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from schema_migration import is_normalized
+
+# 检索词表达式（{row} 为触发器中的 NEW. 前缀，重建索引时为空）
+# SQLite 的 lower() 只转换ASCII字母，查询词用 fold_term() 做同样的处理
+_TERM_EXPRESSIONS = (
+    "lower({row}user_id)",
+    "lower(trim({row}name))",
+    "lower(trim({row}occupation))",
+    # 多词姓名（如英文名）也可以按后面的词查找
+    "CASE WHEN instr(trim({row}name), ' ') > 0 "
+    "THEN lower(trim(substr(trim({row}name), instr(trim({row}name), ' ') + 1))) END",
+)
+
+TERMS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS participant_terms (
+        term TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        PRIMARY KEY (term, user_id)
+    ) WITHOUT ROWID
+'''
+
+# 触发器删除旧检索词与跨页去重都按参与者查找
+TERMS_USER_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_participant_terms_user
+    ON participant_terms (user_id, term)
+'''
+
+TRIGGER_NAMES = ('participant_terms_insert', 'participant_terms_update', 'participant_terms_delete')
+
+# 查询词之后最大的码位，用作前缀范围的上界
+_PREFIX_END = '\U0010ffff'
+
+
+def fold_term(text: str) -> str:
+    """与 SQLite lower() 一致的大小写折叠（只处理ASCII）"""
+    return ''.join(c.lower() if c.isascii() else c for c in text.strip())
+
+
+def _terms_select(row: str, source: Optional[str] = None) -> str:
+    """各检索词表达式的 UNION ALL（source 为重建索引时读取的表）"""
+    tail = f", user_id FROM {source}" if source else ''
+    return ' UNION ALL '.join(f"SELECT {expr.format(row=row)} AS term{tail}" for expr in _TERM_EXPRESSIONS)
+
+
+class ParticipantDirectory:
+    """参与者目录（只读查询共用一个连接）"""
+
+    def __init__(self, db_path: str = "reaction_test.db", read_only: bool = False):
+        self.db_path = db_path
+        self.read_only = read_only
+        self._conn: Optional[sqlite3.Connection] = None
+        self._base = 'users'
+        self.lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.read_only:
+                self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._base = self.base_table(self._conn)
+        return self._conn
+
+    def close(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def base_table(conn: sqlite3.Connection) -> str:
+        """参与者信息所在的表（规范化结构中 users 是视图，触发器需建在 participants 上）"""
+        return 'participants' if is_normalized(conn) else 'users'
+
+    def ensure_index(self, conn: Optional[sqlite3.Connection] = None) -> bool:
+        """创建检索词表与同步触发器；触发器缺失时（新建或刚迁移）重建索引，返回是否重建"""
+        own = conn is None
+        if own:
+            conn = sqlite3.connect(self.db_path)
+        try:
+            base = self.base_table(conn)
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (base,)).fetchone() is None:
+                return False
+            existing = {row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (base,))}
+            if all(name in existing for name in TRIGGER_NAMES):
+                return False
+
+            with conn:
+                conn.execute(TERMS_TABLE_SQL)
+                conn.execute(TERMS_USER_INDEX_SQL)
+                # 最近用户列表按创建时间倒序
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{base}_created ON {base} (created_time)")
+                for name in TRIGGER_NAMES:
+                    conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                insert_terms = f'''
+                    INSERT OR IGNORE INTO participant_terms (term, user_id)
+                    SELECT term, NEW.user_id FROM ({_terms_select('NEW.')})
+                    WHERE term IS NOT NULL AND term <> '';
+                '''
+                # INSERT OR REPLACE 替换旧行时不触发删除触发器，插入触发器先清掉旧检索词
+                conn.execute(f'''
+                    CREATE TRIGGER participant_terms_insert AFTER INSERT ON {base}
+                    BEGIN
+                        DELETE FROM participant_terms WHERE user_id = NEW.user_id;
+                        {insert_terms}
+                    END
+                ''')
+                conn.execute(f'''
+                    CREATE TRIGGER participant_terms_update
+                    AFTER UPDATE OF user_id, name, occupation ON {base}
+                    BEGIN
+                        DELETE FROM participant_terms WHERE user_id = OLD.user_id;
+                        {insert_terms}
+                    END
+                ''')
+                conn.execute(f'''
+                    CREATE TRIGGER participant_terms_delete AFTER DELETE ON {base}
+                    BEGIN
+                        DELETE FROM participant_terms WHERE user_id = OLD.user_id;
+                    END
+                ''')
+                conn.execute("DELETE FROM participant_terms")
+                conn.execute(f'''
+                    INSERT OR IGNORE INTO participant_terms (term, user_id)
+                    SELECT term, user_id FROM ({_terms_select('', base)})
+                    WHERE user_id IS NOT NULL AND term IS NOT NULL AND term <> ''
+                ''')
+            return True
+        finally:
+            if own:
+                conn.close()
+
+    def search(self, query: str, after: Optional[Tuple[str, str]] = None,
+               limit: int = 20) -> List[Dict[str, Any]]:
+        """按前缀查找参与者
+
+        after为上一页最后一行的 (match, user_id)，为None时取第一页；
+        每行包含参与者信息和匹配到的检索词 match。
+        """
+        prefix = fold_term(query)
+        if not prefix:
+            return []
+
+        params = {'low': prefix, 'high': prefix + _PREFIX_END, 'limit': limit}
+        keyset = ''
+        if after is not None:
+            keyset = 'AND (t.term, t.user_id) > (:after_term, :after_user)'
+            params['after_term'], params['after_user'] = after
+
+        with self.lock:
+            conn = self._connection()
+            base = self._base
+            try:
+                rows = conn.execute(f'''
+                    SELECT t.term AS match, b.user_id, b.name, b.age, b.gender, b.occupation
+                    FROM participant_terms t
+                    JOIN {base} b ON b.user_id = t.user_id
+                    WHERE t.term >= :low AND t.term < :high {keyset}
+                      AND NOT EXISTS (
+                          SELECT 1 FROM participant_terms e
+                          WHERE e.user_id = t.user_id AND e.term >= :low AND e.term < t.term)
+                    ORDER BY t.term, t.user_id
+                    LIMIT :limit
+                ''', params).fetchall()
+            except sqlite3.Error as e:
+                print(f"查找参与者失败: {e}")
+                return []
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def next_cursor(rows: List[Dict[str, Any]]) -> Optional[Tuple[str, str]]:
+        """下一页的键集位置"""
+        return (rows[-1]['match'], rows[-1]['user_id']) if rows else None
+
+    def browse(self, after: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """按 user_id 顺序键集分页列出全部参与者（after为上一页最后一个 user_id）"""
+        with self.lock:
+            conn = self._connection()
+            try:
+                rows = conn.execute(f'''
+                    SELECT user_id, name, age, gender, occupation FROM {self._base}
+                    WHERE user_id > ?
+                    ORDER BY user_id
+                    LIMIT ?
+                ''', (after if after is not None else '', limit)).fetchall()
+            except sqlite3.Error as e:
+                print(f"列出参与者失败: {e}")
+                return []
+        return [dict(row) for row in rows]
+
+    def recent(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """最近登记的参与者"""
+        with self.lock:
+            conn = self._connection()
+            base = self._base
+            try:
+                rows = conn.execute(f'''
+                    SELECT user_id, name, age, gender, occupation FROM {base}
+                    ORDER BY created_time DESC
+                    LIMIT ?
+                ''', (limit,)).fetchall()
+            except sqlite3.Error as e:
+                print(f"获取最近参与者失败: {e}")
+                return []
+        return [dict(row) for row in rows]
+
+
+def run_benchmark(users: int = 1000000, queries: int = 2000, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """生成大量参与者，统计前缀查找与翻页的耗时（微秒）"""
+    from storage import DatabaseManager
+
+    rng = random.Random(seed)
+    surnames = list('王李张刘陈杨赵黄周吴徐孙胡朱高林何郭马罗')
+    given = list('伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂')
+    occupations = ['学生', '教师', '工程师', '医生', '护士', '程序员', '司机', '会计', 'student', 'designer']
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_path = os.path.join(work_dir, 'directory.db')
+        manager = DatabaseManager(db_path)
+
+        start = time.perf_counter()
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.executemany(
+                "INSERT INTO users (user_id, name, age, gender, occupation) VALUES (?, ?, ?, ?, ?)",
+                ((f"user_{1700000000 + i}",
+                  rng.choice(surnames) + ''.join(rng.choice(given) for _ in range(rng.randint(1, 2))),
+                  rng.randint(18, 70), rng.choice(['男', '女']), rng.choice(occupations))
+                 for i in range(users)))
+        conn.close()
+        print(f"写入 {users} 个参与者（含触发器维护索引）: {time.perf_counter() - start:.1f} 秒")
+
+        directory = manager.directory
+        prefixes = {
+            'id': lambda: f"user_{1700000000 + rng.randrange(users)}"[:rng.randint(9, 13)],
+            'surname': lambda: rng.choice(surnames),
+            'name': lambda: rng.choice(surnames) + rng.choice(given),
+            'occupation': lambda: rng.choice(occupations)[:2]
+        }
+        for name, make in prefixes.items():
+            first, nxt = [], []
+            for _ in range(queries):
+                query = make()
+                t0 = time.perf_counter()
+                rows = directory.search(query, limit=20)
+                t1 = time.perf_counter()
+                directory.search(query, after=directory.next_cursor(rows), limit=20)
+                t2 = time.perf_counter()
+                first.append((t1 - t0) * 1e6)
+                nxt.append((t2 - t1) * 1e6)
+            for label, samples in (('首页', first), ('翻页', nxt)):
+                samples.sort()
+                results[f"{name}.{label}"] = {
+                    'median_us': statistics.median(samples),
+                    'p99_us': samples[int(len(samples) * 0.99) - 1]
+                }
+
+        samples = []
+        for _ in range(queries):
+            t0 = time.perf_counter()
+            directory.recent(5)
+            samples.append((time.perf_counter() - t0) * 1e6)
+        samples.sort()
+        results['recent'] = {'median_us': statistics.median(samples), 'p99_us': samples[int(len(samples) * 0.99) - 1]}
+        directory.close()
+    return results
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="参与者目录查找")
+    parser.add_argument('--db', default='reaction_test.db', help="数据库文件")
+    parser.add_argument('--search', help="按前缀查找参与者")
+    parser.add_argument('--limit', type=int, default=20, help="每页条数")
+    parser.add_argument('--rebuild', action='store_true', help="重建检索索引")
+    parser.add_argument('--benchmark', action='store_true', help="运行性能测试")
+    parser.add_argument('--users', type=int, default=1000000, help="性能测试的参与者数")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for name, result in run_benchmark(args.users).items():
+            print(f"{name:16s} 中位数 {result['median_us']:8.1f} us   P99 {result['p99_us']:8.1f} us")
+        return
+
+    directory = ParticipantDirectory(args.db)
+    if args.rebuild:
+        conn = sqlite3.connect(args.db)
+        with conn:
+            for name in TRIGGER_NAMES:
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.close()
+    if directory.ensure_index():
+        print("已重建检索索引")
+
+    rows = directory.search(args.search, limit=args.limit) if args.search else directory.recent(args.limit)
+    for row in rows:
+        print(f"{row['user_id']:24s} {row['name'] or '':12s} {row['occupation'] or ''}")
+    directory.close()
+
+
+if __name__ == "__main__":
+    main()
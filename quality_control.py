@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+试次质量控制模块
+在反应记录路径中实时对每个试次分类：预期反应、有效、慢速离群（注意力失误）、超时
+桌面端与Web端共用，不依赖Qt/Streamlit
+
+用法: python quality_control.py   # 运行离群阈值自检
+"""
+
+import bisect
+import sys
+from collections import deque
+from typing import Dict, List, Optional
+
+# 试次分类标签
+QC_ANTICIPATION = 'anticipation'
+QC_VALID = 'valid'
+QC_SLOW_OUTLIER = 'slow_outlier'
+QC_TIMEOUT = 'timeout'
+
+QC_LABELS = (QC_ANTICIPATION, QC_VALID, QC_SLOW_OUTLIER, QC_TIMEOUT)
+
+# MAD换算为正态标准差的比例系数
+MAD_SCALE = 1.4826
+
+# 离散度下限（ms）：反应时几乎相同时MAD/IQR趋近0，阈值会贴着中位数
+MIN_SPREAD_MS = 1.0
+
+# 慢速离群阈值至少高出中位数的幅度（ms），避免窄窗口下把正常波动判为注意力失误
+MIN_MARGIN_MS = 50.0
+
+
+class TrialQualityFilter:
+    """流式试次质量过滤器
+
+    维护最近有效反应时的滑动窗口（有序），每个试次到达时在线更新
+    中位数/MAD或四分位距，据此判断慢速离群，无需事后遍历整轮数据。
+    """
+
+    def __init__(self, anticipation_ms: float = 100.0, timeout_ms: float = 3000.0,
+                 method: str = "mad", threshold: float = 3.0, window_size: int = 50,
+                 min_samples: int = 5, requeue_invalid: bool = False, max_requeues: int = 5,
+                 min_spread_ms: float = MIN_SPREAD_MS, min_margin_ms: float = MIN_MARGIN_MS):
+        if method not in ("mad", "iqr"):
+            raise ValueError(f"未知的离群判定方法: {method}")
+
+        self.anticipation_ms = anticipation_ms
+        self.timeout_ms = timeout_ms
+        self.method = method
+        # MAD法为稳健z分数阈值，IQR法为Q3之上的IQR倍数
+        self.threshold = threshold
+        self.window_size = window_size
+        self.min_samples = min_samples
+        self.requeue_invalid = requeue_invalid
+        self.max_requeues = max_requeues
+        self.min_spread_ms = min_spread_ms
+        self.min_margin_ms = min_margin_ms
+
+        self.reset()
+
+    def reset(self):
+        """重置过滤器状态（每轮测试开始时调用）"""
+        self._window = deque()
+        self._sorted = []
+        self.counts = {label: 0 for label in QC_LABELS}
+        self.requeue_count = 0
+
+    def classify(self, reaction_time: Optional[float]) -> str:
+        """对单个试次分类，reaction_time为None表示无反应"""
+        if reaction_time is None or reaction_time >= self.timeout_ms:
+            label = QC_TIMEOUT
+        elif reaction_time < self.anticipation_ms:
+            label = QC_ANTICIPATION
+        elif self._is_slow_outlier(reaction_time):
+            label = QC_SLOW_OUTLIER
+        else:
+            label = QC_VALID
+            self._push(reaction_time)
+
+        self.counts[label] += 1
+        return label
+
+    def should_requeue(self, label: str) -> bool:
+        """判断无效试次是否需要重测（会占用一次重测额度）"""
+        if not self.requeue_invalid or label == QC_VALID:
+            return False
+        if self.requeue_count >= self.max_requeues:
+            return False
+
+        self.requeue_count += 1
+        return True
+
+    def median(self) -> Optional[float]:
+        """当前窗口中位数"""
+        return self._quantile(self._sorted, 0.5)
+
+    def mad(self) -> Optional[float]:
+        """当前窗口中位数绝对偏差"""
+        median = self.median()
+        if median is None:
+            return None
+        deviations = sorted(abs(rt - median) for rt in self._sorted)
+        return self._quantile(deviations, 0.5)
+
+    def upper_bound(self) -> Optional[float]:
+        """当前慢速离群判定阈值（样本不足时为None）
+
+        离散度不低于 min_spread_ms，阈值不低于中位数 + min_margin_ms。
+        """
+        if len(self._sorted) < self.min_samples:
+            return None
+
+        median = self.median()
+        if self.method == "mad":
+            spread = max(self.mad(), self.min_spread_ms)
+            bound = median + self.threshold * MAD_SCALE * spread
+        else:
+            q1 = self._quantile(self._sorted, 0.25)
+            q3 = self._quantile(self._sorted, 0.75)
+            bound = q3 + self.threshold * max(q3 - q1, self.min_spread_ms)
+        return max(bound, median + self.min_margin_ms)
+
+    def summary(self) -> Dict[str, int]:
+        """各分类计数"""
+        return dict(self.counts)
+
+    def _is_slow_outlier(self, reaction_time: float) -> bool:
+        bound = self.upper_bound()
+        return bound is not None and reaction_time > bound
+
+    def _push(self, reaction_time: float):
+        """加入有效反应时，超出窗口时淘汰最旧样本"""
+        self._window.append(reaction_time)
+        bisect.insort(self._sorted, reaction_time)
+
+        if len(self._window) > self.window_size:
+            oldest = self._window.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+
+    @staticmethod
+    def _quantile(sorted_values: List[float], q: float) -> Optional[float]:
+        """有序序列线性插值分位数"""
+        if not sorted_values:
+            return None
+        pos = (len(sorted_values) - 1) * q
+        lower = int(pos)
+        upper = min(lower + 1, len(sorted_values) - 1)
+        frac = pos - lower
+        return sorted_values[lower] * (1 - frac) + sorted_values[upper] * frac
+
+
+def _check_tight_window() -> List[str]:
+    """窄窗口自检：300±2 ms 的稳定反应不应把略慢的正常反应判为离群"""
+    problems = []
+    for method in ("mad", "iqr"):
+        qc = TrialQualityFilter(method=method)
+        for i in range(50):
+            qc.classify(298.0 + (i % 5))
+        bound = qc.upper_bound()
+        if bound is None or bound < 300.0 + MIN_MARGIN_MS:
+            problems.append(f"{method}: 窄窗口阈值过低 ({bound})")
+        if qc.classify(320.0) != QC_VALID:
+            problems.append(f"{method}: 320 ms 被判为离群")
+        if qc.classify(900.0) != QC_SLOW_OUTLIER:
+            problems.append(f"{method}: 900 ms 未判为离群")
+
+        # 完全相同的反应时（MAD/IQR为0）仍需给出阈值
+        qc = TrialQualityFilter(method=method)
+        for _ in range(10):
+            qc.classify(300.0)
+        if qc.upper_bound() is None or qc.classify(301.0) != QC_VALID:
+            problems.append(f"{method}: 零离散度窗口未使用下限")
+    return problems
+
+
+def main():
+    """命令行入口：运行阈值自检"""
+    problems = _check_tight_window()
+    for problem in problems:
+        print(problem)
+    print("质量控制自检" + ("失败" if problems else "通过"))
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+只读本地查询接口
+外部分析工具通过HTTP读取用户、测试轮次、试次与汇总统计，不再直接打开数据库文件与写入方争锁。
+所有查询都走 DatabaseManager 的读路径（共享其查询缓存），每次请求只读取一页或一块，
+读事务很短；大批量试次以分块传输流式返回，块与块之间不持有读锁。
+
+接口（GET，默认JSON；?format=arrow 或 Accept: application/vnd.apache.arrow.stream 返回Arrow IPC流）:
+- /version                              当前写入版本号
+- /users?q=&after=&limit=               参与者（q为ID/姓名/职业前缀，不带q时按user_id顺序列出）
+- /users/<user_id>/runs?order_by=&desc=&after=&limit=   用户各轮统计结果
+- /trials?user_id=&test_type=&after=&limit=             试次记录
+- /trials/stream?user_id=&test_type=&after=             全部匹配试次（NDJSON或Arrow流式响应）
+- /aggregates?group_by=&user_id=&after=&limit=          按测试类型/刺激类型/用户/日期汇总
+
+分页为键集方式：响应中的 next（以及 X-Next-Cursor 头）原样作为下一次请求的 after。
+每个响应带 ETag（由写入版本号决定），请求带 If-None-Match 且数据未变化时返回304，轮询开销很小。
+其他进程写入时由 PRAGMA data_version 检测并递增写入版本号，同时使查询缓存失效。
+
+用法: python query_api.py --db reaction_test.db --port 8766
+"""
+
+import argparse
+import base64
+import io
+import json
+import re
+import secrets
+import sys
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow为可选依赖，缺失时只提供JSON
+    pa = None
+
+from storage import DatabaseManager
+
+DEFAULT_PORT = 8766
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+STREAM_CHUNK_SIZE = 5000
+
+ARROW_MIME = 'application/vnd.apache.arrow.stream'
+JSON_MIME = 'application/json'
+NDJSON_MIME = 'application/x-ndjson'
+
+_RUNS_PATH = re.compile(r'^/users/([^/]+)/runs$')
+
+
+def encode_cursor(position: Any) -> Optional[str]:
+    """键集位置 -> URL安全的游标字符串"""
+    if position is None:
+        return None
+    raw = json.dumps(position, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Any:
+    """游标字符串 -> 键集位置"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"无效的分页游标: {cursor}")
+
+
+def _is_scalar(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float))
+
+
+def pair_cursor(after: Any) -> Optional[Tuple[Any, Any]]:
+    """(排序键, 唯一键) 形式的游标（搜索与轮次分页），形状不符时抛出 ValueError"""
+    if after is None:
+        return None
+    if not isinstance(after, list) or len(after) != 2 or not all(_is_scalar(value) for value in after):
+        raise ValueError("分页游标与资源不匹配")
+    return tuple(after)
+
+
+def scalar_cursor(after: Any) -> Any:
+    """单值游标（按ID浏览、试次、汇总分页），形状不符时抛出 ValueError"""
+    if not _is_scalar(after):
+        raise ValueError("分页游标与资源不匹配")
+    return after
+
+
+class QueryService:
+    """查询接口的数据层：写入版本号跟踪与各资源的分页读取"""
+
+    def __init__(self, db_path: str = "reaction_test.db"):
+        # 只读打开已有数据库（不建表、不改设置与索引）；试次页较大，缓存条目数比界面少
+        self.db_manager = DatabaseManager(db_path, cache_size=32, read_only=True)
+        # 查询缓存不是线程安全的，各请求线程的数据库读取串行化（每次只读一页，持锁时间很短）
+        self.lock = threading.Lock()
+        # 服务实例标识：重启后版本号重新计数，旧ETag不能误判为未变化
+        self.instance = secrets.token_hex(4)
+
+    def close(self):
+        with self.lock:
+            self.db_manager.close()
+
+    def version(self) -> int:
+        """当前写入版本号（检测到其他连接提交时递增，并使查询缓存失效）"""
+        with self.lock:
+            return self.db_manager.check_external_writes()
+
+    def etag(self) -> str:
+        return f'"{self.instance}-{self.version()}"'
+
+    def users(self, query: Optional[str], after: Any, limit: int) -> Tuple[List[Dict[str, Any]], Any]:
+        directory = self.db_manager.directory
+        if query:
+            rows = directory.search(query, after=pair_cursor(after), limit=limit)
+            position = directory.next_cursor(rows)
+            position = list(position) if position else None
+        else:
+            rows = directory.browse(after=scalar_cursor(after), limit=limit)
+            position = rows[-1]['user_id'] if rows else None
+        return rows, position if len(rows) == limit else None
+
+    def runs(self, user_id: str, order_by: str, descending: bool, after: Any,
+             limit: int) -> Tuple[List[Dict[str, Any]], Any]:
+        if order_by not in DatabaseManager.HISTORY_SORT_COLUMNS:
+            raise ValueError(f"不支持的排序列: {order_by}")
+        with self.lock:
+            rows = self.db_manager.get_user_history_page(
+                user_id, order_by=order_by, descending=descending,
+                after=pair_cursor(after), limit=limit)
+        position = [rows[-1][order_by], rows[-1]['stat_id']] if rows else None
+        return rows, position if len(rows) == limit else None
+
+    def trials(self, user_id: Optional[str], test_type: Optional[str], after: Any,
+               limit: int) -> Tuple[List[Dict[str, Any]], Any]:
+        with self.lock:
+            rows = self.db_manager.get_trial_page(user_id, test_type, after=scalar_cursor(after), limit=limit)
+        position = rows[-1]['record_id'] if rows else None
+        return rows, position if len(rows) == limit else None
+
+    def trial_chunks(self, user_id: Optional[str], test_type: Optional[str], after: Any,
+                     chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """分块读取试次（每块读取完即释放锁，发送期间不占用数据库）"""
+        chunks = self.db_manager.iter_trial_chunks(user_id, test_type, after=after, chunk_size=chunk_size)
+        while True:
+            with self.lock:
+                rows = next(chunks, None)
+            if rows is None:
+                return
+            yield rows
+
+    def aggregates(self, group_by: str, user_id: Optional[str], after: Any,
+                   limit: int) -> Tuple[List[Dict[str, Any]], Any]:
+        with self.lock:
+            rows = self.db_manager.get_run_aggregates(group_by, user_id, after=scalar_cursor(after), limit=limit)
+        position = rows[-1][group_by] if rows else None
+        return rows, position if len(rows) == limit else None
+
+
+# 首块中全为空值的列无法推断类型，按列名补齐
+_ARROW_NULL_TYPES = {
+    'reaction_time': 'float64', 'latency_correction': 'float64', 'is_correct': 'int64',
+    'trial_index': 'int64', 'record_id': 'int64', 'stat_id': 'int64', 'age': 'int64'
+}
+
+
+def arrow_table(rows: List[Dict[str, Any]], schema=None):
+    """结果行 -> Arrow表（未给定表结构时推断，空值列按列名补齐类型）"""
+    if schema is None:
+        inferred = pa.Table.from_pylist(rows).schema
+        schema = pa.schema([
+            pa.field(field.name, getattr(pa, _ARROW_NULL_TYPES.get(field.name, 'string'))())
+            if pa.types.is_null(field.type) else field
+            for field in inferred
+        ])
+    return pa.Table.from_pylist(rows, schema=schema)
+
+
+def arrow_stream(chunks: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    """逐块转换为Arrow IPC流的字节片段（表结构由首块确定）"""
+    buffer = io.BytesIO()
+    writer = None
+    schema = None
+    for rows in chunks:
+        table = arrow_table(rows, schema)
+        if writer is None:
+            schema = table.schema
+            writer = pa.ipc.new_stream(buffer, schema)
+        writer.write_table(table)
+        yield _drain(buffer)
+    if writer is None:
+        # 没有任何行：只发送空的表结构
+        writer = pa.ipc.new_stream(buffer, pa.schema([]))
+    writer.close()
+    yield _drain(buffer)
+
+
+def _drain(buffer: io.BytesIO) -> bytes:
+    """取出已写入的字节并清空缓冲"""
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """HTTP请求处理（server.service 为 QueryService）"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ReactionTestQueryAPI/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        service: QueryService = self.server.service
+
+        try:
+            if url.path == '/version':
+                version = service.version()
+                self._send_json({'version': version, 'instance': service.instance}, None, etag=None)
+                return
+
+            etag = service.etag()
+            if etag in self._if_none_match():
+                self._send_not_modified(etag)
+                return
+
+            arrow = self._wants_arrow(params)
+            limit = self._limit(params)
+            after = decode_cursor(params.get('after'))
+            if url.path == '/users':
+                rows, position = service.users(params.get('q', '').strip(), after, limit)
+            elif _RUNS_PATH.match(url.path):
+                user_id = unquote(_RUNS_PATH.match(url.path).group(1))
+                descending = params.get('desc', '1') not in ('0', 'false', 'no')
+                rows, position = service.runs(user_id, params.get('order_by', 'test_date'), descending,
+                                              after, limit)
+            elif url.path == '/trials':
+                rows, position = service.trials(params.get('user_id'), params.get('test_type'), after, limit)
+            elif url.path == '/trials/stream':
+                # 生成器在发送响应头之后才开始执行，游标需事先校验
+                chunks = service.trial_chunks(params.get('user_id'), params.get('test_type'), scalar_cursor(after))
+                self._send_stream(chunks, arrow, etag)
+                return
+            elif url.path == '/aggregates':
+                rows, position = service.aggregates(params.get('group_by', 'test_type'), params.get('user_id'),
+                                                    after, limit)
+            else:
+                self._send_error(HTTPStatus.NOT_FOUND, f"未知的资源: {url.path}")
+                return
+        except ValueError as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+
+        if arrow:
+            self._send_arrow(rows, encode_cursor(position), etag)
+        else:
+            self._send_json({'items': rows, 'next': encode_cursor(position)}, encode_cursor(position), etag)
+
+    def _if_none_match(self) -> List[str]:
+        header = self.headers.get('If-None-Match', '')
+        return [tag.strip() for tag in header.split(',') if tag.strip()]
+
+    @staticmethod
+    def _limit(params: Dict[str, str]) -> int:
+        try:
+            limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ValueError(f"无效的 limit: {params.get('limit')}")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit 需在 1 到 {MAX_PAGE_SIZE} 之间")
+        return limit
+
+    def _wants_arrow(self, params: Dict[str, str]) -> bool:
+        wanted = params.get('format') == 'arrow' or ARROW_MIME in self.headers.get('Accept', '')
+        if wanted and pa is None:
+            raise ValueError("服务端未安装 pyarrow，只能返回JSON")
+        return wanted
+
+    def _send_headers(self, status: int, content_type: str, etag: Optional[str],
+                      length: Optional[int] = None, cursor: Optional[str] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if etag:
+            self.send_header('ETag', etag)
+            # 允许缓存，但每次使用前都要用 If-None-Match 验证
+            self.send_header('Cache-Control', 'no-cache')
+        if cursor:
+            self.send_header('X-Next-Cursor', cursor)
+        if length is None:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(length))
+        self.end_headers()
+
+    def _send_json(self, payload: Dict[str, Any], cursor: Optional[str], etag: Optional[str]):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self._send_headers(HTTPStatus.OK, f'{JSON_MIME}; charset=utf-8', etag, len(body), cursor)
+        self.wfile.write(body)
+
+    def _send_arrow(self, rows: List[Dict[str, Any]], cursor: Optional[str], etag: str):
+        body = b''.join(arrow_stream(iter([rows] if rows else [])))
+        self._send_headers(HTTPStatus.OK, ARROW_MIME, etag, len(body), cursor)
+        self.wfile.write(body)
+
+    def _send_stream(self, chunks: Iterator[List[Dict[str, Any]]], arrow: bool, etag: str):
+        if arrow:
+            content_type, pieces = ARROW_MIME, arrow_stream(chunks)
+        else:
+            content_type = f'{NDJSON_MIME}; charset=utf-8'
+            pieces = (''.join(json.dumps(row, ensure_ascii=False, default=str) + '\n' for row in rows).encode('utf-8')
+                      for rows in chunks)
+        self._send_headers(HTTPStatus.OK, content_type, etag)
+        try:
+            for piece in pieces:
+                if piece:
+                    self.wfile.write(f'{len(piece):X}\r\n'.encode('ascii') + piece + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开，剩余的块不再读取
+            self.close_connection = True
+
+    def _send_not_modified(self, etag: str):
+        self.send_response(HTTPStatus.NOT_MODIFIED)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _send_error(self, status: int, message: str):
+        body = json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+        self._send_headers(status, f'{JSON_MIME}; charset=utf-8', None, len(body))
+        self.wfile.write(body)
+
+
+class QueryServer(ThreadingHTTPServer):
+    """只读查询服务"""
+
+    daemon_threads = True
+
+    def __init__(self, db_path: str, host: str = '127.0.0.1', port: int = DEFAULT_PORT, verbose: bool = False):
+        self.service = QueryService(db_path)
+        self.verbose = verbose
+        super().__init__((host, port), QueryRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.service.close()
+
+
+def start_server_thread(db_path: str, host: str = '127.0.0.1', port: int = DEFAULT_PORT) -> QueryServer:
+    """在后台线程中启动查询服务（port为0时自动分配端口）"""
+    server = QueryServer(db_path, host, port)
+    threading.Thread(target=server.serve_forever, name='query-api', daemon=True).start()
+    return server
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="只读本地查询接口")
+    parser.add_argument('--db', default='reaction_test.db', help="数据库文件")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址（默认只允许本机访问）")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument('--verbose', action='store_true', help="输出访问日志")
+    args = parser.parse_args()
+
+    try:
+        server = QueryServer(args.db, args.host, args.port, args.verbose)
+    except FileNotFoundError as e:
+        print(f"启动失败: {e}")
+        sys.exit(1)
+    print(f"查询接口已启动: http://{args.host}:{server.server_address[1]}  (数据库 {args.db})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
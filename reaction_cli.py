@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+无界面命令行工具
+导出、图表、统计重算、完整性检查、合并、整理、定期维护、清除与基准测试，供夜间任务在无显示的服务器上运行。
+只导入存储层（storage.py）与分析模块，从不导入 PyQt6；pandas、matplotlib、pyarrow 等
+只在用到的子命令中导入，启动快、占用内存少。
+
+导出按键集分块读取（每块单独的短读事务），逐块写出，内存占用与数据量无关:
+    csv / ndjson / json   标准库写出，可输出到标准输出（--out -）
+    arrow / parquet       Arrow IPC流 / Parquet（需要 pyarrow）
+    xlsx                  openpyxl 只写模式，超过单表行数上限时续写到新工作表
+
+用法: python reaction_cli.py export --db reaction_test.db --table trials --format parquet --out trials.parquet
+      python reaction_cli.py chart --user user_001 --out user_001.png
+      python reaction_cli.py stats --jobs bootstrap,models,norms
+      python reaction_cli.py integrity --full
+      python reaction_cli.py merge station2.db station3.db
+      python reaction_cli.py vacuum --into backup.db
+      python reaction_cli.py maintain --retention-months 36
+      python reaction_cli.py clear --yes
+      python reaction_cli.py bench --filter db.
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from db_maintenance import DEFAULT_HOT_MONTHS, TASK_INTERVALS
+from storage import DatabaseManager
+
+EXPORT_FORMATS = ('csv', 'ndjson', 'json', 'arrow', 'parquet', 'xlsx')
+BINARY_FORMATS = ('arrow', 'parquet', 'xlsx')
+
+# 与桌面端“导出Excel”一致的工作表名
+XLSX_SHEET_NAMES = {'trials': '详细记录', 'runs': '统计摘要', 'users': '用户信息'}
+XLSX_MAX_ROWS = 1048576
+
+STATS_JOBS = ('bootstrap', 'models', 'norms')
+
+# 图表使用的最近轮次数（与统计图表窗口一致）
+CHART_RUNS = 20
+
+
+# ---------------------------------------------------------------- 导出
+
+def _write_csv(chunks: Iterator[List[Dict[str, Any]]], stream) -> int:
+    writer = None
+    count = 0
+    for rows in chunks:
+        if writer is None:
+            writer = csv.DictWriter(stream, fieldnames=list(rows[0]))
+            writer.writeheader()
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def _write_ndjson(chunks: Iterator[List[Dict[str, Any]]], stream) -> int:
+    count = 0
+    for rows in chunks:
+        stream.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows))
+        count += len(rows)
+    return count
+
+
+def _write_json(chunks: Iterator[List[Dict[str, Any]]], stream) -> int:
+    """逐块写出JSON数组（不在内存中拼装整个数组）"""
+    count = 0
+    stream.write('[')
+    for rows in chunks:
+        for row in rows:
+            stream.write((',\n' if count else '\n') + json.dumps(row, ensure_ascii=False))
+            count += 1
+    stream.write('\n]\n' if count else ']\n')
+    return count
+
+
+def _write_arrow(chunks: Iterator[List[Dict[str, Any]]], stream) -> int:
+    from query_api import arrow_stream
+
+    count = 0
+
+    def counted():
+        nonlocal count
+        for rows in chunks:
+            count += len(rows)
+            yield rows
+
+    for data in arrow_stream(counted()):
+        stream.write(data)
+    return count
+
+
+def _write_parquet(chunks: Iterator[List[Dict[str, Any]]], stream) -> int:
+    import pyarrow.parquet as pq
+    from query_api import arrow_table
+
+    writer = None
+    count = 0
+    try:
+        for rows in chunks:
+            table = arrow_table(rows, writer.schema if writer else None)
+            if writer is None:
+                writer = pq.ParquetWriter(stream, table.schema)
+            writer.write_table(table)
+            count += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def _write_xlsx(chunks: Iterator[List[Dict[str, Any]]], stream, sheet_name: str) -> int:
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = 0
+    columns: List[str] = []
+    count = 0
+    for rows in chunks:
+        for row in rows:
+            if sheet is None or sheet_rows >= XLSX_MAX_ROWS:
+                index = len(workbook.worksheets) + 1
+                sheet = workbook.create_sheet(sheet_name if index == 1 else f"{sheet_name}{index}")
+                columns = list(row)
+                sheet.append(columns)
+                sheet_rows = 1
+            sheet.append([row[column] for column in columns])
+            sheet_rows += 1
+            count += 1
+    if sheet is None:
+        workbook.create_sheet(sheet_name)
+    workbook.save(stream)
+    return count
+
+
+def export_data(db_path: str, table: str, fmt: str, out: str, user_id: Optional[str] = None,
+                test_type: Optional[str] = None, chunk_size: int = 5000) -> int:
+    """按块导出一类数据到文件（out 为 '-' 时写到标准输出），返回导出行数"""
+    db = DatabaseManager(db_path, cache_size=0)
+    chunks = db.iter_table_chunks(table, user_id, test_type, chunk_size=chunk_size)
+
+    binary = fmt in BINARY_FORMATS
+    if out == '-':
+        stream = contextlib.nullcontext(sys.stdout.buffer if binary else sys.stdout)
+    else:
+        stream = open(out, 'wb') if binary else open(out, 'w', encoding='utf-8', newline='')
+
+    with stream as handle:
+        if fmt == 'csv':
+            return _write_csv(chunks, handle)
+        if fmt == 'ndjson':
+            return _write_ndjson(chunks, handle)
+        if fmt == 'json':
+            return _write_json(chunks, handle)
+        if fmt == 'arrow':
+            return _write_arrow(chunks, handle)
+        if fmt == 'parquet':
+            return _write_parquet(chunks, handle)
+        return _write_xlsx(chunks, handle, XLSX_SHEET_NAMES[table])
+
+
+# ---------------------------------------------------------------- 图表
+
+def render_chart(db_path: str, user_id: str, out: str, dpi: int = 150) -> bool:
+    """把用户最近的历史统计图（与统计图表窗口相同）保存为图片/PDF，没有数据时返回False"""
+    history = DatabaseManager(db_path, cache_size=0).get_user_history(user_id, limit=CHART_RUNS)
+    if not history:
+        return False
+
+    import warnings
+    from matplotlib import rcParams
+    from matplotlib.figure import Figure
+    from report_charts import draw_history_chart, CJK_FONTS
+
+    rcParams['font.sans-serif'] = CJK_FONTS
+    rcParams['axes.unicode_minus'] = False
+    # 服务器上缺少中文字体时只是显示为方框，不逐字告警
+    warnings.filterwarnings('ignore', message='Glyph .* missing from')
+
+    fig = Figure(figsize=(10, 8))
+    fig.suptitle(f'用户 {user_id} - 反应时测试统计图表', fontsize=16)
+    draw_history_chart(fig, history)
+    fig.tight_layout()
+    fig.savefig(out, dpi=dpi)
+    return True
+
+
+# ---------------------------------------------------------------- 子命令
+
+def _cmd_export(args) -> int:
+    if args.format in ('arrow', 'parquet'):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("导出失败: 需要安装 pyarrow")
+            return 1
+    if args.format == 'xlsx':
+        if args.out == '-':
+            print("导出失败: xlsx 需要指定输出文件")
+            return 1
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            print("导出失败: 需要安装 openpyxl")
+            return 1
+
+    start = time.perf_counter()
+    try:
+        count = export_data(args.db, args.table, args.format, args.out, args.user, args.test_type, args.chunk_size)
+    except BrokenPipeError:
+        # 标准输出的读取方提前关闭（如 | head），不算错误；退出时也不再刷新标准输出
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except (ValueError, OSError) as e:
+        print(f"导出失败: {e}", file=sys.stderr)
+        return 1
+    if args.out != '-':
+        print(f"已导出 {count} 行到 {args.out}，耗时 {time.perf_counter() - start:.2f} 秒")
+    return 0
+
+
+def _cmd_chart(args) -> int:
+    out = args.out or f"chart_{args.user}.png"
+    if not render_chart(args.db, args.user, out, args.dpi):
+        print(f"用户 {args.user} 没有足够的数据生成图表")
+        return 1
+    print(f"已保存图表: {out}")
+    return 0
+
+
+def _cmd_stats(args) -> int:
+    jobs = [job.strip() for job in args.jobs.split(',') if job.strip()]
+    unknown = set(jobs) - set(STATS_JOBS)
+    if unknown:
+        print(f"不支持的统计任务: {', '.join(sorted(unknown))}")
+        return 2
+
+    if 'bootstrap' in jobs:
+        from bootstrap_stats import run_bootstrap_job
+        summary = run_bootstrap_job(args.db, n_boot=args.boot, workers=args.workers, user_ids=args.users)
+        print(f"Bootstrap: {summary['users']} 个用户, {summary['cells']} 个单元, "
+              f"耗时 {summary['elapsed_seconds']:.2f} 秒")
+    if 'models' in jobs:
+        from model_fitting import run_fitting_job
+        summary = run_fitting_job(args.db, user_ids=args.users, workers=args.workers, force=args.force)
+        print(f"模型拟合: 拟合 {summary['fitted']} 个单元, 跳过未变化单元 {summary['skipped']} 个, "
+              f"耗时 {summary['elapsed_seconds']:.2f} 秒")
+    if 'norms' in jobs:
+        from cohort_reports import load_norms, NORMS_FILE
+        os.makedirs(args.reports, exist_ok=True)
+        norms, digest = load_norms(args.db, os.path.join(args.reports, NORMS_FILE), rebuild=True)
+        print(f"常模: {len(norms['groups'])} 组, 摘要 {digest}")
+    return 0
+
+
+def _cmd_integrity(args) -> int:
+    report = DatabaseManager(args.db, cache_size=0).integrity_report(full=args.full)
+    for key, value in report.items():
+        if key != 'problems':
+            print(f"{key:<24} {value}")
+    for problem in report['problems']:
+        print(f"问题: {problem}")
+    return 1 if report['problems'] else 0
+
+
+def _cmd_merge(args) -> int:
+    db = DatabaseManager(args.db, cache_size=0)
+    failed = 0
+    for source in args.sources:
+        try:
+            counts = db.merge_from(source)
+        except Exception as e:
+            print(f"合并失败 {source}: {e}")
+            failed += 1
+            continue
+        print(f"{source}: 新增用户 {counts['users']}, 试次 {counts['test_records']}, "
+              f"统计 {counts['test_statistics']}")
+    return 1 if failed else 0
+
+
+def _cmd_vacuum(args) -> int:
+    if args.into and os.path.exists(args.into):
+        print(f"目标文件已存在: {args.into}")
+        return 1
+    sizes = DatabaseManager(args.db, cache_size=0).vacuum(args.into)
+    print(f"整理完成: {sizes['before_bytes'] / 1e6:.1f} MB -> {sizes['after_bytes'] / 1e6:.1f} MB")
+    return 0
+
+
+def _cmd_maintain(args) -> int:
+    try:
+        results = DatabaseManager(args.db, cache_size=0).run_maintenance(
+            args.hot_months, args.retention_months, tasks=args.tasks, force=args.force)
+    except ValueError as e:
+        print(f"维护失败: {e}")
+        return 2
+    for task, result in results.items():
+        print(f"{task:<20} {result if result is not None else '完成'}")
+    if not results:
+        print("没有到期的维护任务")
+    return 0
+
+
+def _cmd_clear(args) -> int:
+    if not args.yes:
+        print("清除全部测试数据不可撤销，确认请加 --yes")
+        return 2
+    result = DatabaseManager(args.db, cache_size=0).clear_all_data()
+    cleared = ', '.join(f"{table} {count}" for table, count in result['tables'].items())
+    print(f"已清除: {cleared}; 删除分区 {len(result['partitions'])} 个")
+    return 0
+
+
+def _cmd_bench(args) -> int:
+    import benchmarks
+
+    families = args.families or benchmarks.HEADLESS_FAMILIES
+    unknown = set(families) - set(benchmarks.FAMILIES)
+    if unknown:
+        print(f"不支持的用例族: {', '.join(sorted(unknown))}")
+        return 2
+    results = benchmarks.run_benchmarks(args.filter, args.repeat or benchmarks.DEFAULT_REPEAT,
+                                        args.min_time or benchmarks.DEFAULT_MIN_TIME, families=families)
+    regressions = benchmarks.record_results(results, args.history or benchmarks.DEFAULT_HISTORY,
+                                            args.baseline or benchmarks.DEFAULT_BASELINE,
+                                            args.threshold or benchmarks.DEFAULT_THRESHOLD, args.save_baseline)
+    return 1 if regressions and not args.save_baseline else 0
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="反应时测试数据的无界面命令行工具")
+    parser.add_argument('--db', default='reaction_test.db', help="数据库路径")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="按块导出试次、轮次统计或用户")
+    export_parser.add_argument('--table', choices=sorted(DatabaseManager.EXPORT_TABLES), default='trials',
+                               help="导出的数据")
+    export_parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help="输出格式")
+    export_parser.add_argument('--out', default='-', help="输出文件（默认标准输出）")
+    export_parser.add_argument('--user', help="只导出该用户")
+    export_parser.add_argument('--test-type', help="只导出该测试类型（用户表不适用）")
+    export_parser.add_argument('--chunk-size', type=int, default=5000, help="每块读取的行数")
+    export_parser.set_defaults(handler=_cmd_export)
+
+    chart_parser = subparsers.add_parser('chart', help="保存用户的历史统计图")
+    chart_parser.add_argument('--user', required=True, help="用户ID")
+    chart_parser.add_argument('--out', help="输出文件（按扩展名决定格式，默认 chart_<用户>.png）")
+    chart_parser.add_argument('--dpi', type=int, default=150, help="分辨率")
+    chart_parser.set_defaults(handler=_cmd_chart)
+
+    stats_parser = subparsers.add_parser('stats', help="重新计算Bootstrap区间、模型参数与常模")
+    stats_parser.add_argument('--jobs', default=','.join(STATS_JOBS), help="任务，逗号分隔（bootstrap,models,norms）")
+    stats_parser.add_argument('--user', action='append', dest='users', help="只计算指定用户（可重复）")
+    stats_parser.add_argument('--workers', type=int, default=None, help="进程数（默认CPU核数）")
+    stats_parser.add_argument('--boot', type=int, default=2000, help="Bootstrap重采样次数")
+    stats_parser.add_argument('--force', action='store_true', help="忽略缓存，全部重新拟合模型")
+    stats_parser.add_argument('--reports', default='reports', help="常模文件所在的报告目录")
+    stats_parser.set_defaults(handler=_cmd_stats)
+
+    integrity_parser = subparsers.add_parser('integrity', help="检查数据库一致性（有问题时退出码为1）")
+    integrity_parser.add_argument('--full', action='store_true', help="完整检查（integrity_check，较慢）")
+    integrity_parser.set_defaults(handler=_cmd_integrity)
+
+    merge_parser = subparsers.add_parser('merge', help="把其他工作站的数据库合并进来")
+    merge_parser.add_argument('sources', nargs='+', help="来源数据库")
+    merge_parser.set_defaults(handler=_cmd_merge)
+
+    vacuum_parser = subparsers.add_parser('vacuum', help="整理数据库文件")
+    vacuum_parser.add_argument('--into', help="写出整理后的副本（原文件不变）")
+    vacuum_parser.set_defaults(handler=_cmd_vacuum)
+
+    maintain_parser = subparsers.add_parser('maintain', help="运行到期的维护任务（月分区、保留期、整理、ANALYZE）")
+    maintain_parser.add_argument('--hot-months', type=int, default=DEFAULT_HOT_MONTHS,
+                                 help="主库保留的月数（含当月），更早的试次移入月分区")
+    maintain_parser.add_argument('--retention-months', type=int, default=None, help="试次保留的月数（默认永久保留）")
+    maintain_parser.add_argument('--task', action='append', dest='tasks', choices=list(TASK_INTERVALS),
+                                 help="只运行指定任务（可重复）")
+    maintain_parser.add_argument('--force', action='store_true', help="忽略运行间隔")
+    maintain_parser.set_defaults(handler=_cmd_maintain)
+
+    clear_parser = subparsers.add_parser('clear', help="清除全部测试数据（保留工作站延迟档案）")
+    clear_parser.add_argument('--yes', action='store_true', help="确认清除")
+    clear_parser.set_defaults(handler=_cmd_clear)
+
+    bench_parser = subparsers.add_parser('bench', help="运行基准测试（默认只运行无界面用例族）")
+    bench_parser.add_argument('--family', action='append', dest='families',
+                              help="用例族（gen/stats/db/html/paint，可重复；默认 db）")
+    bench_parser.add_argument('--filter', default=None, help="只运行名称包含该字符串的用例")
+    # 未给出的参数使用 benchmarks.py 的默认值（解析参数时不导入 benchmarks）
+    bench_parser.add_argument('--repeat', type=int, help="每个用例的计时轮数")
+    bench_parser.add_argument('--min-time', type=float, help="每轮最短时长（秒）")
+    bench_parser.add_argument('--history', help="历史文件路径")
+    bench_parser.add_argument('--baseline', help="基线文件路径")
+    bench_parser.add_argument('--threshold', type=float, help="回归阈值（比例）")
+    bench_parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    bench_parser.set_defaults(handler=_cmd_bench)
+
+    args = parser.parse_args()
+    # merge 可以合并到新建的数据库，bench 不使用工作数据库
+    if args.command not in ('merge', 'bench') and not os.path.isfile(args.db):
+        print(f"数据库不存在: {args.db}")
+        sys.exit(1)
+    sys.exit(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
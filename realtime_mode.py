@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+实时测试模式
+- 测试期间冻结并关闭Python循环垃圾回收，只在试次间隔中手动回收
+- 可选提高进程调度优先级、在Linux上绑定到单个CPU核心
+- 记录定时器唤醒延迟与刺激窗口内的GC停顿，用于对比普通模式的反应时噪声
+
+用法: python realtime_mode.py --trials 200   （对比普通模式与实时模式的计时噪声）
+"""
+
+import argparse
+import gc
+import os
+import random
+import time
+from typing import Any, Dict, List
+
+
+class RealtimeRunGuard:
+    """单轮测试的实时运行保护"""
+
+    def __init__(self, raise_priority: bool = True, pin_cpu: bool = True, nice_value: int = -10):
+        self.raise_priority = raise_priority
+        self.pin_cpu = pin_cpu
+        self.nice_value = nice_value
+
+        self.is_active = False
+        self.gap_collect_ms = []
+        self._gc_was_enabled = True
+        self._old_priority = None
+        self._old_affinity = None
+        # 提高优先级/绑定核心失败后本实例不再尝试（失败只提示一次）
+        self._priority_failed = False
+        self._affinity_failed = False
+
+    def enter(self):
+        """进入实时模式（测试开始时调用）"""
+        if self.is_active:
+            return
+
+        # 先完整回收一次，再把现存对象移入永久代，之后的回收只扫描新对象
+        gc.collect()
+        gc.freeze()
+        self._gc_was_enabled = gc.isenabled()
+        gc.disable()
+
+        if self.raise_priority and not self._priority_failed:
+            try:
+                self._old_priority = os.getpriority(os.PRIO_PROCESS, 0)
+                os.setpriority(os.PRIO_PROCESS, 0, self.nice_value)
+            except (AttributeError, OSError) as e:
+                # 非root用户通常无权降低nice值
+                self._old_priority = None
+                self._priority_failed = True
+                print(f"提高调度优先级失败，之后不再尝试: {e}")
+
+        if self.pin_cpu and not self._affinity_failed and hasattr(os, 'sched_setaffinity'):
+            try:
+                self._old_affinity = os.sched_getaffinity(0)
+                # 绑定到可用核心中编号最大的一个（0号核心通常承担更多系统中断）
+                os.sched_setaffinity(0, {max(self._old_affinity)})
+            except OSError as e:
+                self._old_affinity = None
+                self._affinity_failed = True
+                print(f"绑定CPU核心失败，之后不再尝试: {e}")
+
+        self.gap_collect_ms = []
+        self.is_active = True
+
+    def collect_gap(self):
+        """试次间隔中回收新生代垃圾"""
+        if not self.is_active:
+            return
+        start = time.perf_counter()
+        gc.collect(1)
+        self.gap_collect_ms.append((time.perf_counter() - start) * 1000)
+
+    def exit(self):
+        """退出实时模式（测试结束或停止时调用）"""
+        if not self.is_active:
+            return
+
+        if self._old_affinity is not None:
+            try:
+                os.sched_setaffinity(0, self._old_affinity)
+            except OSError:
+                pass
+            self._old_affinity = None
+
+        if self._old_priority is not None:
+            try:
+                os.setpriority(os.PRIO_PROCESS, 0, self._old_priority)
+            except OSError:
+                pass
+            self._old_priority = None
+
+        gc.unfreeze()
+        if self._gc_was_enabled:
+            gc.enable()
+        self.is_active = False
+
+
+class TrialTimingProbe:
+    """试次计时探针
+
+    记录刺激定时器的唤醒延迟（实际显示时刻 - 计划时刻），以及刺激显示到反应之间
+    发生的GC停顿，二者都会直接叠加到测得的反应时上。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """开始新一轮测试时清空记录"""
+        self.wake_latency_ms = []
+        self.window_gc_pauses_ms = []
+        self._scheduled_at = None
+        self._in_window = False
+        self._gc_start = None
+
+    def attach(self):
+        """注册GC回调"""
+        if self._on_gc not in gc.callbacks:
+            gc.callbacks.append(self._on_gc)
+
+    def detach(self):
+        """移除GC回调"""
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+
+    def stimulus_scheduled(self, delay_ms: float):
+        """刺激定时器启动"""
+        self._scheduled_at = time.perf_counter() + delay_ms / 1000
+
+    def stimulus_shown(self):
+        """刺激已显示，进入反应窗口"""
+        if self._scheduled_at is not None:
+            self.wake_latency_ms.append((time.perf_counter() - self._scheduled_at) * 1000)
+            self._scheduled_at = None
+        self._in_window = True
+
+    def window_closed(self):
+        """反应或超时，离开反应窗口"""
+        self._in_window = False
+
+    def summary(self) -> Dict[str, Any]:
+        """计时噪声汇总"""
+        return {
+            'wake_latency': _describe(self.wake_latency_ms),
+            'gc_pauses_in_window': len(self.window_gc_pauses_ms),
+            'gc_pause_total_ms': sum(self.window_gc_pauses_ms)
+        }
+
+    def _on_gc(self, phase: str, info: Dict[str, Any]):
+        if phase == 'start':
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            if self._in_window:
+                self.window_gc_pauses_ms.append((time.perf_counter() - self._gc_start) * 1000)
+            self._gc_start = None
+
+
+def _describe(values: List[float]) -> Dict[str, float]:
+    """均值 / P95 / 最大值"""
+    if not values:
+        return {'mean': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(values)
+    return {
+        'mean': sum(ordered) / len(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1]
+    }
+
+
+def simulate_run(trials: int, realtime: bool, churn: int = 20000) -> Dict[str, Any]:
+    """模拟一轮测试：刺激窗口内分配大量带循环引用的小对象，测量计时噪声"""
+    guard = RealtimeRunGuard(raise_priority=realtime, pin_cpu=realtime)
+    probe = TrialTimingProbe()
+    probe.attach()
+    if realtime:
+        guard.enter()
+
+    window_ms = []
+    try:
+        for _ in range(trials):
+            delay_ms = random.uniform(1.0, 3.0)
+            probe.stimulus_scheduled(delay_ms)
+            time.sleep(delay_ms / 1000)
+            probe.stimulus_shown()
+
+            # 固定工作量：耗时波动即为测量噪声
+            start = time.perf_counter()
+            garbage = []
+            for i in range(churn):
+                node = {'i': i}
+                node['self'] = node
+                garbage.append(node)
+            window_ms.append((time.perf_counter() - start) * 1000)
+            probe.window_closed()
+
+            del garbage
+            guard.collect_gap()
+    finally:
+        guard.exit()
+        probe.detach()
+
+    summary = probe.summary()
+    mean = sum(window_ms) / len(window_ms)
+    summary['window_sd_ms'] = (sum((x - mean) ** 2 for x in window_ms) / len(window_ms)) ** 0.5
+    summary['window'] = _describe(window_ms)
+    return summary
+
+
+def main():
+    """对比普通模式与实时模式"""
+    parser = argparse.ArgumentParser(description="对比普通模式与实时模式的计时噪声")
+    parser.add_argument('--trials', type=int, default=200, help="模拟试次数")
+    parser.add_argument('--churn', type=int, default=20000, help="每个刺激窗口内分配的对象数")
+    args = parser.parse_args()
+
+    for name, realtime in (("普通模式", False), ("实时模式", True)):
+        result = simulate_run(args.trials, realtime, args.churn)
+        print(f"{name}: 窗口耗时 均值 {result['window']['mean']:.2f} ms, "
+              f"标准差 {result['window_sd_ms']:.2f} ms, P95 {result['window']['p95']:.2f} ms, "
+              f"最大 {result['window']['max']:.2f} ms; "
+              f"窗口内GC {result['gc_pauses_in_window']} 次 / {result['gc_pause_total_ms']:.1f} ms; "
+              f"定时器唤醒延迟 P95 {result['wake_latency']['p95']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告图表与评价
+统计图表窗口（safe_test.generate_chart）与批量报告（cohort_reports.py）共用的绘图和评价规则。
+绘图只使用 matplotlib.figure.Figure，不经过 pyplot，可以在任意后端（Qt窗口或Agg离屏）下使用。
+"""
+
+from typing import Any, Dict, List, Tuple
+
+TEST_TYPE_NAMES = {
+    "simple": "简单反应时",
+    "choice": "选择反应时",
+    "disjunctive": "析取反应时"
+}
+
+STIMULUS_TYPE_NAMES = {
+    "color": "颜色刺激",
+    "shape": "图形刺激",
+    "symbol": "符号刺激",
+    "text": "语言引导"
+}
+
+PIE_COLORS = ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99']
+
+# 常见中文字体，依次回退（离屏批量报告使用）
+CJK_FONTS = ['Microsoft YaHei', 'SimHei', 'Noto Sans CJK SC', 'WenQuanYi Micro Hei', 'DejaVu Sans']
+
+
+def evaluate_performance(avg_rt: float, accuracy: float) -> Tuple[str, str]:
+    """按平均反应时与正确率给出评价，返回 (评价文字, 颜色)"""
+    if avg_rt < 250 and accuracy > 95:
+        return "优秀！反应迅速且准确。", "#27ae60"
+    if avg_rt < 400 and accuracy > 90:
+        return "良好！反应速度和准确性都不错。", "#f39c12"
+    return "有待提高！建议多练习。", "#e74c3c"
+
+
+def draw_history_chart(fig, history: List[Dict[str, Any]], subplot_spec=None):
+    """在图中绘制历史记录的2×2统计图（趋势、正确率、类型分布、箱线图），返回坐标轴数组
+
+    subplot_spec 为None时占满整个图，否则绘制在给定的网格区域内。
+    """
+    grid = fig.add_gridspec(2, 2) if subplot_spec is None else subplot_spec.subgridspec(2, 2, hspace=0.4, wspace=0.3)
+    axes = grid.subplots()
+
+    # 准备数据
+    test_types = [h.get('test_type', '未知') for h in history]
+    avg_times = [h.get('avg_reaction_time', 0) for h in history]
+    accuracy = [h.get('accuracy_rate', 0) for h in history]
+
+    # 1. 平均反应时折线图
+    axes[0, 0].plot(range(len(avg_times)), avg_times, 'b-o', linewidth=2, markersize=6)
+    axes[0, 0].set_xlabel('测试序号')
+    axes[0, 0].set_ylabel('平均反应时 (ms)')
+    axes[0, 0].set_title('平均反应时变化趋势')
+    axes[0, 0].grid(True, alpha=0.3)
+
+    # 2. 正确率柱状图
+    axes[0, 1].bar(range(len(accuracy)), accuracy, color='green', alpha=0.7)
+    axes[0, 1].set_xlabel('测试序号')
+    axes[0, 1].set_ylabel('正确率 (%)')
+    axes[0, 1].set_title('测试正确率')
+    axes[0, 1].set_ylim([0, 100])
+    axes[0, 1].grid(True, alpha=0.3, axis='y')
+
+    # 3. 测试类型分布饼图
+    type_counts = {}
+    for t in test_types:
+        type_counts[t] = type_counts.get(t, 0) + 1
+
+    if type_counts:
+        types = list(type_counts.keys())
+        counts = list(type_counts.values())
+        axes[1, 0].pie(counts, labels=types, autopct='%1.1f%%', colors=PIE_COLORS[:len(types)])
+        axes[1, 0].set_title('测试类型分布')
+
+    # 4. 反应时箱线图（按类型名排序，输出稳定）
+    all_times = []
+    type_labels = []
+    for t in sorted(set(test_types), key=str):
+        times = [avg_times[i] for i in range(len(test_types)) if test_types[i] == t]
+        if times:
+            all_times.append(times)
+            type_labels.append(t)
+
+    if all_times:
+        axes[1, 1].boxplot(all_times)
+        axes[1, 1].set_xticks(range(1, len(type_labels) + 1), type_labels)
+        axes[1, 1].set_ylabel('反应时 (ms)')
+        axes[1, 1].set_title('不同测试类型反应时分布')
+        axes[1, 1].grid(True, alpha=0.3, axis='y')
+
+    return axes
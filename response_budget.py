@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Web端单次反应的服务端耗时预算检查
+用 Streamlit AppTest 在无浏览器环境中完成一轮测试，读取应用记录的每次反应耗时
+（按钮回调记录反应 + 刺激区片段重新渲染），P95超过预算时以非零状态退出。
+
+AppTest 每次交互都运行整个脚本，但计时只覆盖回调与刺激区片段本身，
+与真实浏览器中片段级重新运行的服务端工作量一致。
+
+用法: python response_budget.py --responses 30 --budget-ms 20
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from typing import Any, Dict
+
+import numpy as np
+
+RESPONSE_BUDGET_MS = 20.0
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Qt_2_web.py')
+
+RESPONSE_BUTTONS = {
+    'simple': '点击反应',
+    'choice': '选项 1',
+    'disjunctive': '选择目标'
+}
+
+
+def measure_response_budget(responses: int = 30, test_type: str = 'simple',
+                            budget_ms: float = RESPONSE_BUDGET_MS) -> Dict[str, Any]:
+    """完成一轮测试并汇总每次反应的服务端耗时（在临时目录中运行，不写入工作数据库）"""
+    from streamlit.testing.v1 import AppTest
+
+    old_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        try:
+            at = AppTest.from_file(APP_PATH, default_timeout=60)
+            at.run()
+            at.sidebar.text_input[1].input("预算检查")
+            at.sidebar.selectbox[1].set_value(test_type)
+            at.sidebar.slider[0].set_value(min(max(responses, 5), 30))
+            at.run()
+            next(b for b in at.sidebar.button if b.label == "开始测试").click()
+            at.run()
+
+            while at.session_state.test_state['is_running']:
+                buttons = {b.label: b for b in at.main.button}
+                if "显示刺激" in buttons:
+                    buttons["显示刺激"].click()
+                    at.run()
+                    continue
+                buttons[RESPONSE_BUTTONS[test_type]].click()
+                at.run()
+                if at.exception:
+                    raise RuntimeError(at.exception[0].value)
+
+            timings = list(at.session_state['response_timings_ms']) \
+                if 'response_timings_ms' in at.session_state else []
+        finally:
+            os.chdir(old_cwd)
+
+    values = np.asarray(timings, dtype=np.float64)
+    p95 = float(np.percentile(values, 95)) if values.size else 0.0
+    return {
+        'responses': int(values.size),
+        'median_ms': float(np.median(values)) if values.size else 0.0,
+        'p95_ms': p95,
+        'max_ms': float(values.max()) if values.size else 0.0,
+        'budget_ms': budget_ms,
+        'passed': bool(values.size) and p95 <= budget_ms
+    }
+
+
+def main():
+    """命令行入口（超出预算时退出码为1）"""
+    parser = argparse.ArgumentParser(description="Web端单次反应服务端耗时预算检查")
+    parser.add_argument('--responses', type=int, default=30, help="反应次数（5-30）")
+    parser.add_argument('--test-type', choices=list(RESPONSE_BUTTONS), default='simple')
+    parser.add_argument('--budget-ms', type=float, default=RESPONSE_BUDGET_MS, help="P95预算（ms）")
+    args = parser.parse_args()
+
+    result = measure_response_budget(args.responses, args.test_type, args.budget_ms)
+    status = "通过" if result['passed'] else "超出预算"
+    print(f"{status}: {result['responses']} 次反应, 中位数 {result['median_ms']:.2f} ms, "
+          f"P95 {result['p95_ms']:.2f} ms, 最大 {result['max_ms']:.2f} ms (预算 {result['budget_ms']:.0f} ms)")
+    sys.exit(0 if result['passed'] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,22 +7,36 @@
 学号：XXXXXXXX
 """
 
+import gc
 import sys
 import time
 import random
 import json
-import sqlite3
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
 
-import numpy as np
 import pandas as pd
 from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+from quality_control import QC_ANTICIPATION, QC_SLOW_OUTLIER
+from model_fitting import run_fitting_job, get_model_parameters
+from trial_records import TrialRecord
+from engine_core import TestEngineCore, EngineSink
+from live_feed import attach_feed
+from memory_watchdog import MemoryWatchdog, watchdog_enabled, process_rss_mb
+import input_capture
+from latency_calibration import (
+    LatencyProfile, station_id,
+    DISPLAY_METHOD_LOOPBACK, DISPLAY_METHOD_PAINT, INPUT_METHOD_UINPUT, INPUT_METHOD_POSTED
+)
+from storage import DatabaseManager
+from report_charts import draw_history_chart, evaluate_performance, TEST_TYPE_NAMES, STIMULUS_TYPE_NAMES
 
 
 class StimulusGenerator:
@@ -195,478 +209,136 @@ class StimulusGenerator:
         return target, distractors
 
 
-class DatabaseManager:
-    """数据库管理类"""
+class QtScheduler:
+    """基于QTimer的调度器（引擎核心在Qt事件循环中运行）"""
 
-    def __init__(self, db_path: str = "reaction_test.db"):
-        self.db_path = db_path
-        self.init_database()
+    def call_later(self, delay_ms: float, callback) -> QTimer:
+        timer = QTimer()
+        timer.setSingleShot(True)
+        timer.timeout.connect(callback)
+        timer.start(int(delay_ms))
+        return timer
 
-    def init_database(self):
-        """初始化数据库"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def cancel(self, handle: QTimer):
+        handle.stop()
 
-        # 创建用户表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id TEXT PRIMARY KEY,
-                name TEXT,
-                age INTEGER,
-                gender TEXT,
-                occupation TEXT,
-                created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # 创建测试记录表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS test_records (
-                record_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                test_type TEXT,
-                stimulus_type TEXT,
-                trial_index INTEGER,
-                stimulus_content TEXT,
-                reaction_time REAL,
-                is_correct INTEGER,
-                test_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-
-        # 创建测试统计表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS test_statistics (
-                stat_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                test_type TEXT,
-                stimulus_type TEXT,
-                avg_reaction_time REAL,
-                std_reaction_time REAL,
-                min_reaction_time REAL,
-                max_reaction_time REAL,
-                accuracy_rate REAL,
-                total_trials INTEGER,
-                test_date DATE,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-
-        conn.commit()
-        conn.close()
-
-    def save_user(self, user_data: Dict[str, Any]) -> bool:
-        """保存用户信息"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                INSERT OR REPLACE INTO users (user_id, name, age, gender, occupation)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                user_data['user_id'],
-                user_data['name'],
-                user_data['age'],
-                user_data.get('gender', ''),
-                user_data.get('occupation', '')
-            ))
-
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"保存用户信息失败: {e}")
-            return False
-
-    def save_test_record(self, record_data: Dict[str, Any]) -> bool:
-        """保存单次测试记录"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                INSERT INTO test_records 
-                (user_id, test_type, stimulus_type, trial_index, 
-                 stimulus_content, reaction_time, is_correct)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                record_data['user_id'],
-                record_data['test_type'],
-                record_data['stimulus_type'],
-                record_data['trial_index'],
-                json.dumps(record_data['stimulus_content']),
-                record_data['reaction_time'],
-                1 if record_data['is_correct'] else 0
-            ))
-
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"保存测试记录失败: {e}")
-            return False
-
-    def save_test_statistics(self, stat_data: Dict[str, Any]) -> bool:
-        """保存测试统计结果"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                INSERT INTO test_statistics 
-                (user_id, test_type, stimulus_type, avg_reaction_time,
-                 std_reaction_time, min_reaction_time, max_reaction_time,
-                 accuracy_rate, total_trials, test_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                stat_data['user_id'],
-                stat_data['test_type'],
-                stat_data['stimulus_type'],
-                stat_data['avg_reaction_time'],
-                stat_data['std_reaction_time'],
-                stat_data['min_reaction_time'],
-                stat_data['max_reaction_time'],
-                stat_data['accuracy_rate'],
-                stat_data['total_trials'],
-                stat_data['test_date']
-            ))
-
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"保存统计结果失败: {e}")
-            return False
-
-    def get_user_history(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """获取用户历史记录"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                SELECT * FROM test_statistics 
-                WHERE user_id = ? 
-                ORDER BY test_date DESC, stat_id DESC 
-                LIMIT ?
-            ''', (user_id, limit))
-
-            rows = cursor.fetchall()
-            conn.close()
-
-            return [dict(row) for row in rows]
-        except Exception as e:
-            print(f"获取历史记录失败: {e}")
-            return []
-
-    def get_trial_details(self, user_id: str, test_type: str = None, limit: int = 100) -> List[Dict[str, Any]]:
-        """获取详细测试记录"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-
-            if test_type:
-                cursor.execute('''
-                    SELECT * FROM test_records 
-                    WHERE user_id = ? AND test_type = ?
-                    ORDER BY trial_index 
-                    LIMIT ?
-                ''', (user_id, test_type, limit))
-            else:
-                cursor.execute('''
-                    SELECT * FROM test_records 
-                    WHERE user_id = ? 
-                    ORDER BY test_time DESC 
-                    LIMIT ?
-                ''', (user_id, limit))
 
-            rows = cursor.fetchall()
-            conn.close()
-
-            return [dict(row) for row in rows]
-        except Exception as e:
-            print(f"获取详细记录失败: {e}")
-            return []
-
-
-class TestEngine(QObject):
-    """测试引擎类"""
-
-    # 定义信号
-    test_started = pyqtSignal(str)
-    stimulus_shown = pyqtSignal(dict)
-    response_recorded = pyqtSignal(dict)
-    test_completed = pyqtSignal(dict)
-    test_timeout = pyqtSignal()
+class QtStimulusSource:
+    """桌面端刺激物来源（QColor/Qt.Key，供StimulusDisplayWidget绘制）"""
 
     def __init__(self):
-        super().__init__()
         self.stimulus_generator = StimulusGenerator()
-        self.db_manager = DatabaseManager()
-
-        # 测试状态变量
-        self.current_test_type = None
-        self.current_stimulus_type = None
-        self.reaction_times = []
-        self.correct_responses = []
-        self.current_trial = 0
-        self.total_trials = 10
-        self.stimulus_start_time = 0
-        self.is_test_running = False
-        self.current_stimulus = None
-        self.user_data = {}
-
-        # 定时器
-        self.wait_timer = QTimer()
-        self.wait_timer.setSingleShot(True)
-        self.wait_timer.timeout.connect(self.show_stimulus)
 
-        self.timeout_timer = QTimer()
-        self.timeout_timer.setSingleShot(True)
-        self.timeout_timer.timeout.connect(self.handle_timeout)
-
-    def setup_test(self, test_type: str, stimulus_type: str, user_data: Dict[str, Any],
-                   trials: int = 10):
-        """设置测试参数"""
-        self.current_test_type = test_type
-        self.current_stimulus_type = stimulus_type
-        self.user_data = user_data
-        self.total_trials = trials
-
-        # 重置状态
-        self.reaction_times = []
-        self.correct_responses = []
-        self.current_trial = 0
-        self.is_test_running = False
-
-    def start_test(self):
-        """开始测试"""
-        if not self.current_test_type or not self.user_data:
-            return False
-
-        self.reaction_times = []
-        self.correct_responses = []
-        self.current_trial = 0
-        self.is_test_running = True
-
-        # 发出测试开始信号
-        self.test_started.emit(f"{self.current_test_type}测试开始")
-
-        # 开始第一个试次
-        QTimer.singleShot(1000, self.prepare_trial)
-        return True
-
-    def prepare_trial(self):
-        """准备试次"""
-        if not self.is_test_running or self.current_trial >= self.total_trials:
-            return
-
-        # 随机等待时间（1-3秒）
-        wait_time = random.uniform(1.0, 3.0) * 1000
-        self.wait_timer.start(int(wait_time))
-
-    def show_stimulus(self):
-        """显示刺激物"""
-        if not self.is_test_running:
-            return
-
-        # 生成刺激物
-        if self.current_test_type == "simple":
-            self.current_stimulus = self.stimulus_generator.generate_simple_stimulus(
-                self.current_stimulus_type
-            )
-        elif self.current_test_type == "choice":
+    def generate_stimulus(self, test_type: str, stimulus_type: str) -> Optional[Dict[str, Any]]:
+        """按测试类型生成刺激物"""
+        if test_type == "simple":
+            return self.stimulus_generator.generate_simple_stimulus(stimulus_type)
+        elif test_type == "choice":
             # 选择反应时：生成4个刺激物，随机选择一个显示
             stimuli = self.stimulus_generator.generate_choice_stimuli(4)
-            self.current_stimulus = random.choice(stimuli)
-            self.current_stimulus['all_stimuli'] = stimuli
-        elif self.current_test_type == "disjunctive":
+            stimulus = dict(random.choice(stimuli))
+            stimulus['all_stimuli'] = stimuli
+            return stimulus
+        elif test_type == "disjunctive":
             # 析取反应时：生成目标刺激和干扰刺激
             target_type = random.choice(['color', 'shape'])
             target, distractors = self.stimulus_generator.generate_disjunctive_stimuli(target_type)
-            self.current_stimulus = {
+            return {
                 'target': target,
                 'distractors': distractors,
                 'target_type': target_type
             }
+        return None
+
+    def expected_response(self, test_type: str, stimulus: Dict[str, Any]) -> Any:
+        """正确按键（析取反应时以鼠标点击作答，没有对应按键）"""
+        if test_type == "simple":
+            return Qt.Key.Key_Space
+        elif test_type == "choice":
+            return stimulus.get('key', Qt.Key.Key_1)
+        return None
 
-        # 记录刺激显示时间
-        self.stimulus_start_time = time.time() * 1000
 
-        # 发出刺激显示信号
-        self.stimulus_shown.emit(self.current_stimulus)
+class TestEngine(QObject):
+    """测试引擎类（engine_core.TestEngineCore 的Qt适配：QTimer调度，事件转为信号）"""
 
-        # 设置超时定时器（3秒）
-        self.timeout_timer.start(3000)
+    # 定义信号
+    test_started = pyqtSignal(str)
+    stimulus_shown = pyqtSignal(dict)
+    response_recorded = pyqtSignal(object)  # TrialRecord
+    test_completed = pyqtSignal(dict)
+    test_timeout = pyqtSignal()
 
-    def record_response(self, key: Qt.Key = None, click_pos: QPoint = None) -> bool:
-        """记录用户反应"""
-        if not self.is_test_running or self.stimulus_start_time == 0:
-            return False
+    def __init__(self, db_manager: Optional[DatabaseManager] = None, scheduler=None, clock=time.time):
+        super().__init__()
+        self.stimulus_source = QtStimulusSource()
+        self.core = TestEngineCore(self.stimulus_source, scheduler or QtScheduler(), clock=clock,
+                                   store=db_manager or DatabaseManager(), sink=_QtEngineSink(self))
 
-        # 停止超时定时器
-        self.timeout_timer.stop()
-
-        # 计算反应时间
-        reaction_time = time.time() * 1000 - self.stimulus_start_time
-
-        # 判断是否正确
-        is_correct = True
-        correct_key = None
-
-        if self.current_test_type == "simple":
-            # 简单反应时：只要有反应就正确
-            is_correct = True
-            correct_key = Qt.Key.Key_Space
-        elif self.current_test_type == "choice":
-            # 选择反应时：检查按键是否正确
-            correct_key = self.current_stimulus.get('key', Qt.Key.Key_1)
-            is_correct = (key == correct_key)
-        elif self.current_test_type == "disjunctive":
-            # 析取反应时：检查是否点击了目标
-            # 这里简化处理：只要有反应就认为正确（实际需要检查点击位置）
-            is_correct = True
-
-        # 保存记录
-        self.reaction_times.append(reaction_time)
-        self.correct_responses.append(is_correct)
-
-        # 保存到数据库
-        record_data = {
-            'user_id': self.user_data.get('user_id', ''),
-            'test_type': self.current_test_type,
-            'stimulus_type': self.current_stimulus_type,
-            'trial_index': self.current_trial,
-            'stimulus_content': self.current_stimulus,
-            'reaction_time': reaction_time,
-            'is_correct': is_correct
-        }
-        self.db_manager.save_test_record(record_data)
-
-        # 发出反应记录信号
-        response_data = {
-            'trial': self.current_trial + 1,
-            'reaction_time': reaction_time,
-            'is_correct': is_correct,
-            'correct_key': correct_key
-        }
-        self.response_recorded.emit(response_data)
+    @property
+    def db_manager(self) -> DatabaseManager:
+        return self.core.store
 
-        # 重置刺激开始时间
-        self.stimulus_start_time = 0
+    @db_manager.setter
+    def db_manager(self, db_manager: DatabaseManager):
+        self.core.store = db_manager
 
-        # 下一个试次或结束测试
-        self.current_trial += 1
-        if self.current_trial < self.total_trials:
-            QTimer.singleShot(1000, self.prepare_trial)
-        else:
-            self.complete_test()
+    @property
+    def is_test_running(self) -> bool:
+        return self.core.is_test_running
 
-        return True
+    def setup_test(self, test_type: str, stimulus_type: str, user_data: Dict[str, Any],
+                   trials: int = 10, requeue_invalid: bool = False, realtime: bool = False,
+                   latency_correction: float = 0.0):
+        """设置测试参数
 
-    def handle_timeout(self):
-        """处理反应超时"""
-        if not self.is_test_running:
-            return
+        latency_correction 为工作站延迟校准值（ms），记录反应时前扣除
+        """
+        self.core.setup_test(test_type, stimulus_type, user_data, trials, requeue_invalid, realtime,
+                             latency_correction)
 
-        # 记录超时
-        self.reaction_times.append(3000)  # 超时时间设为3秒
-        self.correct_responses.append(False)
-
-        # 保存到数据库
-        record_data = {
-            'user_id': self.user_data.get('user_id', ''),
-            'test_type': self.current_test_type,
-            'stimulus_type': self.current_stimulus_type,
-            'trial_index': self.current_trial,
-            'stimulus_content': self.current_stimulus,
-            'reaction_time': 3000,
-            'is_correct': False
-        }
-        self.db_manager.save_test_record(record_data)
+    def start_test(self) -> bool:
+        """开始测试"""
+        return self.core.start_test()
 
-        # 发出超时信号
-        self.test_timeout.emit()
+    def record_response(self, key: Qt.Key = None, click_pos: QPoint = None,
+                        response_time: Optional[float] = None) -> bool:
+        """记录用户反应
 
-        # 下一个试次或结束测试
-        self.current_trial += 1
-        if self.current_trial < self.total_trials:
-            QTimer.singleShot(1000, self.prepare_trial)
-        else:
-            self.complete_test()
+        response_time 为反应发生时刻（epoch毫秒，如evdev内核时间戳），缺省取当前时间
+        """
+        # 析取反应时：这里简化处理，只要有点击就认为正确（实际需要检查点击位置）
+        return self.core.record_response(key, response_time)
 
-    def complete_test(self):
-        """完成测试"""
-        self.is_test_running = False
-        self.stimulus_start_time = 0
+    def calculate_statistics(self) -> Optional[Dict[str, Any]]:
+        """计算统计结果"""
+        return self.core.calculate_statistics()
 
-        # 计算统计结果
-        statistics = self.calculate_statistics()
+    def stop_test(self):
+        """停止测试"""
+        self.core.stop_test()
 
-        # 保存统计结果
-        if statistics:
-            stat_data = {
-                'user_id': self.user_data.get('user_id', ''),
-                'test_type': self.current_test_type,
-                'stimulus_type': self.current_stimulus_type,
-                'avg_reaction_time': statistics['average'],
-                'std_reaction_time': statistics['std'],
-                'min_reaction_time': statistics['min'],
-                'max_reaction_time': statistics['max'],
-                'accuracy_rate': statistics['accuracy'],
-                'total_trials': self.total_trials,
-                'test_date': datetime.now().strftime('%Y-%m-%d')
-            }
-            self.db_manager.save_test_statistics(stat_data)
 
-        # 发出测试完成信号
-        self.test_completed.emit(statistics or {})
+class _QtEngineSink(EngineSink):
+    """把引擎核心事件转为 TestEngine 的Qt信号"""
 
-    def calculate_statistics(self) -> Optional[Dict[str, Any]]:
-        """计算统计结果"""
-        if not self.reaction_times:
-            return None
+    def __init__(self, engine: TestEngine):
+        self.engine = engine
 
-        # 只计算正确反应的反应时
-        valid_times = []
-        for rt, correct in zip(self.reaction_times, self.correct_responses):
-            if correct and rt < 3000:  # 排除超时
-                valid_times.append(rt)
-
-        if valid_times:
-            avg_rt = np.mean(valid_times)
-            std_rt = np.std(valid_times)
-            min_rt = np.min(valid_times)
-            max_rt = np.max(valid_times)
-        else:
-            avg_rt = std_rt = min_rt = max_rt = 0
+    def test_started(self, message: str):
+        self.engine.test_started.emit(message)
 
-        # 计算正确率（排除超时）
-        total_valid = len([c for c in self.correct_responses if c is not None])
-        if total_valid > 0:
-            accuracy = sum(1 for c in self.correct_responses if c) / total_valid * 100
-        else:
-            accuracy = 0
+    def stimulus_shown(self, stimulus: Dict[str, Any]):
+        self.engine.stimulus_shown.emit(stimulus)
 
-        return {
-            'average': avg_rt,
-            'std': std_rt,
-            'min': min_rt,
-            'max': max_rt,
-            'accuracy': accuracy,
-            'total_trials': self.total_trials,
-            'valid_trials': len(valid_times)
-        }
+    def response_recorded(self, record: TrialRecord):
+        self.engine.response_recorded.emit(record)
 
-    def stop_test(self):
-        """停止测试"""
-        self.is_test_running = False
-        self.wait_timer.stop()
-        self.timeout_timer.stop()
+    def trial_timeout(self, record: TrialRecord):
+        self.engine.test_timeout.emit()
+
+    def test_completed(self, statistics: Dict[str, Any]):
+        self.engine.test_completed.emit(statistics)
 
 
 class StimulusDisplayWidget(QWidget):
@@ -675,6 +347,9 @@ class StimulusDisplayWidget(QWidget):
     def __init__(self):
         super().__init__()
         self.current_stimulus = None
+        # 延迟校准用：绘制次数与最近一次绘制完成时刻（epoch ms）
+        self.paint_count = 0
+        self.last_paint_time = 0.0
         self.setMinimumSize(400, 300)
         self.setStyleSheet("background-color: #f0f0f0; border-radius: 10px;")
 
@@ -695,6 +370,14 @@ class StimulusDisplayWidget(QWidget):
         painter = QPainter(self)
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
 
+        # 延迟校准帧：整块纯色，便于回读屏幕像素
+        if isinstance(self.current_stimulus, dict) and 'calibration_color' in self.current_stimulus:
+            painter.fillRect(self.rect(), self.current_stimulus['calibration_color'])
+            painter.end()
+            self.paint_count += 1
+            self.last_paint_time = time.time() * 1000
+            return
+
         # 绘制背景
         painter.fillRect(self.rect(), QColor(240, 240, 240))
 
@@ -867,6 +550,568 @@ class StimulusDisplayWidget(QWidget):
         painter.drawPolygon(QPolygonF([QPointF(p) for p in points]))
 
 
+class LatencyCalibrator(QObject):
+    """工作站延迟校准
+
+    显示延迟：切换整屏纯色校准帧，轮询回读屏幕像素直到颜色出现（光电二极管的替代）；
+    无法回读屏幕时退回到绘制完成时刻。
+    输入延迟：优先经uinput虚拟设备走完整内核输入栈，否则向窗口投递合成按键事件，
+    测量到事件送达Qt的时间。每项默认20个样本，整个过程约一两秒。
+    """
+
+    def __init__(self, display: StimulusDisplayWidget, input_target: QWidget,
+                 samples: int = 20, timeout_ms: float = 250):
+        super().__init__()
+        self.display = display
+        self.input_target = input_target
+        self.samples = samples
+        self.timeout_ms = timeout_ms
+
+        self._awaiting_key = False
+        self._key_received_at = None
+
+    def run(self) -> LatencyProfile:
+        """执行校准并返回延迟档案"""
+        display_samples, display_method = self.measure_display()
+        input_samples, input_method = self.measure_input()
+        return LatencyProfile.from_samples(station_id(), display_samples, display_method,
+                                           input_samples, input_method)
+
+    def measure_display(self) -> Tuple[List[float], str]:
+        """测量刺激请求到上屏的延迟"""
+        samples = []
+        method = DISPLAY_METHOD_LOOPBACK
+        colors = [QColor(255, 255, 255), QColor(0, 0, 0)]
+
+        for i in range(self.samples):
+            color = colors[i % 2]
+            painted = self.display.paint_count
+            requested_at = time.time() * 1000
+            self.display.display_stimulus({'calibration_color': color})
+
+            if self._wait_for(lambda: self.display.paint_count > painted) is None:
+                continue
+
+            if method == DISPLAY_METHOD_LOOPBACK:
+                shown_at = self._wait_for(lambda: self._screen_shows(color))
+                if shown_at is not None:
+                    samples.append(shown_at - requested_at)
+                    continue
+                # 回读失败（无合成器或平台不支持截屏），改用绘制完成时刻
+                print("屏幕回读不可用，显示延迟改按绘制完成时刻测量")
+                method = DISPLAY_METHOD_PAINT
+                samples = []
+
+            samples.append(self.display.last_paint_time - requested_at)
+
+        self.display.clear_stimulus()
+        return samples, method
+
+    def measure_input(self) -> Tuple[List[float], str]:
+        """测量输入事件产生到送达Qt的延迟"""
+        device = None
+        if input_capture.is_available():
+            try:
+                device = input_capture.create_virtual_device()
+                # 等待udev创建设备节点
+                time.sleep(0.3)
+            except (RuntimeError, OSError) as e:
+                print(f"创建uinput虚拟设备失败: {e}")
+                device = None
+
+        self.input_target.activateWindow()
+        self.input_target.setFocus()
+        app = QApplication.instance()
+        app.installEventFilter(self)
+        try:
+            samples = []
+            if device is not None:
+                samples = self._collect_input_samples(device)
+                if not samples:
+                    # 窗口未获得焦点时内核事件送不到本程序
+                    print("uinput注入的按键未送达窗口，改用Qt事件注入")
+            method = INPUT_METHOD_UINPUT if samples else INPUT_METHOD_POSTED
+            if not samples:
+                samples = self._collect_input_samples(None)
+        finally:
+            app.removeEventFilter(self)
+            if device is not None:
+                device.close()
+        return samples, method
+
+    def _collect_input_samples(self, device) -> List[float]:
+        samples = []
+        for _ in range(self.samples):
+            self._key_received_at = None
+            self._awaiting_key = True
+            injected_at = time.time() * 1000
+            if device is not None:
+                device.write(input_capture.ecodes.EV_KEY, input_capture.ecodes.KEY_SPACE, 1)
+                device.write(input_capture.ecodes.EV_KEY, input_capture.ecodes.KEY_SPACE, 0)
+                device.syn()
+            else:
+                QApplication.postEvent(self.input_target, QKeyEvent(
+                    QEvent.Type.KeyPress, Qt.Key.Key_Space, Qt.KeyboardModifier.NoModifier))
+            self._wait_for(lambda: self._key_received_at is not None)
+            self._awaiting_key = False
+            if self._key_received_at is None:
+                if device is not None:
+                    return []
+                continue
+            samples.append(self._key_received_at - injected_at)
+        return samples
+
+    def eventFilter(self, obj, event) -> bool:
+        # 校准期间拦截空格键，避免触发界面上的按钮
+        if event.type() in (QEvent.Type.KeyPress, QEvent.Type.KeyRelease) \
+                and event.key() == Qt.Key.Key_Space and (self._awaiting_key or self._key_received_at):
+            if event.type() == QEvent.Type.KeyPress and self._key_received_at is None:
+                self._key_received_at = time.time() * 1000
+            return True
+        return False
+
+    def _wait_for(self, condition) -> Optional[float]:
+        """处理事件直到条件成立，返回成立时刻（epoch ms），超时返回None"""
+        deadline = time.perf_counter() + self.timeout_ms / 1000
+        while time.perf_counter() < deadline:
+            QApplication.processEvents(QEventLoop.ProcessEventsFlag.AllEvents)
+            if condition():
+                return time.time() * 1000
+        return None
+
+    def _screen_shows(self, color: QColor) -> bool:
+        """回读刺激区域中心像素是否已变为指定颜色"""
+        screen = self.display.screen()
+        if screen is None:
+            return False
+        # 从顶层窗口截取：对子控件调用 winId() 会把它变成原生窗口，改变合成路径
+        window = self.display.window()
+        center = self.display.mapTo(window, self.display.rect().center())
+        pixmap = screen.grabWindow(window.winId(), center.x(), center.y(), 1, 1)
+        if pixmap.isNull():
+            return False
+        pixel = pixmap.toImage().pixelColor(0, 0)
+        return (abs(pixel.red() - color.red()) <= 16 and abs(pixel.green() - color.green()) <= 16
+                and abs(pixel.blue() - color.blue()) <= 16)
+
+
+class EvdevResponseBridge(QObject):
+    """evdev采集线程到GUI线程的桥接
+
+    采集线程中直接发射信号，Qt自动以排队连接投递到GUI线程，
+    反应时按内核事件时间戳计算，不受GUI线程排队耗时影响。
+    """
+
+    response_captured = pyqtSignal(object)  # input_capture.InputEvent
+
+    # evdev按键名 -> Qt按键（鼠标左键为None）
+    KEY_MAP = {
+        'KEY_SPACE': Qt.Key.Key_Space,
+        'KEY_1': Qt.Key.Key_1,
+        'KEY_2': Qt.Key.Key_2,
+        'KEY_3': Qt.Key.Key_3,
+        'KEY_4': Qt.Key.Key_4,
+        'BTN_LEFT': None
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.backend = None
+        self.latency_tracker = input_capture.DeliveryLatencyTracker()
+
+    @property
+    def is_active(self) -> bool:
+        return self.backend is not None
+
+    def start(self):
+        """启动采集线程"""
+        if self.backend is not None:
+            return
+        backend = input_capture.EvdevInputBackend(self._on_kernel_event)
+        backend.start()
+        self.backend = backend
+        self.latency_tracker.reset()
+
+    def stop(self):
+        """停止采集线程"""
+        if self.backend is not None:
+            self.backend.stop()
+            self.backend = None
+
+    @staticmethod
+    def latency_key(key: Optional[Qt.Key]) -> int:
+        """内核事件与Qt事件配对用的按键编号（鼠标左键为0）"""
+        return int(key) if key is not None else 0
+
+    def _on_kernel_event(self, event):
+        # 在采集线程中执行
+        self.response_captured.emit(event)
+
+
+class LiveReactionPlot(QWidget):
+    """测试过程中的实时反应时曲线
+
+    曲线绘制在缓存的QPixmap上，每个试次只增量绘制新增的线段和标记点，
+    paintEvent只贴图，不做整图重绘；坐标轴需要扩展时才整体重绘一次。
+    """
+
+    MARGIN_LEFT = 40
+    MARGIN_RIGHT = 10
+    MARGIN_TOP = 10
+    MARGIN_BOTTOM = 20
+
+    def __init__(self):
+        super().__init__()
+        self.setMinimumHeight(140)
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
+
+        self._rt_pen = QPen(QColor(0, 90, 200), 2)
+        self._mean_pen = QPen(QColor(220, 60, 60), 1.5, Qt.PenStyle.DashLine)
+        self._timeout_pen = QPen(QColor(255, 140, 0), 2)
+        self._axis_pen = QPen(QColor(120, 120, 120), 1)
+        self._grid_pen = QPen(QColor(225, 225, 225), 1)
+
+        self._pixmap = QPixmap()
+        self.update_costs = []
+        self.reset(10)
+
+    def reset(self, total_trials: int):
+        """开始新一轮测试时清空曲线"""
+        self.x_max = max(total_trials, 2)
+        self.y_max = 1000.0
+        self._points = []
+        self._rt_sum = 0.0
+        self._rt_count = 0
+        self._last_rt_point = None
+        self._last_mean_point = None
+        self.update_costs = []
+        self._render_all()
+
+    def add_point(self, reaction_time: Optional[float]):
+        """追加一个试次（None表示超时），返回本次更新耗时（ms）"""
+        start = time.perf_counter()
+
+        self._points.append(reaction_time)
+        if reaction_time is not None:
+            self._rt_sum += reaction_time
+            self._rt_count += 1
+
+        if len(self._points) > self.x_max or (reaction_time is not None and reaction_time > self.y_max):
+            # 超出坐标范围：扩展后整体重绘（很少发生）
+            while len(self._points) > self.x_max:
+                self.x_max *= 2
+            while reaction_time is not None and reaction_time > self.y_max:
+                self.y_max *= 1.5
+            self._render_all()
+        else:
+            painter = QPainter(self._pixmap)
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+            dirty = self._draw_point(painter, len(self._points) - 1, reaction_time)
+            painter.end()
+            self.update(dirty)
+
+        cost = (time.perf_counter() - start) * 1000
+        self.update_costs.append(cost)
+        return cost
+
+    def average_update_ms(self) -> float:
+        """平均单次更新耗时"""
+        return sum(self.update_costs) / len(self.update_costs) if self.update_costs else 0.0
+
+    def _map(self, index: int, value: float) -> QPointF:
+        """数据坐标转换为像素坐标"""
+        plot_w = self._pixmap.width() - self.MARGIN_LEFT - self.MARGIN_RIGHT
+        plot_h = self._pixmap.height() - self.MARGIN_TOP - self.MARGIN_BOTTOM
+        x = self.MARGIN_LEFT + plot_w * (index + 1) / self.x_max
+        y = self.MARGIN_TOP + plot_h * (1 - min(value, self.y_max) / self.y_max)
+        return QPointF(x, y)
+
+    def _draw_point(self, painter: QPainter, index: int, reaction_time: Optional[float]) -> QRect:
+        """增量绘制单个试次，返回需要刷新的区域"""
+        if reaction_time is None:
+            # 超时只画底部标记，不参与连线和平均
+            point = self._map(index, 0)
+            painter.setPen(self._timeout_pen)
+            painter.drawLine(QPointF(point.x(), point.y() - 6), QPointF(point.x(), point.y()))
+            return QRectF(point.x() - 3, point.y() - 8, 6, 10).toAlignedRect()
+
+        rt_point = self._map(index, reaction_time)
+        mean_point = self._map(index, self._rt_sum / self._rt_count)
+        dirty = QRectF(rt_point, rt_point).united(QRectF(mean_point, mean_point))
+
+        if self._last_rt_point is not None:
+            painter.setPen(self._rt_pen)
+            painter.drawLine(self._last_rt_point, rt_point)
+            painter.setPen(self._mean_pen)
+            painter.drawLine(self._last_mean_point, mean_point)
+            dirty = dirty.united(QRectF(self._last_rt_point, self._last_rt_point))
+            dirty = dirty.united(QRectF(self._last_mean_point, self._last_mean_point))
+
+        painter.setPen(self._rt_pen)
+        painter.setBrush(QColor(0, 90, 200))
+        painter.drawEllipse(rt_point, 3, 3)
+
+        self._last_rt_point = rt_point
+        self._last_mean_point = mean_point
+        return dirty.adjusted(-5, -5, 5, 5).toAlignedRect()
+
+    def _render_all(self):
+        """整体重绘（尺寸或坐标范围变化时）"""
+        size = self.size()
+        if size.width() <= 0 or size.height() <= 0:
+            return
+        self._pixmap = QPixmap(size)
+        self._pixmap.fill(QColor(255, 255, 255))
+
+        painter = QPainter(self._pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setFont(QFont("Arial", 8))
+
+        # 网格与坐标轴
+        for i in range(5):
+            value = self.y_max * i / 4
+            y = self._map(0, value).y()
+            painter.setPen(self._grid_pen)
+            painter.drawLine(QPointF(self.MARGIN_LEFT, y), QPointF(self._pixmap.width() - self.MARGIN_RIGHT, y))
+            painter.setPen(self._axis_pen)
+            painter.drawText(QRectF(0, y - 8, self.MARGIN_LEFT - 4, 16),
+                             Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, f"{value:.0f}")
+        painter.drawText(QRectF(self.MARGIN_LEFT, self._pixmap.height() - self.MARGIN_BOTTOM,
+                                self._pixmap.width() - self.MARGIN_LEFT, self.MARGIN_BOTTOM),
+                         Qt.AlignmentFlag.AlignCenter, "试次  （蓝: 反应时 ms / 红虚线: 累计平均）")
+
+        # 已有数据点
+        self._last_rt_point = None
+        self._last_mean_point = None
+        rt_sum, rt_count = self._rt_sum, self._rt_count
+        self._rt_sum, self._rt_count = 0.0, 0
+        for index, rt in enumerate(self._points):
+            if rt is not None:
+                self._rt_sum += rt
+                self._rt_count += 1
+            self._draw_point(painter, index, rt)
+        self._rt_sum, self._rt_count = rt_sum, rt_count
+
+        painter.end()
+        self.update()
+
+    def resizeEvent(self, event):
+        """尺寸变化时重建缓存"""
+        super().resizeEvent(event)
+        self._render_all()
+
+    def paintEvent(self, event):
+        """只把缓存图贴到需要刷新的区域"""
+        painter = QPainter(self)
+        painter.drawPixmap(event.rect(), self._pixmap, event.rect())
+
+
+class StatisticsTableModel(QAbstractTableModel):
+    """本轮统计结果表格模型"""
+
+    ROW_LABELS = ["平均反应时", "反应时标准差", "最快反应时", "最慢反应时", "正确率", "有效试次"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._values = [""] * len(self.ROW_LABELS)
+
+    def set_statistics(self, stats: Dict[str, Any]):
+        """更新统计值（仅通知数值列变化）"""
+        if stats:
+            self._values = [
+                f"{stats.get('average', 0):.1f} ms",
+                f"{stats.get('std', 0):.1f} ms",
+                f"{stats.get('min', 0):.1f} ms",
+                f"{stats.get('max', 0):.1f} ms",
+                f"{stats.get('accuracy', 0):.1f}%",
+                f"{stats.get('valid_trials', 0)}/{stats.get('total_trials', 0)}"
+            ]
+        else:
+            self._values = [""] * len(self.ROW_LABELS)
+
+        self.dataChanged.emit(self.index(0, 1), self.index(len(self.ROW_LABELS) - 1, 1))
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.ROW_LABELS)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else 2
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if index.column() == 0:
+            return self.ROW_LABELS[index.row()]
+        return self._values[index.row()]
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return ["指标", "数值"][section]
+        return None
+
+
+class HistoryTableModel(QAbstractTableModel):
+    """历史记录表格模型
+
+    按需分页从数据库读取（canFetchMore/fetchMore），视图滚动到底部时才加载下一页；
+    排序交给数据库完成，切换排序只重新读取第一页。
+    """
+
+    COLUMNS = [
+        ('test_type', "测试类型"),
+        ('stimulus_type', "刺激类型"),
+        ('avg_reaction_time', "平均反应时"),
+        ('test_date', "测试时间")
+    ]
+
+    def __init__(self, db_manager: Optional['DatabaseManager'] = None, page_size: int = 100, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.page_size = page_size
+        self.user_id = None
+        self.order_by = 'test_date'
+        self.descending = True
+
+        # 每行保存 (显示值元组, 分页键)
+        self._rows = []
+        self._exhausted = True
+
+    def set_user(self, user_id: Optional[str]):
+        """切换用户（同一用户不重复查询）"""
+        if user_id == self.user_id:
+            return
+        self.user_id = user_id
+        self.refresh()
+
+    def refresh(self):
+        """丢弃已加载的行，由视图按需重新读取第一页"""
+        self.beginResetModel()
+        self._rows = []
+        self._exhausted = not (self.user_id and self.db_manager)
+        self.endResetModel()
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+
+        after = self._rows[-1][1] if self._rows else None
+        page = self.db_manager.get_user_history_page(
+            self.user_id, order_by=self.order_by, descending=self.descending,
+            after=after, limit=self.page_size
+        )
+        if len(page) < self.page_size:
+            self._exhausted = True
+        if not page:
+            return
+
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(page) - 1)
+        for record in page:
+            test_date = record.get('test_date', '') or ''
+            if isinstance(test_date, str) and len(test_date) > 10:
+                test_date = test_date[:10]
+            display = (
+                record.get('test_type', ''),
+                record.get('stimulus_type', ''),
+                f"{record.get('avg_reaction_time') or 0:.1f} ms",
+                test_date
+            )
+            self._rows.append((display, (record.get(self.order_by), record.get('stat_id'))))
+        self.endInsertRows()
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.SortOrder.AscendingOrder):
+        order_by = self.COLUMNS[column][0]
+        descending = order == Qt.SortOrder.DescendingOrder
+        if (order_by, descending) == (self.order_by, self.descending):
+            return
+        self.order_by = order_by
+        self.descending = descending
+        self.refresh()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return self._rows[index.row()][0][index.column()]
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.COLUMNS[section][1]
+        return str(section + 1)
+
+
+class ParticipantSearchModel(QAbstractListModel):
+    """参与者查找结果模型（输入联想）
+
+    与历史记录表格相同，按键集分页从参与者目录读取，弹出列表滚动到底部时才加载下一页。
+    """
+
+    def __init__(self, db_manager: Optional['DatabaseManager'] = None, page_size: int = 20, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.page_size = page_size
+        self.query = ''
+        self._rows: List[Dict[str, Any]] = []
+        self._exhausted = True
+
+    def set_query(self, query: str):
+        """切换查询词并立即读取第一页"""
+        self.beginResetModel()
+        self.query = query.strip()
+        self._rows = []
+        self._exhausted = not (self.query and self.db_manager)
+        self.endResetModel()
+        self.fetchMore()
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+
+        directory = self.db_manager.directory
+        page = directory.search(self.query, after=directory.next_cursor(self._rows), limit=self.page_size)
+        if len(page) < self.page_size:
+            self._exhausted = True
+        if not page:
+            return
+
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(page) - 1)
+        self._rows.extend(page)
+        self.endInsertRows()
+
+    def participant(self, row: int) -> Dict[str, Any]:
+        return self._rows[row]
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            details = " · ".join(text for text in (row.get('name'), row.get('occupation')) if text)
+            return f"{row['user_id']}  {details}" if details else row['user_id']
+        if role == Qt.ItemDataRole.EditRole:
+            return row['user_id']
+        return None
+
+
 class StatisticsWidget(QWidget):
     """统计结果显示部件"""
 
@@ -885,12 +1130,10 @@ class StatisticsWidget(QWidget):
         layout.addWidget(title_label)
 
         # 统计信息表格
-        self.stats_table = QTableWidget(6, 2)
-        self.stats_table.setHorizontalHeaderLabels(["指标", "数值"])
-        self.stats_table.setVerticalHeaderLabels([
-            "平均反应时", "反应时标准差", "最快反应时",
-            "最慢反应时", "正确率", "有效试次"
-        ])
+        self.stats_model = StatisticsTableModel(self)
+        self.stats_table = QTableView()
+        self.stats_table.setModel(self.stats_model)
+        self.stats_table.verticalHeader().setVisible(False)
         self.stats_table.horizontalHeader().setStretchLastSection(True)
         self.stats_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
         layout.addWidget(self.stats_table)
@@ -900,10 +1143,14 @@ class StatisticsWidget(QWidget):
         history_label.setStyleSheet("font-size: 14px; font-weight: bold; margin-top: 10px;")
         layout.addWidget(history_label)
 
-        self.history_table = QTableWidget(10, 4)
-        self.history_table.setHorizontalHeaderLabels(["测试类型", "刺激类型", "平均反应时", "测试时间"])
+        self.history_model = HistoryTableModel(parent=self)
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
         self.history_table.horizontalHeader().setStretchLastSection(True)
+        self.history_table.horizontalHeader().setSortIndicator(3, Qt.SortOrder.DescendingOrder)
+        self.history_table.setSortingEnabled(True)
         self.history_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.history_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         layout.addWidget(self.history_table)
 
         self.setLayout(layout)
@@ -913,28 +1160,20 @@ class StatisticsWidget(QWidget):
         self.statistics = stats
 
         # 更新统计表格
-        if stats:
-            self.stats_table.setItem(0, 1, QTableWidgetItem(f"{stats.get('average', 0):.1f} ms"))
-            self.stats_table.setItem(1, 1, QTableWidgetItem(f"{stats.get('std', 0):.1f} ms"))
-            self.stats_table.setItem(2, 1, QTableWidgetItem(f"{stats.get('min', 0):.1f} ms"))
-            self.stats_table.setItem(3, 1, QTableWidgetItem(f"{stats.get('max', 0):.1f} ms"))
-            self.stats_table.setItem(4, 1, QTableWidgetItem(f"{stats.get('accuracy', 0):.1f}%"))
-            self.stats_table.setItem(5, 1,
-                                     QTableWidgetItem(f"{stats.get('valid_trials', 0)}/{stats.get('total_trials', 0)}"))
-
-    def update_history(self, history_data: List[Dict[str, Any]]):
-        """更新历史记录"""
-        self.history_table.setRowCount(min(len(history_data), 10))
-
-        for i, record in enumerate(history_data[:10]):
-            self.history_table.setItem(i, 0, QTableWidgetItem(record.get('test_type', '')))
-            self.history_table.setItem(i, 1, QTableWidgetItem(record.get('stimulus_type', '')))
-            self.history_table.setItem(i, 2, QTableWidgetItem(f"{record.get('avg_reaction_time', 0):.1f} ms"))
-
-            test_date = record.get('test_date', '')
-            if isinstance(test_date, str) and len(test_date) > 10:
-                test_date = test_date[:10]
-            self.history_table.setItem(i, 3, QTableWidgetItem(test_date))
+        self.stats_model.set_statistics(stats)
+
+    def set_database(self, db_manager: 'DatabaseManager'):
+        """设置历史记录数据源"""
+        self.history_model.db_manager = db_manager
+        self.history_model.refresh()
+
+    def set_history_user(self, user_id: Optional[str]):
+        """切换历史记录所属用户"""
+        self.history_model.set_user(user_id)
+
+    def refresh_history(self):
+        """重新加载历史记录（只读取第一页）"""
+        self.history_model.refresh()
 
 
 class ReactionTestApp(QMainWindow):
@@ -948,6 +1187,7 @@ class ReactionTestApp(QMainWindow):
 
         # 连接信号
         self.connect_signals()
+        self.init_memory_watchdog()
 
     def init_ui(self):
         """初始化用户界面"""
@@ -987,6 +1227,15 @@ class ReactionTestApp(QMainWindow):
 
         self.user_id_input = QLineEdit()
         self.user_id_input.setPlaceholderText("请输入用户ID")
+        self.user_id_input.editingFinished.connect(self.load_user_history)
+
+        # 输入用户ID、姓名或职业的开头即可从参与者目录中选择
+        self.participant_model = ParticipantSearchModel(parent=self)
+        self.participant_completer = QCompleter(self.participant_model, self)
+        self.participant_completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.participant_completer.setWidget(self.user_id_input)
+        self.participant_completer.activated[QModelIndex].connect(self.select_participant)
+        self.user_id_input.textEdited.connect(self.search_participants)
 
         self.user_name_input = QLineEdit()
         self.user_name_input.setPlaceholderText("请输入姓名")
@@ -1059,8 +1308,30 @@ class ReactionTestApp(QMainWindow):
         self.difficulty_combo = QComboBox()
         self.difficulty_combo.addItems(["简单", "中等", "困难"])
 
+        self.requeue_invalid_check = QCheckBox("无效试次重测")
+        self.requeue_invalid_check.setToolTip("过早反应、注意力失误和超时的试次自动追加重测")
+
+        self.realtime_mode_check = QCheckBox("实时模式")
+        self.realtime_mode_check.setToolTip("测试期间暂停垃圾回收、提高进程优先级并绑定CPU核心，降低计时噪声")
+
         param_layout.addRow("测试次数:", self.trial_count_spin)
         param_layout.addRow("难度级别:", self.difficulty_combo)
+        param_layout.addRow("质量控制:", self.requeue_invalid_check)
+        self.kernel_input_check = QCheckBox("内核输入时间戳 (evdev)")
+        self.kernel_input_check.setToolTip("在独立线程读取 /dev/input 设备，按内核事件时间戳计算反应时")
+        self.kernel_input_check.setEnabled(input_capture.is_available())
+
+        param_layout.addRow("计时:", self.realtime_mode_check)
+        param_layout.addRow("输入:", self.kernel_input_check)
+
+        latency_layout = QHBoxLayout()
+        self.latency_label = QLabel("未校准")
+        self.calibrate_btn = QPushButton("延迟校准")
+        self.calibrate_btn.setToolTip("测量本机显示与输入延迟，测试时自动从反应时中扣除")
+        self.calibrate_btn.clicked.connect(self.run_latency_calibration)
+        latency_layout.addWidget(self.latency_label)
+        latency_layout.addWidget(self.calibrate_btn)
+        param_layout.addRow("延迟:", latency_layout)
         param_group.setLayout(param_layout)
         test_layout.addWidget(param_group)
 
@@ -1153,8 +1424,16 @@ class ReactionTestApp(QMainWindow):
         self.last_reaction_label = QLabel("上次反应: --")
         self.last_reaction_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
+        self.live_plot_check = QCheckBox("实时曲线")
+        self.live_plot_check.toggled.connect(self.toggle_live_plot)
+
+        self.live_plot = LiveReactionPlot()
+        self.live_plot.setVisible(False)
+
         feedback_layout.addWidget(self.feedback_label)
         feedback_layout.addWidget(self.last_reaction_label)
+        feedback_layout.addWidget(self.live_plot_check)
+        feedback_layout.addWidget(self.live_plot)
         feedback_group.setLayout(feedback_layout)
         layout.addWidget(feedback_group)
 
@@ -1231,8 +1510,46 @@ class ReactionTestApp(QMainWindow):
 
     def init_test_engine(self):
         """初始化测试引擎"""
-        self.test_engine = TestEngine()
+        # 测试引擎与界面共用同一个数据库管理对象（共享查询缓存）
         self.db_manager = DatabaseManager()
+        self.test_engine = TestEngine(self.db_manager)
+        self.stats_widget.set_database(self.db_manager)
+        self.participant_model.db_manager = self.db_manager
+        # 配置了测试厅监控服务（REACTION_TEST_FEED）时推送试次事件
+        attach_feed(self.test_engine.core)
+        self.input_bridge = EvdevResponseBridge()
+
+        # 读取本工作站的延迟档案
+        self.latency_profile = self.db_manager.get_latency_profile(station_id())
+        self.update_latency_label()
+
+    def init_memory_watchdog(self):
+        """长时间运行的内存看门狗（测试进行中不检查）"""
+        self.memory_watchdog = MemoryWatchdog(is_busy=lambda: self.test_engine.is_test_running, parent=self)
+        self.memory_watchdog.budget_exceeded.connect(self.soft_restart)
+        if watchdog_enabled():
+            self.memory_watchdog.start()
+
+    def soft_restart(self, report: Optional[Dict[str, Any]] = None):
+        """释放重量级组件：已关闭的对话框、图表、查询缓存与实时曲线，然后重建内存基线"""
+        if self.test_engine.is_test_running:
+            return
+
+        for dialog in self.findChildren(QDialog):
+            if not dialog.isVisible():
+                dialog.deleteLater()
+        plt.close('all')
+        self.db_manager.clear_cache()
+        self.live_plot.reset(self.trial_count_spin.value())
+        self.stats_widget.refresh_history()
+
+        def finish():
+            gc.collect()
+            self.memory_watchdog.rebaseline()
+            self.memory_watchdog.log(f"软重启完成, RSS {process_rss_mb():.1f} MB")
+
+        # 等待 deleteLater 在事件循环中执行后再回收与重建基线
+        QTimer.singleShot(0, finish)
 
     def connect_signals(self):
         """连接信号和槽"""
@@ -1243,6 +1560,10 @@ class ReactionTestApp(QMainWindow):
         self.test_engine.test_completed.connect(self.on_test_completed)
         self.test_engine.test_timeout.connect(self.on_test_timeout)
 
+        # 内核输入后端
+        self.kernel_input_check.toggled.connect(self.toggle_kernel_input)
+        self.input_bridge.response_captured.connect(self.on_kernel_input)
+
     def create_app_icon(self):
         """创建应用程序图标"""
         pixmap = QPixmap(64, 64)
@@ -1317,10 +1638,14 @@ class ReactionTestApp(QMainWindow):
             test_type=test_type,
             stimulus_type=stimulus_type,
             user_data=self.current_user,
-            trials=trial_count
+            trials=trial_count,
+            requeue_invalid=self.requeue_invalid_check.isChecked(),
+            realtime=self.realtime_mode_check.isChecked(),
+            latency_correction=self.current_latency_correction()
         )
 
-        # 开始测试
+        # 开始测试（测试期间暂停内存看门狗的分配跟踪）
+        self.memory_watchdog.pause()
         if self.test_engine.start_test():
             # 更新UI状态
             self.start_btn.setEnabled(False)
@@ -1343,16 +1668,100 @@ class ReactionTestApp(QMainWindow):
             self.test_type_label.setText(f"当前测试: {test_type_text}")
             self.stim_type_label.setText(f"刺激类型: {stim_type_text}")
             self.trial_progress_label.setText(f"进度: 0/{trial_count}")
+            self.live_plot.reset(trial_count)
             self.feedback_label.setText("准备开始...")
 
             # 加载用户历史记录
             self.load_user_history()
+        else:
+            self.memory_watchdog.resume()
 
     def stop_test(self):
         """停止测试"""
         self.test_engine.stop_test()
         self.on_test_stopped()
 
+    def toggle_live_plot(self, checked: bool):
+        """显示/隐藏实时曲线"""
+        self.live_plot.setVisible(checked)
+        if not checked and self.live_plot.update_costs:
+            print(f"实时曲线平均更新耗时: {self.live_plot.average_update_ms():.3f} ms")
+
+    def current_latency_correction(self) -> float:
+        """当前输入方式下需要扣除的工作站延迟"""
+        if self.latency_profile is None:
+            return 0.0
+        return self.latency_profile.correction_ms(kernel_input=self.input_bridge.is_active)
+
+    def update_latency_label(self):
+        """更新延迟校准状态显示"""
+        profile = self.latency_profile
+        if profile is None:
+            self.latency_label.setText("未校准")
+            return
+        input_text = "未扣除" if profile.input_method == INPUT_METHOD_POSTED else f"{profile.input_latency_ms:.1f} ms"
+        self.latency_label.setText(f"显示 {profile.display_latency_ms:.1f} ms / 输入 {input_text}")
+        self.latency_label.setToolTip(
+            f"工作站: {profile.station_id}\n校准时间: {profile.calibrated_time}\n"
+            f"显示: {profile.display_method}, 输入: {profile.input_method}")
+
+    def run_latency_calibration(self):
+        """执行工作站延迟校准"""
+        if self.test_engine.is_test_running:
+            return
+
+        self.calibrate_btn.setEnabled(False)
+        self.start_btn.setEnabled(False)
+        self.feedback_label.setText("正在校准显示与输入延迟...")
+        try:
+            calibrator = LatencyCalibrator(self.stimulus_display, self)
+            profile = calibrator.run()
+        finally:
+            self.calibrate_btn.setEnabled(True)
+            self.start_btn.setEnabled(True)
+
+        if not profile.samples:
+            self.feedback_label.setText("延迟校准失败")
+            QMessageBox.warning(self, "警告", "延迟校准失败：未采集到有效样本")
+            return
+
+        self.latency_profile = profile
+        self.db_manager.save_latency_profile(profile)
+        self.update_latency_label()
+        self.feedback_label.setText(
+            f"延迟校准完成：合计扣除 {self.current_latency_correction():.1f} ms")
+
+    def toggle_kernel_input(self, checked: bool):
+        """启用/停用evdev内核输入后端"""
+        if not checked:
+            self.input_bridge.stop()
+            return
+        try:
+            self.input_bridge.start()
+        except (RuntimeError, OSError) as e:
+            print(f"启动内核输入后端失败: {e}")
+            QMessageBox.warning(self, "警告", f"无法启用内核输入时间戳: {str(e)}")
+            self.kernel_input_check.setChecked(False)
+
+    def on_kernel_input(self, event):
+        """evdev按下事件（已排队到GUI线程）"""
+        key = EvdevResponseBridge.KEY_MAP.get(event.name)
+        self.input_bridge.latency_tracker.kernel_event(EvdevResponseBridge.latency_key(key), event.timestamp)
+        if not self.test_engine.is_test_running:
+            return
+
+        if key is None:
+            self.handle_test_click(None, response_time=event.timestamp)
+        else:
+            self.handle_test_key(key, response_time=event.timestamp)
+
+    def report_input_latency(self):
+        """输出内核事件到Qt事件送达的延迟"""
+        latency = self.input_bridge.latency_tracker.summary()
+        if latency['count']:
+            print(f"内核→Qt输入延迟: {latency['count']} 次, 均值 {latency['mean']:.2f} ms, "
+                  f"P95 {latency['p95']:.2f} ms, 最大 {latency['max']:.2f} ms")
+
     def on_test_started(self, message: str):
         """测试开始槽函数"""
         self.feedback_label.setText(message)
@@ -1362,11 +1771,11 @@ class ReactionTestApp(QMainWindow):
         self.stimulus_display.display_stimulus(stimulus)
         self.feedback_label.setText("请反应！")
 
-    def on_response_recorded(self, response: Dict[str, Any]):
+    def on_response_recorded(self, record: TrialRecord):
         """反应记录槽函数"""
-        trial = response['trial']
-        reaction_time = response['reaction_time']
-        is_correct = response['is_correct']
+        trial = record.trial
+        reaction_time = record.reaction_time
+        is_correct = record.is_correct
 
         # 更新进度
         total_trials = self.trial_count_spin.value()
@@ -1376,7 +1785,14 @@ class ReactionTestApp(QMainWindow):
         self.reaction_time_label.setText(f"反应时间: {reaction_time:.0f} ms")
 
         # 显示反馈
-        if is_correct:
+        qc_label = record.qc_label
+        if qc_label == QC_ANTICIPATION:
+            feedback = f"⚠ 过早反应！反应时间: {reaction_time:.0f} ms"
+            color = "orange"
+        elif qc_label == QC_SLOW_OUTLIER:
+            feedback = f"⚠ 反应过慢（注意力失误）: {reaction_time:.0f} ms"
+            color = "orange"
+        elif is_correct:
             feedback = f"✓ 正确！反应时间: {reaction_time:.0f} ms"
             color = "green"
         else:
@@ -1386,6 +1802,10 @@ class ReactionTestApp(QMainWindow):
         self.last_reaction_label.setText(feedback)
         self.last_reaction_label.setStyleSheet(f"color: {color}; font-weight: bold;")
 
+        # 实时曲线（增量绘制）
+        if self.live_plot.isVisible():
+            self.live_plot.add_point(reaction_time)
+
         # 清除刺激显示
         QTimer.singleShot(500, self.stimulus_display.clear_stimulus)
 
@@ -1409,19 +1829,26 @@ class ReactionTestApp(QMainWindow):
             # 显示结果对话框
             self.show_result_dialog(statistics)
 
-        # 重新加载历史记录
-        self.load_user_history()
+        # 刷新历史记录（新结果在第一页）
+        self.stats_widget.refresh_history()
+
+        if self.input_bridge.is_active:
+            self.report_input_latency()
 
     def on_test_timeout(self):
         """测试超时槽函数"""
         self.last_reaction_label.setText("⏰ 超时！")
         self.last_reaction_label.setStyleSheet("color: orange; font-weight: bold;")
 
+        if self.live_plot.isVisible():
+            self.live_plot.add_point(None)
+
         # 清除刺激显示
         self.stimulus_display.clear_stimulus()
 
     def on_test_stopped(self):
         """测试停止槽函数"""
+        self.memory_watchdog.resume()
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
 
@@ -1461,18 +1888,8 @@ class ReactionTestApp(QMainWindow):
         test_type = self.get_current_test_type()
         stim_type = self.get_current_stimulus_type()
 
-        test_type_text = {
-            "simple": "简单反应时",
-            "choice": "选择反应时",
-            "disjunctive": "析取反应时"
-        }.get(test_type, "未知")
-
-        stim_type_text = {
-            "color": "颜色刺激",
-            "shape": "图形刺激",
-            "symbol": "符号刺激",
-            "text": "语言引导"
-        }.get(stim_type, "未知")
+        test_type_text = TEST_TYPE_NAMES.get(test_type, "未知")
+        stim_type_text = STIMULUS_TYPE_NAMES.get(stim_type, "未知")
 
         result_table.setItem(0, 1, QTableWidgetItem(test_type_text))
         result_table.setItem(1, 1, QTableWidgetItem(stim_type_text))
@@ -1484,18 +1901,7 @@ class ReactionTestApp(QMainWindow):
         layout.addWidget(result_table)
 
         # 评价
-        avg_rt = statistics.get('average', 0)
-        accuracy = statistics.get('accuracy', 0)
-
-        if avg_rt < 250 and accuracy > 95:
-            evaluation = "优秀！反应迅速且准确。"
-            color = "#27ae60"
-        elif avg_rt < 400 and accuracy > 90:
-            evaluation = "良好！反应速度和准确性都不错。"
-            color = "#f39c12"
-        else:
-            evaluation = "有待提高！建议多练习。"
-            color = "#e74c3c"
+        evaluation, color = evaluate_performance(statistics.get('average', 0), statistics.get('accuracy', 0))
 
         eval_label = QLabel(evaluation)
         eval_label.setStyleSheet(f"font-size: 14px; color: {color}; font-weight: bold; padding: 10px;")
@@ -1509,13 +1915,34 @@ class ReactionTestApp(QMainWindow):
 
         dialog.setLayout(layout)
         dialog.exec()
+        # 对话框以主窗口为父对象，不显式释放会一直保留到程序退出
+        dialog.deleteLater()
+
+    def search_participants(self, text: str):
+        """按输入内容查找参与者并弹出候选列表"""
+        self.participant_model.set_query(text)
+        if self.participant_model.rowCount():
+            self.participant_completer.complete()
+        else:
+            self.participant_completer.popup().hide()
+
+    def select_participant(self, index: QModelIndex):
+        """选中候选参与者：填入其登记信息并加载历史记录"""
+        # 候选列表经过补全器的代理模型，按行号取回原始数据
+        participant = self.participant_model.participant(index.row())
+        self.user_id_input.setText(participant['user_id'])
+        self.user_name_input.setText(participant.get('name') or '')
+        if participant.get('age'):
+            self.user_age_input.setValue(int(participant['age']))
+        if participant.get('gender'):
+            self.user_gender_combo.setCurrentText(participant['gender'])
+        self.user_occupation_input.setText(participant.get('occupation') or '')
+        self.load_user_history()
 
     def load_user_history(self):
         """加载用户历史记录"""
         user_id = self.user_id_input.text().strip()
-        if user_id:
-            history = self.db_manager.get_user_history(user_id, limit=10)
-            self.stats_widget.update_history(history)
+        self.stats_widget.set_history_user(user_id or None)
 
     def export_to_excel(self):
         """导出数据到Excel"""
@@ -1591,6 +2018,7 @@ class ReactionTestApp(QMainWindow):
             QMessageBox.warning(self, "警告", "没有足够的数据生成图表")
             return
 
+        chart_window = None
         try:
             # 创建图表窗口
             chart_window = QDialog(self)
@@ -1599,59 +2027,12 @@ class ReactionTestApp(QMainWindow):
 
             layout = QVBoxLayout()
 
-            # 创建Matplotlib图表
-            fig, axes = plt.subplots(2, 2, figsize=(10, 8))
+            # 创建Matplotlib图表（直接创建Figure而不经过pyplot，避免每次生成隐藏的管理窗口）
+            fig = Figure(figsize=(10, 8))
             fig.suptitle(f'用户 {user_id} - 反应时测试统计图表', fontsize=16)
+            draw_history_chart(fig, history)
 
-            # 准备数据
-            test_types = [h.get('test_type', '未知') for h in history]
-            avg_times = [h.get('avg_reaction_time', 0) for h in history]
-            dates = [h.get('test_date', '')[:10] for h in history]
-            accuracy = [h.get('accuracy_rate', 0) for h in history]
-
-            # 1. 平均反应时折线图
-            axes[0, 0].plot(range(len(avg_times)), avg_times, 'b-o', linewidth=2, markersize=6)
-            axes[0, 0].set_xlabel('测试序号')
-            axes[0, 0].set_ylabel('平均反应时 (ms)')
-            axes[0, 0].set_title('平均反应时变化趋势')
-            axes[0, 0].grid(True, alpha=0.3)
-
-            # 2. 正确率柱状图
-            axes[0, 1].bar(range(len(accuracy)), accuracy, color='green', alpha=0.7)
-            axes[0, 1].set_xlabel('测试序号')
-            axes[0, 1].set_ylabel('正确率 (%)')
-            axes[0, 1].set_title('测试正确率')
-            axes[0, 1].set_ylim([0, 100])
-            axes[0, 1].grid(True, alpha=0.3, axis='y')
-
-            # 3. 测试类型分布饼图
-            type_counts = {}
-            for t in test_types:
-                type_counts[t] = type_counts.get(t, 0) + 1
-
-            if type_counts:
-                types = list(type_counts.keys())
-                counts = list(type_counts.values())
-                colors = ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99']
-                axes[1, 0].pie(counts, labels=types, autopct='%1.1f%%', colors=colors[:len(types)])
-                axes[1, 0].set_title('测试类型分布')
-
-            # 4. 反应时箱线图
-            all_times = []
-            type_labels = []
-            for t in set(test_types):
-                times = [avg_times[i] for i in range(len(test_types)) if test_types[i] == t]
-                if times:
-                    all_times.append(times)
-                    type_labels.append(t)
-
-            if all_times:
-                axes[1, 1].boxplot(all_times, labels=type_labels)
-                axes[1, 1].set_ylabel('反应时 (ms)')
-                axes[1, 1].set_title('不同测试类型反应时分布')
-                axes[1, 1].grid(True, alpha=0.3, axis='y')
-
-            plt.tight_layout()
+            fig.tight_layout()
 
             # 将Matplotlib图表嵌入到Qt中
             canvas = FigureCanvas(fig)
@@ -1660,6 +2041,8 @@ class ReactionTestApp(QMainWindow):
             # 添加保存按钮
             button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Save |
                                           QDialogButtonBox.StandardButton.Close)
+            model_btn = button_box.addButton("模型参数", QDialogButtonBox.ButtonRole.ActionRole)
+            model_btn.clicked.connect(lambda: self.show_model_parameters(user_id))
             button_box.accepted.connect(lambda: self.save_chart(fig, user_id))
             button_box.rejected.connect(chart_window.reject)
             layout.addWidget(button_box)
@@ -1667,10 +2050,60 @@ class ReactionTestApp(QMainWindow):
             chart_window.setLayout(layout)
             chart_window.exec()
 
-            plt.close(fig)
-
         except Exception as e:
             QMessageBox.critical(self, "错误", f"生成图表失败: {str(e)}")
+        finally:
+            # 对话框以主窗口为父对象，不显式释放会一直驻留
+            if chart_window is not None:
+                chart_window.deleteLater()
+
+    def show_model_parameters(self, user_id: str):
+        """拟合并显示反应时分布模型参数"""
+        try:
+            # 单个用户数据量小，直接在当前进程拟合（未变化的单元会被跳过）
+            run_fitting_job(self.db_manager.db_path, user_ids=[user_id], workers=1)
+            params = get_model_parameters(self.db_manager.db_path, user_id)
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"模型拟合失败: {str(e)}")
+            return
+
+        if not params:
+            QMessageBox.warning(self, "警告", "没有足够的试次数据进行模型拟合")
+            return
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle("反应时模型参数")
+        dialog.setMinimumWidth(800)
+        layout = QVBoxLayout()
+
+        headers = ["测试类型", "刺激类型", "有效试次", "μ (ms)", "σ (ms)", "τ (ms)",
+                   "漂移率", "边界间距", "非决策时间 (ms)"]
+        keys = ['test_type', 'stimulus_type', 'n_valid', 'exg_mu', 'exg_sigma', 'exg_tau',
+                'ddm_drift', 'ddm_boundary', 'ddm_ndt']
+
+        table = QTableWidget(len(params), len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        for i, row in enumerate(params):
+            for j, key in enumerate(keys):
+                value = row.get(key)
+                if value is None:
+                    text = "--"
+                elif isinstance(value, float):
+                    text = f"{value:.3f}" if key in ('ddm_drift', 'ddm_boundary') else f"{value:.1f}"
+                else:
+                    text = str(value)
+                table.setItem(i, j, QTableWidgetItem(text))
+        table.resizeColumnsToContents()
+        layout.addWidget(table)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        button_box.rejected.connect(dialog.reject)
+        layout.addWidget(button_box)
+
+        dialog.setLayout(layout)
+        dialog.exec()
+        dialog.deleteLater()
 
     def save_chart(self, fig, user_id: str):
         """保存图表"""
@@ -1695,13 +2128,13 @@ class ReactionTestApp(QMainWindow):
 
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                # 重新初始化数据库（删除所有数据）
-                self.db_manager = DatabaseManager()
-                self.db_manager.init_database()
+                # 删除全部月分区并清空主库中的用户、试次与统计（db_maintenance.py）
+                self.db_manager.clear_all_data()
+                self.participant_model.set_query('')
 
                 # 清空统计显示
                 self.stats_widget.update_statistics({})
-                self.stats_widget.update_history([])
+                self.stats_widget.set_history_user(None)
 
                 # 清空状态显示
                 self.test_type_label.setText("当前测试: 无")
@@ -1724,19 +2157,35 @@ class ReactionTestApp(QMainWindow):
         # 处理测试中的按键
         key = event.key()
 
+        if self.input_bridge.is_active:
+            # 内核输入后端已记录反应，这里只统计Qt事件送达延迟
+            self.input_bridge.latency_tracker.qt_event(EvdevResponseBridge.latency_key(key))
+        else:
+            self.handle_test_key(key)
+
+        super().keyPressEvent(event)
+
+    def handle_test_key(self, key: Qt.Key, response_time: Optional[float] = None):
+        """测试中的按键反应"""
         # 简单反应时：空格键
         if self.get_current_test_type() == "simple":
             if key == Qt.Key.Key_Space:
-                self.test_engine.record_response(key)
+                self.test_engine.record_response(key, response_time=response_time)
 
         # 选择反应时：数字键1-4
         elif self.get_current_test_type() == "choice":
             if key in [Qt.Key.Key_1, Qt.Key.Key_2, Qt.Key.Key_3, Qt.Key.Key_4]:
-                self.test_engine.record_response(key)
+                self.test_engine.record_response(key, response_time=response_time)
 
         # 析取反应时：鼠标处理，这里不处理键盘
 
-        super().keyPressEvent(event)
+    def handle_test_click(self, click_pos: Optional[QPoint], response_time: Optional[float] = None):
+        """测试中的鼠标反应"""
+        # 析取反应时：鼠标点击
+        if self.get_current_test_type() == "disjunctive":
+            # 这里可以添加检查点击位置是否在目标上的逻辑
+            # 简化处理：只要有点击就认为正确
+            self.test_engine.record_response(click_pos=click_pos, response_time=response_time)
 
     def mousePressEvent(self, event: QMouseEvent):
         """鼠标事件处理"""
@@ -1744,11 +2193,11 @@ class ReactionTestApp(QMainWindow):
             super().mousePressEvent(event)
             return
 
-        # 析取反应时：鼠标点击
-        if self.get_current_test_type() == "disjunctive":
-            # 这里可以添加检查点击位置是否在目标上的逻辑
-            # 简化处理：只要有点击就认为正确
-            self.test_engine.record_response(click_pos=event.pos())
+        if self.input_bridge.is_active:
+            if event.button() == Qt.MouseButton.LeftButton:
+                self.input_bridge.latency_tracker.qt_event(EvdevResponseBridge.latency_key(None))
+        else:
+            self.handle_test_click(event.pos())
 
         super().mousePressEvent(event)
 
@@ -1770,6 +2219,9 @@ class ReactionTestApp(QMainWindow):
         )
 
         if reply == QMessageBox.StandardButton.Yes:
+            self.input_bridge.stop()
+            # 关闭时顺带更新查询规划统计（每天最多一次，开销很小；分区与整理由夜间任务运行）
+            self.db_manager.run_maintenance(tasks=['optimize'])
             event.accept()
         else:
             event.ignore()
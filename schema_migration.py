@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+规范化数据库结构迁移
+把 test_records / test_statistics / users 中逐行重复的文本列改为整数编码：
+- 测试类型、刺激类型 -> 查找表 test_types / stimulus_types 的小整数编码
+- user_id -> participants 表的整数代理键 user_key
+- test_time / test_date / created_time -> 整数epoch秒
+原表名改为兼容视图（带 INSTEAD OF 触发器），DatabaseManager / WebDatabaseManager
+以及其他脚本中的查询与写入无需修改。
+
+用法: python schema_migration.py --db reaction_test.db
+      python schema_migration.py --benchmark --rows 500000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Dict, List
+
+# 固定编码（未知类型写入时自动追加）
+TEST_TYPE_CODES = {'simple': 1, 'choice': 2, 'disjunctive': 3}
+STIMULUS_TYPE_CODES = {'color': 1, 'shape': 2, 'symbol': 3, 'text': 4}
+
+NORMALIZED_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS test_types (
+        type_id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS stimulus_types (
+        type_id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS participants (
+        user_key INTEGER PRIMARY KEY,
+        user_id TEXT UNIQUE NOT NULL,
+        name TEXT,
+        age INTEGER,
+        gender TEXT,
+        occupation TEXT,
+        created_time INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS trials (
+        record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_key INTEGER REFERENCES participants (user_key),
+        test_type_id INTEGER REFERENCES test_types (type_id),
+        stimulus_type_id INTEGER REFERENCES stimulus_types (type_id),
+        trial_index INTEGER,
+        stimulus_content TEXT,
+        reaction_time REAL,
+        is_correct INTEGER,
+        qc_label TEXT,
+        latency_correction REAL,
+        test_time INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS run_statistics (
+        stat_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_key INTEGER REFERENCES participants (user_key),
+        test_type_id INTEGER REFERENCES test_types (type_id),
+        stimulus_type_id INTEGER REFERENCES stimulus_types (type_id),
+        avg_reaction_time REAL,
+        std_reaction_time REAL,
+        min_reaction_time REAL,
+        max_reaction_time REAL,
+        accuracy_rate REAL,
+        total_trials INTEGER,
+        test_date INTEGER
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_trials_user_cell ON trials (user_key, test_type_id, stimulus_type_id)',
+    'CREATE INDEX IF NOT EXISTS idx_run_statistics_user_date ON run_statistics (user_key, test_date, stat_id)',
+]
+
+# 兼容视图：列名与列顺序与原表一致，时间还原为原来的文本格式
+COMPAT_VIEWS_SQL = [
+    '''
+    CREATE VIEW IF NOT EXISTS users AS
+    SELECT p.user_id, p.name, p.age, p.gender, p.occupation,
+           datetime(p.created_time, 'unixepoch') AS created_time
+    FROM participants p
+    ''',
+    '''
+    CREATE VIEW IF NOT EXISTS test_records AS
+    SELECT t.record_id, p.user_id, tt.name AS test_type, st.name AS stimulus_type,
+           t.trial_index, t.stimulus_content, t.reaction_time, t.is_correct, t.qc_label,
+           t.latency_correction, datetime(t.test_time, 'unixepoch') AS test_time
+    FROM trials t
+    LEFT JOIN participants p ON p.user_key = t.user_key
+    LEFT JOIN test_types tt ON tt.type_id = t.test_type_id
+    LEFT JOIN stimulus_types st ON st.type_id = t.stimulus_type_id
+    ''',
+    '''
+    CREATE VIEW IF NOT EXISTS test_statistics AS
+    SELECT s.stat_id, p.user_id, tt.name AS test_type, st.name AS stimulus_type,
+           s.avg_reaction_time, s.std_reaction_time, s.min_reaction_time, s.max_reaction_time,
+           s.accuracy_rate, s.total_trials, date(s.test_date, 'unixepoch') AS test_date
+    FROM run_statistics s
+    LEFT JOIN participants p ON p.user_key = s.user_key
+    LEFT JOIN test_types tt ON tt.type_id = s.test_type_id
+    LEFT JOIN stimulus_types st ON st.type_id = s.stimulus_type_id
+    ''',
+]
+
+# 写入视图时先补齐查找表，再换算为整数编码
+# 各语句均不会产生唯一约束冲突，外层 INSERT OR REPLACE 的冲突策略不会误删参与者行
+_ENSURE_LOOKUPS = '''
+        INSERT INTO participants (user_id, created_time)
+        SELECT NEW.user_id, CAST(strftime('%s', 'now') AS INTEGER)
+        WHERE NEW.user_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM participants WHERE user_id = NEW.user_id);
+        INSERT INTO test_types (name)
+        SELECT NEW.test_type
+        WHERE NEW.test_type IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM test_types WHERE name = NEW.test_type);
+        INSERT INTO stimulus_types (name)
+        SELECT NEW.stimulus_type
+        WHERE NEW.stimulus_type IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM stimulus_types WHERE name = NEW.stimulus_type);
+'''
+
+_CODES = '''
+            (SELECT user_key FROM participants WHERE user_id = NEW.user_id),
+            (SELECT type_id FROM test_types WHERE name = NEW.test_type),
+            (SELECT type_id FROM stimulus_types WHERE name = NEW.stimulus_type),
+'''
+
+COMPAT_TRIGGERS_SQL = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS users_insert INSTEAD OF INSERT ON users
+    BEGIN
+        UPDATE participants
+        SET name = NEW.name, age = NEW.age, gender = NEW.gender, occupation = NEW.occupation
+        WHERE user_id = NEW.user_id;
+        INSERT INTO participants (user_id, name, age, gender, occupation, created_time)
+        SELECT NEW.user_id, NEW.name, NEW.age, NEW.gender, NEW.occupation,
+               COALESCE(CAST(strftime('%s', NEW.created_time) AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER))
+        WHERE NOT EXISTS (SELECT 1 FROM participants WHERE user_id = NEW.user_id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS users_delete INSTEAD OF DELETE ON users
+    BEGIN
+        DELETE FROM participants WHERE user_id = OLD.user_id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS test_records_insert INSTEAD OF INSERT ON test_records
+    BEGIN
+        {_ENSURE_LOOKUPS}
+        INSERT INTO trials (record_id, user_key, test_type_id, stimulus_type_id, trial_index,
+                            stimulus_content, reaction_time, is_correct, qc_label,
+                            latency_correction, test_time)
+        VALUES (
+            NEW.record_id,{_CODES}
+            NEW.trial_index, NEW.stimulus_content, NEW.reaction_time, NEW.is_correct, NEW.qc_label,
+            NEW.latency_correction,
+            COALESCE(CAST(strftime('%s', NEW.test_time) AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER))
+        );
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS test_records_delete INSTEAD OF DELETE ON test_records
+    BEGIN
+        DELETE FROM trials WHERE record_id = OLD.record_id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS test_statistics_insert INSTEAD OF INSERT ON test_statistics
+    BEGIN
+        {_ENSURE_LOOKUPS}
+        INSERT INTO run_statistics (stat_id, user_key, test_type_id, stimulus_type_id,
+                                    avg_reaction_time, std_reaction_time, min_reaction_time,
+                                    max_reaction_time, accuracy_rate, total_trials, test_date)
+        VALUES (
+            NEW.stat_id,{_CODES}
+            NEW.avg_reaction_time, NEW.std_reaction_time, NEW.min_reaction_time,
+            NEW.max_reaction_time, NEW.accuracy_rate, NEW.total_trials,
+            CAST(strftime('%s', NEW.test_date) AS INTEGER)
+        );
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS test_statistics_delete INSTEAD OF DELETE ON test_statistics
+    BEGIN
+        DELETE FROM run_statistics WHERE stat_id = OLD.stat_id;
+    END
+    ''',
+]
+
+
+def is_normalized(conn: sqlite3.Connection) -> bool:
+    """数据库是否已迁移为规范化结构（test_records 为兼容视图）"""
+    row = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'test_records'").fetchone()
+    return row is not None and row[0] == 'view'
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _seed_lookups(conn: sqlite3.Connection):
+    conn.executemany("INSERT OR IGNORE INTO test_types (type_id, name) VALUES (?, ?)",
+                     [(code, name) for name, code in TEST_TYPE_CODES.items()])
+    conn.executemany("INSERT OR IGNORE INTO stimulus_types (type_id, name) VALUES (?, ?)",
+                     [(code, name) for name, code in STIMULUS_TYPE_CODES.items()])
+
+
+def migrate_database(db_path: str, backup: bool = True) -> Dict[str, int]:
+    """把旧结构数据库迁移为规范化结构（已迁移则直接返回）"""
+    conn = sqlite3.connect(db_path)
+    if is_normalized(conn):
+        conn.close()
+        return {'trials': 0, 'statistics': 0, 'participants': 0}
+
+    if backup:
+        shutil.copyfile(db_path, db_path + '.bak')
+
+    # 旧库可能缺少后加的列
+    record_columns = _columns(conn, 'test_records')
+    qc_expr = 'r.qc_label' if 'qc_label' in record_columns else 'NULL'
+    latency_expr = 'r.latency_correction' if 'latency_correction' in record_columns else 'NULL'
+
+    try:
+        conn.execute('BEGIN')
+        for sql in NORMALIZED_TABLES_SQL:
+            conn.execute(sql)
+        _seed_lookups(conn)
+
+        # 查找表：补充编码表之外的类型
+        for table, column in (('test_types', 'test_type'), ('stimulus_types', 'stimulus_type')):
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {table} (name)
+                SELECT {column} FROM test_records WHERE {column} IS NOT NULL
+                UNION SELECT {column} FROM test_statistics WHERE {column} IS NOT NULL
+            ''')
+
+        # 参与者：用户表加上只出现在记录中的用户
+        conn.execute('''
+            INSERT INTO participants (user_id, name, age, gender, occupation, created_time)
+            SELECT user_id, name, age, gender, occupation, CAST(strftime('%s', created_time) AS INTEGER)
+            FROM users WHERE user_id IS NOT NULL
+        ''')
+        conn.execute('''
+            INSERT OR IGNORE INTO participants (user_id)
+            SELECT user_id FROM test_records WHERE user_id IS NOT NULL
+            UNION SELECT user_id FROM test_statistics WHERE user_id IS NOT NULL
+        ''')
+
+        conn.execute(f'''
+            INSERT INTO trials (record_id, user_key, test_type_id, stimulus_type_id, trial_index,
+                                stimulus_content, reaction_time, is_correct, qc_label,
+                                latency_correction, test_time)
+            SELECT r.record_id, p.user_key, tt.type_id, st.type_id, r.trial_index,
+                   r.stimulus_content, r.reaction_time, r.is_correct, {qc_expr},
+                   {latency_expr}, CAST(strftime('%s', r.test_time) AS INTEGER)
+            FROM test_records r
+            LEFT JOIN participants p ON p.user_id = r.user_id
+            LEFT JOIN test_types tt ON tt.name = r.test_type
+            LEFT JOIN stimulus_types st ON st.name = r.stimulus_type
+            ORDER BY r.record_id
+        ''')
+        conn.execute('''
+            INSERT INTO run_statistics (stat_id, user_key, test_type_id, stimulus_type_id,
+                                        avg_reaction_time, std_reaction_time, min_reaction_time,
+                                        max_reaction_time, accuracy_rate, total_trials, test_date)
+            SELECT s.stat_id, p.user_key, tt.type_id, st.type_id,
+                   s.avg_reaction_time, s.std_reaction_time, s.min_reaction_time,
+                   s.max_reaction_time, s.accuracy_rate, s.total_trials,
+                   CAST(strftime('%s', s.test_date) AS INTEGER)
+            FROM test_statistics s
+            LEFT JOIN participants p ON p.user_id = s.user_id
+            LEFT JOIN test_types tt ON tt.name = s.test_type
+            LEFT JOIN stimulus_types st ON st.name = s.stimulus_type
+            ORDER BY s.stat_id
+        ''')
+
+        counts = {
+            'trials': conn.execute('SELECT COUNT(*) FROM trials').fetchone()[0],
+            'statistics': conn.execute('SELECT COUNT(*) FROM run_statistics').fetchone()[0],
+            'participants': conn.execute('SELECT COUNT(*) FROM participants').fetchone()[0]
+        }
+
+        conn.execute('DROP TABLE test_records')
+        conn.execute('DROP TABLE test_statistics')
+        conn.execute('DROP TABLE users')
+        for sql in COMPAT_VIEWS_SQL + COMPAT_TRIGGERS_SQL:
+            conn.execute(sql)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        conn.close()
+        raise
+
+    conn.execute('VACUUM')
+    conn.execute('ANALYZE')
+    conn.close()
+    return counts
+
+
+def create_legacy_database(db_path: str, rows: int, users: int = 2000, seed: int = 0):
+    """生成旧结构的合成数据库（基准测试用）"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE users (
+            user_id TEXT PRIMARY KEY, name TEXT, age INTEGER, gender TEXT, occupation TEXT,
+            created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE test_records (
+            record_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, test_type TEXT,
+            stimulus_type TEXT, trial_index INTEGER, stimulus_content TEXT, reaction_time REAL,
+            is_correct INTEGER, qc_label TEXT, latency_correction REAL,
+            test_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE test_statistics (
+            stat_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, test_type TEXT,
+            stimulus_type TEXT, avg_reaction_time REAL, std_reaction_time REAL,
+            min_reaction_time REAL, max_reaction_time REAL, accuracy_rate REAL,
+            total_trials INTEGER, test_date DATE);
+        CREATE INDEX idx_statistics_user_date ON test_statistics (user_id, test_date, stat_id);
+    ''')
+    user_ids = [f"user_{1700000000 + i}" for i in range(users)]
+    conn.executemany("INSERT INTO users (user_id, name, age, gender, occupation) VALUES (?, ?, ?, ?, ?)",
+                     [(uid, f"参与者{i}", rng.randint(18, 60), rng.choice(['男', '女']), '学生')
+                      for i, uid in enumerate(user_ids)])
+
+    test_types = list(TEST_TYPE_CODES)
+    stimulus_types = list(STIMULUS_TYPE_CODES)
+    records, stats = [], []
+    trials_per_run = 10
+    for run in range(rows // trials_per_run):
+        uid = rng.choice(user_ids)
+        test_type = rng.choice(test_types)
+        stimulus_type = rng.choice(stimulus_types)
+        day = f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        for i in range(trials_per_run):
+            rt = rng.gauss(320, 60)
+            records.append((uid, test_type, stimulus_type, i, '{"type": "color", "color": "#ff0000"}',
+                            rt, 1, 'valid', 0.0, f"{day} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"))
+        stats.append((uid, test_type, stimulus_type, 320.0, 60.0, 200.0, 450.0, 100.0, trials_per_run, day))
+    conn.executemany('''
+        INSERT INTO test_records (user_id, test_type, stimulus_type, trial_index, stimulus_content,
+                                  reaction_time, is_correct, qc_label, latency_correction, test_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', records)
+    conn.executemany('''
+        INSERT INTO test_statistics (user_id, test_type, stimulus_type, avg_reaction_time,
+                                     std_reaction_time, min_reaction_time, max_reaction_time,
+                                     accuracy_rate, total_trials, test_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', stats)
+    conn.commit()
+    conn.execute('VACUUM')
+    conn.close()
+    return user_ids
+
+
+def _time_queries(db_path: str, user_ids: List[str], repeat: int = 3) -> Dict[str, float]:
+    """代表性查询耗时（ms，取最小值）"""
+    sample_users = user_ids[:50]
+    conn = sqlite3.connect(db_path)
+    # 单列扫描直接读底层表，分组扫描与按用户查询经过兼容视图
+    base_table = 'trials' if is_normalized(conn) else 'test_records'
+    queries = {
+        'full_scan_by_type': ('SELECT test_type, stimulus_type, COUNT(*), AVG(reaction_time) '
+                              'FROM test_records GROUP BY test_type, stimulus_type', None),
+        'full_scan_raw': (f'SELECT SUM(reaction_time) FROM {base_table}', None),
+        'user_history': ('SELECT * FROM test_statistics WHERE user_id = ? '
+                         'ORDER BY test_date DESC, stat_id DESC LIMIT 50', sample_users),
+        'user_trials': ('SELECT * FROM test_records WHERE user_id = ? AND test_type = ? '
+                        'ORDER BY trial_index LIMIT 1000', sample_users),
+    }
+
+    timings = {}
+    for name, (sql, users) in queries.items():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            if users is None:
+                conn.execute(sql).fetchall()
+            elif sql.count('?') == 2:
+                for uid in users:
+                    conn.execute(sql, (uid, 'simple')).fetchall()
+            else:
+                for uid in users:
+                    conn.execute(sql, (uid,)).fetchall()
+            best = min(best, (time.perf_counter() - start) * 1000)
+        timings[name] = best
+    conn.close()
+    return timings
+
+
+def run_benchmark(rows: int = 200000, users: int = 2000) -> Dict[str, Dict[str, float]]:
+    """对比迁移前后的数据库大小与查询耗时"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_path = os.path.join(tmp_dir, 'legacy.db')
+        normalized_path = os.path.join(tmp_dir, 'normalized.db')
+
+        user_ids = create_legacy_database(legacy_path, rows, users)
+        shutil.copyfile(legacy_path, normalized_path)
+
+        start = time.perf_counter()
+        migrate_database(normalized_path, backup=False)
+        migrate_seconds = time.perf_counter() - start
+
+        result = {}
+        for label, path in (('legacy', legacy_path), ('normalized', normalized_path)):
+            result[label] = {'size_mb': os.path.getsize(path) / 1024 / 1024}
+            result[label].update(_time_queries(path, user_ids))
+        result['normalized']['migrate_seconds'] = migrate_seconds
+    return result
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="迁移为规范化数据库结构")
+    parser.add_argument('--db', default=None, help="要迁移的数据库路径（迁移前自动备份为 .bak）")
+    parser.add_argument('--no-backup', action='store_true', help="迁移前不备份")
+    parser.add_argument('--benchmark', action='store_true', help="用合成数据对比迁移前后的大小与查询耗时")
+    parser.add_argument('--rows', type=int, default=200000, help="基准测试的试次记录数")
+    args = parser.parse_args()
+
+    if args.db:
+        counts = migrate_database(args.db, backup=not args.no_backup)
+        print(f"迁移完成: {counts['trials']} 条试次记录, {counts['statistics']} 条统计结果, "
+              f"{counts['participants']} 个参与者")
+
+    if args.benchmark:
+        result = run_benchmark(args.rows)
+        for label in ('legacy', 'normalized'):
+            metrics = result[label]
+            print(f"{label:>10}: 大小 {metrics['size_mb']:.1f} MB, "
+                  f"分组全表扫描 {metrics['full_scan_by_type']:.1f} ms, "
+                  f"单列全表扫描 {metrics['full_scan_raw']:.1f} ms, "
+                  f"50个用户历史 {metrics['user_history']:.1f} ms, "
+                  f"50个用户试次 {metrics['user_trials']:.1f} ms")
+        print(f"迁移耗时 {result['normalized']['migrate_seconds']:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列式测试记录归档
+把已完成的试次记录从SQLite定期导出为按月分区的NumPy列文件：
+
+    archive/
+        _state.json                 已归档到的 record_id
+        month=2026-10/
+            meta.json               行数、时间范围、字典列的取值表
+            record_id.npy  user_id.npy  test_type.npy  ...
+
+user_id / test_type / stimulus_type / qc_label 以分区内字典编码存储。读取时以内存映射
+打开列文件，只加载查询需要的列（列裁剪），按月份、时间范围、用户和测试类型先跳过整个
+分区、再在编码列上筛选行（谓词下推），分析任务无需访问在用数据库。
+
+用法: python session_archive.py archive --db reaction_test.db --out archive
+      python session_archive.py summary --out archive --start 2026-01-01
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from calendar import timegm
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from db_maintenance import merge_ordered, open_partitions
+
+TIMEOUT_MS = 3000
+
+# 列名 -> 存储类型（字典列存为编码）
+ARCHIVE_COLUMNS = {
+    'record_id': np.int64,
+    'user_id': np.int32,
+    'test_type': np.uint8,
+    'stimulus_type': np.uint8,
+    'trial_index': np.int32,
+    'reaction_time': np.float64,
+    'is_correct': np.bool_,
+    'qc_label': np.uint8,
+    'latency_correction': np.float64,
+    'test_time': np.int64,
+}
+
+DICTIONARY_COLUMNS = ('user_id', 'test_type', 'stimulus_type', 'qc_label')
+
+STATE_FILE = '_state.json'
+META_FILE = 'meta.json'
+
+
+def _parse_day(value: Optional[str]) -> Optional[int]:
+    """'YYYY-MM-DD' -> UTC epoch秒"""
+    if value is None:
+        return None
+    return timegm(time.strptime(value, '%Y-%m-%d'))
+
+
+def _month_of(epoch: int) -> str:
+    return time.strftime('%Y-%m', time.gmtime(epoch))
+
+
+def _read_json(path: str, default: Any) -> Any:
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data: Any):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _save_column(path: str, values: np.ndarray):
+    """先写临时文件再替换，读者不会看到写了一半的列"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, values)
+    os.replace(tmp_path, path)
+
+
+def _fetch_new_records(db_path: str, after_record_id: int, settle_seconds: int) -> List[Tuple]:
+    """读取待归档的记录（只读连接）
+
+    最近settle_seconds内的记录可能属于进行中的测试，留到下次。遇到第一条过新的记录即停止，
+    保证已归档的 record_id 是连续前缀，之后不会漏掉任何记录。
+    """
+    cutoff = int(time.time()) - settle_seconds
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    # 已移入月分区（db_maintenance.py）但尚未归档的记录也要读取
+    partitions = open_partitions(db_path)
+    try:
+        cursors = []
+        for source in (conn, *partitions):
+            columns = [row[1] for row in source.execute("PRAGMA table_info(test_records)")]
+            qc_expr = 'qc_label' if 'qc_label' in columns else 'NULL'
+            latency_expr = 'latency_correction' if 'latency_correction' in columns else 'NULL'
+            cursors.append(source.execute(f'''
+                SELECT record_id, user_id, test_type, stimulus_type, trial_index, reaction_time,
+                       is_correct, {qc_expr}, {latency_expr}, CAST(strftime('%s', test_time) AS INTEGER)
+                FROM test_records
+                WHERE record_id > ?
+                ORDER BY record_id
+            ''', (after_record_id,)))
+        rows = list(merge_ordered(cursors, 1))
+    finally:
+        for source in (conn, *partitions):
+            source.close()
+
+    for i, row in enumerate(rows):
+        if row[-1] is not None and row[-1] > cutoff:
+            return rows[:i]
+    return rows
+
+
+def _append_partition(partition_dir: str, rows: List[Tuple]):
+    """把一个月的新记录追加到分区（字典只追加新取值，已有编码保持不变）
+
+    meta.json 的行数是提交点：列文件中超出该行数的部分是上次中断留下的，追加前截掉；
+    元数据已更新但 _state.json 未更新时，已在分区中的记录（record_id 不大于最后一行）跳过。
+    """
+    os.makedirs(partition_dir, exist_ok=True)
+    meta_path = os.path.join(partition_dir, META_FILE)
+    meta = _read_json(meta_path, {'rows': 0, 'min_time': None, 'max_time': None,
+                                  'dictionaries': {name: [] for name in DICTIONARY_COLUMNS}})
+
+    if meta['rows']:
+        record_ids = np.load(os.path.join(partition_dir, 'record_id.npy'), mmap_mode='r')
+        last_record_id = int(record_ids[meta['rows'] - 1])
+        del record_ids
+        rows = [row for row in rows if row[0] > last_record_id]
+        if not rows:
+            return
+
+    names = list(ARCHIVE_COLUMNS)
+    raw = dict(zip(names, zip(*rows)))
+
+    new_columns = {}
+    for name, dtype in ARCHIVE_COLUMNS.items():
+        values = raw[name]
+        if name in DICTIONARY_COLUMNS:
+            dictionary = meta['dictionaries'][name]
+            index = {value: code for code, value in enumerate(dictionary)}
+            codes = []
+            for value in values:
+                code = index.get(value)
+                if code is None:
+                    code = index[value] = len(dictionary)
+                    dictionary.append(value)
+                codes.append(code)
+            new_columns[name] = np.asarray(codes, dtype=dtype)
+        elif name == 'latency_correction':
+            new_columns[name] = np.asarray([v if v is not None else 0.0 for v in values], dtype=dtype)
+        elif name == 'reaction_time':
+            new_columns[name] = np.asarray([v if v is not None else TIMEOUT_MS for v in values], dtype=dtype)
+        else:
+            new_columns[name] = np.asarray([v if v is not None else 0 for v in values], dtype=dtype)
+
+    for name, values in new_columns.items():
+        path = os.path.join(partition_dir, f"{name}.npy")
+        if meta['rows']:
+            values = np.concatenate([np.load(path)[:meta['rows']], values])
+        _save_column(path, values)
+
+    times = new_columns['test_time']
+    meta['rows'] += len(rows)
+    meta['min_time'] = int(times.min()) if meta['min_time'] is None else min(meta['min_time'], int(times.min()))
+    meta['max_time'] = int(times.max()) if meta['max_time'] is None else max(meta['max_time'], int(times.max()))
+    # 列文件全部写完后再更新元数据
+    _write_json(meta_path, meta)
+
+
+def archive_database(db_path: str, archive_dir: str, settle_seconds: int = 3600) -> Dict[str, Any]:
+    """增量归档：导出上次归档之后的已完成记录"""
+    start = time.perf_counter()
+    os.makedirs(archive_dir, exist_ok=True)
+    state_path = os.path.join(archive_dir, STATE_FILE)
+    state = _read_json(state_path, {'last_record_id': 0})
+
+    rows = _fetch_new_records(db_path, state['last_record_id'], settle_seconds)
+    by_month: Dict[str, List[Tuple]] = {}
+    for row in rows:
+        by_month.setdefault(_month_of(row[-1] or 0), []).append(row)
+
+    for month, month_rows in sorted(by_month.items()):
+        _append_partition(os.path.join(archive_dir, f"month={month}"), month_rows)
+
+    if rows:
+        state['last_record_id'] = rows[-1][0]
+        _write_json(state_path, state)
+
+    return {
+        'rows': len(rows),
+        'partitions': sorted(by_month),
+        'last_record_id': state['last_record_id'],
+        'elapsed_seconds': time.perf_counter() - start
+    }
+
+
+class ArchiveReader:
+    """归档读取（内存映射、列裁剪、谓词下推）"""
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+        self.last_scan: Dict[str, int] = {}
+
+    def partitions(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """全部分区 (目录, 元数据)，按月份排序"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        result = []
+        for name in sorted(os.listdir(self.archive_dir)):
+            meta_path = os.path.join(self.archive_dir, name, META_FILE)
+            if name.startswith('month=') and os.path.exists(meta_path):
+                result.append((os.path.join(self.archive_dir, name), _read_json(meta_path, None)))
+        return result
+
+    def scan(self, columns: Iterable[str], user_ids: Optional[Iterable[str]] = None,
+             test_types: Optional[Iterable[str]] = None, stimulus_types: Optional[Iterable[str]] = None,
+             start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """按条件读取指定列
+
+        start / end 为 'YYYY-MM-DD'（UTC，end当天包含在内）。字典列解码为字符串数组，
+        其他列为对应数值类型。
+        """
+        columns = list(columns)
+        unknown = [name for name in columns if name not in ARCHIVE_COLUMNS]
+        if unknown:
+            raise ValueError(f"未知的归档列: {unknown}")
+
+        start_ts = _parse_day(start)
+        end_ts = _parse_day(end) + 86400 if end is not None else None
+        filters = {'user_id': user_ids, 'test_type': test_types, 'stimulus_type': stimulus_types}
+        filters = {name: set(values) for name, values in filters.items() if values is not None}
+
+        parts = {name: [] for name in columns}
+        stats = {'partitions_scanned': 0, 'partitions_skipped': 0, 'columns_loaded': 0, 'rows': 0}
+
+        for partition_dir, meta in self.partitions():
+            # 分区级裁剪：时间范围与字典中是否存在所需取值
+            if start_ts is not None and meta['max_time'] < start_ts:
+                stats['partitions_skipped'] += 1
+                continue
+            if end_ts is not None and meta['min_time'] >= end_ts:
+                stats['partitions_skipped'] += 1
+                continue
+            code_filters = {}
+            for name, wanted in filters.items():
+                code_filters[name] = [code for code, value in enumerate(meta['dictionaries'][name])
+                                      if value in wanted]
+            if any(not codes for codes in code_filters.values()):
+                stats['partitions_skipped'] += 1
+                continue
+            stats['partitions_scanned'] += 1
+
+            def load(name: str) -> np.ndarray:
+                stats['columns_loaded'] += 1
+                # 只读到元数据记录的行数，不读中断追加留下的尾部
+                return np.load(os.path.join(partition_dir, f"{name}.npy"), mmap_mode='r')[:meta['rows']]
+
+            # 行级筛选：只在编码列和时间列上计算掩码
+            mask = None
+            for name, codes in code_filters.items():
+                column_mask = np.isin(load(name), codes)
+                mask = column_mask if mask is None else mask & column_mask
+            if start_ts is not None or end_ts is not None:
+                times = load('test_time')
+                time_mask = np.ones(len(times), dtype=bool)
+                if start_ts is not None:
+                    time_mask &= times >= start_ts
+                if end_ts is not None:
+                    time_mask &= times < end_ts
+                mask = time_mask if mask is None else mask & time_mask
+
+            indices = None
+            if mask is not None:
+                indices = np.flatnonzero(mask)
+                if not len(indices):
+                    continue
+            stats['rows'] += meta['rows'] if indices is None else len(indices)
+
+            for name in columns:
+                values = load(name)
+                values = np.array(values) if indices is None else values[indices]
+                if name in DICTIONARY_COLUMNS:
+                    dictionary = np.asarray(meta['dictionaries'][name], dtype=object)
+                    values = dictionary[values]
+                parts[name].append(values)
+
+        self.last_scan = stats
+        result = {}
+        for name in columns:
+            if parts[name]:
+                result[name] = np.concatenate(parts[name])
+            else:
+                dtype = object if name in DICTIONARY_COLUMNS else ARCHIVE_COLUMNS[name]
+                result[name] = np.empty(0, dtype=dtype)
+        return result
+
+
+def valid_mask(reaction_times: np.ndarray, correct: np.ndarray, qc_labels: np.ndarray) -> np.ndarray:
+    """正确且通过质量控制（旧记录没有标签时按未超时判断）"""
+    labelled = qc_labels != None  # noqa: E711 对象数组逐元素比较
+    return correct & np.where(labelled, qc_labels == 'valid', reaction_times < TIMEOUT_MS)
+
+
+def cohort_summary(archive_dir: str, test_types: Optional[Iterable[str]] = None,
+                   start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+    """全体参与者按 测试类型×刺激类型 汇总（只读取需要的5列）"""
+    reader = ArchiveReader(archive_dir)
+    data = reader.scan(['user_id', 'test_type', 'stimulus_type', 'reaction_time', 'is_correct', 'qc_label'],
+                       test_types=test_types, start=start, end=end)
+    if not len(data['reaction_time']):
+        return pd.DataFrame()
+
+    valid = valid_mask(data['reaction_time'], data['is_correct'], data['qc_label'])
+    frame = pd.DataFrame({
+        'test_type': data['test_type'],
+        'stimulus_type': data['stimulus_type'],
+        'user_id': data['user_id'],
+        'valid_rt': np.where(valid, data['reaction_time'], np.nan),
+        'is_correct': data['is_correct']
+    })
+    summary = frame.groupby(['test_type', 'stimulus_type']).agg(
+        participants=('user_id', 'nunique'),
+        trials=('is_correct', 'size'),
+        mean_rt=('valid_rt', 'mean'),
+        median_rt=('valid_rt', 'median'),
+        accuracy=('is_correct', 'mean')
+    )
+    summary['accuracy'] *= 100
+    return summary
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="按月分区的列式测试记录归档")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    archive_parser = subparsers.add_parser('archive', help="增量归档已完成的记录")
+    archive_parser.add_argument('--db', default='reaction_test.db', help="数据库路径")
+    archive_parser.add_argument('--out', default='archive', help="归档目录")
+    archive_parser.add_argument('--settle', type=int, default=3600,
+                                help="只归档早于该秒数的记录（避开进行中的测试）")
+
+    summary_parser = subparsers.add_parser('summary', help="从归档计算全体汇总")
+    summary_parser.add_argument('--out', default='archive', help="归档目录")
+    summary_parser.add_argument('--test-type', action='append', dest='test_types', help="只统计指定测试类型")
+    summary_parser.add_argument('--start', default=None, help="起始日期 YYYY-MM-DD")
+    summary_parser.add_argument('--end', default=None, help="结束日期 YYYY-MM-DD（含）")
+    args = parser.parse_args()
+
+    if args.command == 'archive':
+        result = archive_database(args.db, args.out, args.settle)
+        print(f"归档 {result['rows']} 条记录到 {len(result['partitions'])} 个分区, "
+              f"已归档至 record_id {result['last_record_id']}, 耗时 {result['elapsed_seconds']:.2f} 秒")
+    else:
+        start = time.perf_counter()
+        summary = cohort_summary(args.out, args.test_types, args.start, args.end)
+        print(summary.to_string() if len(summary) else "没有符合条件的记录")
+        print(f"耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试会话回放
+从 test_records（及已移入的月分区）读取历史测试轮次，用记录的刺激物和反应时在虚拟时钟上重新驱动
+TestEngine / WebTestEngine（不等待、不显示），把回放产生的试次记录与统计结果
+写入临时数据库，逐行与原始记录比对。用于检验引擎改动是否改变了计算结果。
+
+用法: python session_replay.py --db reaction_test.db --engine qt
+      python session_replay.py --db reaction_test_web.db --engine web
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from quality_control import QC_ANTICIPATION, QC_SLOW_OUTLIER, QC_TIMEOUT
+from engine_core import VirtualClock, VirtualScheduler, PHASE_STIMULUS
+from storage import DatabaseManager
+
+TIMEOUT_MS = 3000
+
+# 试次间隔（虚拟时间）
+INTER_TRIAL_MS = 1000
+
+# 虚拟时钟运算与原始墙钟运算的舍入差异在1e-10 ms量级，超过1纳秒视为不一致
+RT_TOLERANCE_MS = 1e-6
+
+# 可能被重测的质量控制标签
+REQUEUE_LABELS = (QC_ANTICIPATION, QC_SLOW_OUTLIER, QC_TIMEOUT)
+
+RECORD_COLUMNS = ['user_id', 'test_type', 'stimulus_type', 'trial_index', 'stimulus_content',
+                  'reaction_time', 'is_correct', 'qc_label']
+
+STAT_COLUMNS = ['user_id', 'test_type', 'stimulus_type', 'avg_reaction_time', 'std_reaction_time',
+                'min_reaction_time', 'max_reaction_time', 'accuracy_rate', 'total_trials']
+
+# 以浮点容差比较的列
+FLOAT_COLUMNS = {'reaction_time', 'latency_correction', 'avg_reaction_time', 'std_reaction_time',
+                 'min_reaction_time', 'max_reaction_time', 'accuracy_rate'}
+
+
+class ReplayStimulusSource:
+    """按顺序给出记录中的刺激物，正确反应仍由前端原来的刺激物来源判断"""
+
+    def __init__(self, source):
+        self.source = source
+        self.next_stimulus = None
+
+    def generate_stimulus(self, test_type: str, stimulus_type: str) -> Dict[str, Any]:
+        return self.next_stimulus
+
+    def expected_response(self, test_type: str, stimulus: Dict[str, Any]) -> Any:
+        return self.source.expected_response(test_type, stimulus)
+
+
+class RecordedRun:
+    """一轮历史测试"""
+
+    def __init__(self, user_id: str, test_type: str, stimulus_type: str):
+        self.user_id = user_id
+        self.test_type = test_type
+        self.stimulus_type = stimulus_type
+        self.records: List[Dict[str, Any]] = []
+        self.statistics: Optional[Dict[str, Any]] = None
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        return self.user_id, self.test_type, self.stimulus_type
+
+    @property
+    def requeue_invalid(self) -> bool:
+        """出现重复试次序号说明本轮开启了无效试次重测"""
+        indexes = [record['trial_index'] for record in self.records]
+        return len(set(indexes)) < len(indexes)
+
+    @property
+    def planned_trials(self) -> int:
+        return self.records[-1]['trial_index'] + 1
+
+    def accepts(self, record: Dict[str, Any]) -> bool:
+        """记录是否属于本轮（同一条件下试次序号连续，或无效试次重测）"""
+        if (record['user_id'], record['test_type'], record['stimulus_type']) != self.key:
+            return False
+        last = self.records[-1]
+        if record['trial_index'] == last['trial_index'] + 1:
+            return True
+        return record['trial_index'] == last['trial_index'] and last['qc_label'] in REQUEUE_LABELS
+
+
+def _iter_records(db_path: str) -> Iterator[Dict[str, Any]]:
+    """按 record_id 顺序逐条读取试次（合并主库与各月分区，与导出相同的分块读取）"""
+    db = DatabaseManager(db_path, cache_size=0, read_only=True)
+    try:
+        for rows in db.iter_trial_chunks():
+            yield from rows
+    finally:
+        db.close()
+
+
+def load_runs(db_path: str, limit: Optional[int] = None) -> Tuple[List[RecordedRun], Dict[str, Dict[str, Any]]]:
+    """读取历史轮次（包括已移入月分区的试次），并按条件顺序为完成的轮次配对统计结果"""
+    runs: List[RecordedRun] = []
+    records = _iter_records(db_path)
+    for record in records:
+        # 旧数据库没有质量控制与延迟校准列
+        record.setdefault('qc_label', None)
+        record.setdefault('latency_correction', None)
+        if runs and runs[-1].accepts(record):
+            runs[-1].records.append(record)
+            continue
+        if limit is not None and len(runs) >= limit:
+            break
+        run = RecordedRun(record['user_id'], record['test_type'], record['stimulus_type'])
+        run.records.append(record)
+        runs.append(run)
+    records.close()
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+
+    # 统计结果在轮次完成时写入，同一条件下按写入顺序与完成的轮次一一对应
+    pending: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+    for row in conn.execute("SELECT * FROM test_statistics ORDER BY stat_id"):
+        stat = dict(row)
+        pending.setdefault((stat['user_id'], stat['test_type'], stat['stimulus_type']), []).append(stat)
+    for run in runs:
+        queue = pending.get(run.key)
+        if queue and queue[0]['total_trials'] == run.planned_trials:
+            run.statistics = queue.pop(0)
+
+    users = {row['user_id']: dict(row) for row in conn.execute("SELECT * FROM users")}
+    conn.close()
+    return runs, users
+
+
+def _is_timeout(record: Dict[str, Any]) -> bool:
+    if record['qc_label'] is not None:
+        return record['qc_label'] == QC_TIMEOUT
+    return not record['is_correct'] and record['reaction_time'] >= TIMEOUT_MS
+
+
+def _user_data(run: RecordedRun, users: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    user = users.get(run.user_id, {})
+    return {
+        'user_id': run.user_id,
+        'name': user.get('name') or '',
+        'age': user.get('age') or 0,
+        'gender': user.get('gender') or '',
+        'occupation': user.get('occupation') or ''
+    }
+
+
+def _run_correction(run: RecordedRun) -> float:
+    """本轮的延迟校准值（超时记录未扣除延迟，不能取自超时记录）"""
+    for record in run.records:
+        if not _is_timeout(record):
+            return record['latency_correction'] or 0.0
+    return 0.0
+
+
+class QtReplayer:
+    """在虚拟时钟上驱动桌面端 TestEngine（虚拟时间调度器替代QTimer）"""
+
+    def __init__(self, db_path: str):
+        import safe_test
+
+        self.safe_test = safe_test
+        self.db_manager = safe_test.DatabaseManager(db_path)
+        self.clock = VirtualClock()
+        self.scheduler = VirtualScheduler(self.clock)
+        self.engine = safe_test.TestEngine(self.db_manager, scheduler=self.scheduler, clock=self.clock)
+        self.source = ReplayStimulusSource(self.engine.core.stimulus_source)
+        self.engine.core.stimulus_source = self.source
+
+    def replay(self, run: RecordedRun, users: Dict[str, Dict[str, Any]]):
+        Qt = self.safe_test.Qt
+        engine = self.engine
+        core = engine.core
+        correction = _run_correction(run)
+        total = run.statistics['total_trials'] if run.statistics else run.planned_trials + 1
+
+        engine.setup_test(run.test_type, run.stimulus_type, _user_data(run, users), trials=total,
+                          requeue_invalid=run.requeue_invalid, latency_correction=correction)
+        engine.start_test()
+
+        for record in run.records:
+            stimulus = json.loads(record['stimulus_content'])
+            self.source.next_stimulus = stimulus
+            # 推进到刺激出现（开始延迟、试次间隔与随机前置期）
+            self.scheduler.run(until=lambda: core.phase == PHASE_STIMULUS)
+
+            if _is_timeout(record):
+                # 下一个到期的回调就是超时
+                self.scheduler.run_next()
+            else:
+                self.clock.advance_ms(record['reaction_time'] + correction)
+                correct_key = stimulus.get('key', Qt.Key.Key_1) if isinstance(stimulus, dict) else None
+                if run.test_type == "simple":
+                    engine.record_response(Qt.Key.Key_Space)
+                elif run.test_type == "choice":
+                    if record['is_correct']:
+                        key = correct_key
+                    else:
+                        key = next(k for k in (Qt.Key.Key_1, Qt.Key.Key_2, Qt.Key.Key_3, Qt.Key.Key_4)
+                                   if k != correct_key)
+                    engine.record_response(key)
+                else:
+                    engine.record_response(click_pos=None)
+
+        if engine.is_test_running:
+            engine.stop_test()
+
+    def close(self):
+        self.engine.stop_test()
+
+
+class WebReplayer:
+    """在虚拟时钟上驱动Web端 WebTestEngine（Streamlit裸模式，st.rerun为空操作）"""
+
+    def __init__(self, db_path: str):
+        import Qt_2_web
+        from streamlit import logger as st_logger
+
+        # 裸模式下每次访问会话状态都会告警，回放时只保留错误日志
+        st_logger.set_log_level('error')
+
+        self.web = Qt_2_web
+        Qt_2_web.init_session_state()
+        self.engine = Qt_2_web.WebTestEngine(Qt_2_web.WebDatabaseManager(db_path))
+        self.source = ReplayStimulusSource(self.engine.stimulus_generator)
+        self.engine.stimulus_generator = self.source
+        self.clock = VirtualClock()
+        self.engine.clock = self.clock
+
+    def replay(self, run: RecordedRun, users: Dict[str, Dict[str, Any]]):
+        engine = self.engine
+        state = self.web.st.session_state
+        total = run.statistics['total_trials'] if run.statistics else run.planned_trials + 1
+
+        engine.start_test(run.test_type, run.stimulus_type, _user_data(run, users), trials=total,
+                          requeue_invalid=run.requeue_invalid)
+
+        for record in run.records:
+            stimulus = json.loads(record['stimulus_content'])
+            self.source.next_stimulus = stimulus
+            engine.show_stimulus()
+            if _is_timeout(record):
+                # 超时后的下一次脚本运行
+                self.clock.advance_ms(TIMEOUT_MS)
+                engine.poll()
+                self.clock.advance_ms(INTER_TRIAL_MS)
+                continue
+            self.clock.advance_ms(record['reaction_time'])
+
+            response = {}
+            if run.test_type == 'choice':
+                target_index = stimulus['target']['index']
+                if record['is_correct']:
+                    response['selected_option'] = target_index
+                else:
+                    response['selected_option'] = next(i for i in range(1, 5) if i != target_index)
+            engine.record_response(response)
+            self.clock.advance_ms(INTER_TRIAL_MS)
+
+        if state.test_state['is_running']:
+            engine.core.stop_test()
+            state.test_state['is_running'] = False
+
+    def close(self):
+        self.engine.db_manager.conn.close()
+
+
+def _compare_rows(kind: str, expected: List[Dict[str, Any]], actual: List[Dict[str, Any]],
+                  columns: List[str]) -> List[str]:
+    """逐行比较，返回差异描述"""
+    problems = []
+    if len(expected) != len(actual):
+        problems.append(f"{kind}行数不一致: 原始 {len(expected)}, 回放 {len(actual)}")
+    for i, (old, new) in enumerate(zip(expected, actual)):
+        for col in columns:
+            a, b = old.get(col), new.get(col)
+            if col == 'qc_label' and a is None:
+                continue  # 旧记录没有质量控制标签
+            if col in FLOAT_COLUMNS:
+                a = 0.0 if a is None else a
+                b = 0.0 if b is None else b
+                if abs(a - b) <= RT_TOLERANCE_MS:
+                    continue
+            elif a == b:
+                continue
+            problems.append(f"{kind}第{i + 1}行 {col}: 原始 {a!r}, 回放 {b!r}")
+    return problems
+
+
+def replay_database(db_path: str, engine: str = "qt", limit: Optional[int] = None,
+                    verbose: bool = False) -> Dict[str, Any]:
+    """回放数据库中的全部轮次并比对，返回运行摘要"""
+    runs, users = load_runs(db_path, limit)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        replay_db = os.path.join(tmp_dir, "replay.db")
+        replayer = QtReplayer(replay_db) if engine == "qt" else WebReplayer(replay_db)
+        record_columns = RECORD_COLUMNS + (['latency_correction'] if engine == "qt" else [])
+
+        conn = sqlite3.connect(replay_db)
+        conn.row_factory = sqlite3.Row
+        last_record_id = last_stat_id = 0
+        failed_runs = 0
+        trials = 0
+        virtual_ms = 0.0
+
+        start = time.perf_counter()
+        for run in runs:
+            clock_start = replayer.clock.now
+            replayer.replay(run, users)
+            virtual_ms += (replayer.clock.now - clock_start) * 1000
+            trials += len(run.records)
+
+            new_records = [dict(row) for row in conn.execute(
+                "SELECT * FROM test_records WHERE record_id > ? ORDER BY record_id", (last_record_id,))]
+            new_stats = [dict(row) for row in conn.execute(
+                "SELECT * FROM test_statistics WHERE stat_id > ? ORDER BY stat_id", (last_stat_id,))]
+            if new_records:
+                last_record_id = new_records[-1]['record_id']
+            if new_stats:
+                last_stat_id = new_stats[-1]['stat_id']
+
+            problems = _compare_rows("试次", run.records, new_records, record_columns)
+            problems += _compare_rows("统计", [run.statistics] if run.statistics else [],
+                                      new_stats, STAT_COLUMNS)
+            if problems:
+                failed_runs += 1
+                if verbose:
+                    print(f"轮次不一致 {run.key} (首条记录 {run.records[0]['record_id']}):")
+                    for problem in problems[:10]:
+                        print(f"  {problem}")
+        elapsed = time.perf_counter() - start
+
+        conn.close()
+        replayer.close()
+
+    return {
+        'runs': len(runs),
+        'trials': trials,
+        'failed_runs': failed_runs,
+        'elapsed_seconds': elapsed,
+        'virtual_seconds': virtual_ms / 1000,
+        'speedup': (virtual_ms / 1000) / elapsed if elapsed > 0 else float('inf')
+    }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="回放历史测试轮次并比对结果")
+    parser.add_argument('--db', default='reaction_test.db', help="数据库路径")
+    parser.add_argument('--engine', choices=['qt', 'web'], default='qt', help="回放使用的测试引擎")
+    parser.add_argument('--limit', type=int, default=None, help="最多回放的轮次数")
+    parser.add_argument('--verbose', action='store_true', help="输出不一致的明细")
+    args = parser.parse_args()
+
+    summary = replay_database(args.db, engine=args.engine, limit=args.limit, verbose=args.verbose)
+    print(f"回放 {summary['runs']} 轮 / {summary['trials']} 个试次, 不一致 {summary['failed_runs']} 轮, "
+          f"耗时 {summary['elapsed_seconds']:.2f} 秒 (虚拟时长 {summary['virtual_seconds']:.0f} 秒, "
+          f"加速 {summary['speedup']:.0f} 倍)")
+    sys.exit(1 if summary['failed_runs'] else 0)
+
+
+if __name__ == "__main__":
+    main()
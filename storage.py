@@ -0,0 +1,818 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据存储层
+DatabaseManager 负责用户、试次记录、统计结果与工作站延迟档案的读写（带查询缓存）。
+本模块不依赖 PyQt6，桌面端、Web端之外的命令行工具与后台任务可以直接使用。
+"""
+
+import enum
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from db_maintenance import DatabaseMaintenance, DEFAULT_HOT_MONTHS, list_partitions, month_bounds
+from latency_calibration import LatencyProfile, PROFILE_TABLE_SQL, save_profile, load_profile
+from participant_directory import ParticipantDirectory
+from schema_migration import is_normalized
+from trial_records import TrialRecord
+
+
+def _json_default(obj):
+    """刺激内容序列化（QColor、Qt枚举等）"""
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    # QColor 等带 name() 方法的对象（不在存储层导入Qt）
+    if callable(getattr(obj, 'name', None)):
+        return obj.name()
+    return str(obj)
+
+
+class DatabaseManager:
+    """数据库管理类"""
+
+    # 各数据库文件的写入版本号（同一进程内的多个实例共享，任一实例写入即令其他实例的缓存失效）
+    _write_versions: Dict[str, int] = {}
+
+    def __init__(self, db_path: str = "reaction_test.db", cache_size: int = 128, read_only: bool = False):
+        """read_only 为True时只读打开已有数据库：不建表、不修改设置与索引，文件不存在时报错"""
+        self.db_path = db_path
+        self.read_only = read_only
+
+        # 读查询结果缓存：(查询语句, 参数) -> 结果行，按最近使用淘汰
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, Tuple], List[Dict[str, Any]]]" = OrderedDict()
+        self._cache_version = -1
+        # 检测其他连接（其他进程）提交的连接：PRAGMA data_version 在其他连接提交后变化
+        self._watch_conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self.directory = ParticipantDirectory(db_path, read_only=read_only)
+        self._trial_table = 'test_records'
+        # 分区文件 -> ((修改时间, 大小), 最小 record_id)；分区移入后基本不再变化
+        self._partition_lows: Dict[str, Tuple[Tuple[int, int], Optional[int]]] = {}
+        if read_only:
+            if not os.path.isfile(db_path):
+                raise FileNotFoundError(f"数据库文件不存在: {db_path}")
+            conn = self._connect()
+            try:
+                if is_normalized(conn):
+                    self._trial_table = 'trials'
+            finally:
+                conn.close()
+        else:
+            self.init_database()
+
+    def init_database(self):
+        """初始化数据库"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        # 新建的数据库使用增量整理（已有数据的库在 vacuum() 原地整理时转换）
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+        # 已迁移为规范化结构时，这三张表由兼容视图提供（见 schema_migration.py）
+        if is_normalized(conn):
+            self._trial_table = 'trials'
+        else:
+            self._create_core_tables(cursor)
+
+        # 工作站延迟档案表
+        cursor.execute(PROFILE_TABLE_SQL)
+
+        conn.commit()
+        # 参与者目录的检索索引
+        self.directory.ensure_index(conn)
+        conn.close()
+
+    def _create_core_tables(self, cursor: sqlite3.Cursor):
+        """创建用户、测试记录与统计表"""
+        # 创建用户表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                name TEXT,
+                age INTEGER,
+                gender TEXT,
+                occupation TEXT,
+                created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # 创建测试记录表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS test_records (
+                record_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT,
+                test_type TEXT,
+                stimulus_type TEXT,
+                trial_index INTEGER,
+                stimulus_content TEXT,
+                reaction_time REAL,
+                is_correct INTEGER,
+                qc_label TEXT,
+                latency_correction REAL,
+                test_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+
+        # 旧数据库补充质量控制列
+        self._ensure_column(cursor, 'test_records', 'qc_label', 'TEXT')
+        self._ensure_column(cursor, 'test_records', 'latency_correction', 'REAL')
+
+        # 创建测试统计表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS test_statistics (
+                stat_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT,
+                test_type TEXT,
+                stimulus_type TEXT,
+                avg_reaction_time REAL,
+                std_reaction_time REAL,
+                min_reaction_time REAL,
+                max_reaction_time REAL,
+                accuracy_rate REAL,
+                total_trials INTEGER,
+                test_date DATE,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+
+        # 历史记录分页查询索引
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_statistics_user_date
+            ON test_statistics (user_id, test_date, stat_id)
+        ''')
+
+        # 试次记录按用户分页读取索引
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_records_user
+            ON test_records (user_id, record_id)
+        ''')
+
+    @property
+    def write_version(self) -> int:
+        """当前数据库文件的写入版本号"""
+        return self._write_versions.get(self.db_path, 0)
+
+    def _bump_write_version(self):
+        """写入后递增版本号，使所有实例的查询缓存失效"""
+        self._write_versions[self.db_path] = self.write_version + 1
+
+    def _connect(self) -> sqlite3.Connection:
+        """主库读连接（只读模式下以只读方式打开）"""
+        if self.read_only:
+            return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        return sqlite3.connect(self.db_path, check_same_thread=False)
+
+    def _read(self, query: str, params, path: Optional[str] = None) -> List[Dict[str, Any]]:
+        """在主库或一个分区文件（path，只读打开）上执行查询"""
+        if path is None:
+            conn = self._connect()
+        else:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(query, params)]
+        finally:
+            conn.close()
+
+    def check_external_writes(self) -> int:
+        """检测其他连接与进程的提交（命令行合并、维护任务、另一个前端），有变化时递增写入版本号
+
+        本实例的写入也经由其他连接提交，会多递增一次，只是多一次缓存失效。返回当前写入版本号。
+        """
+        try:
+            if self._watch_conn is None:
+                self._watch_conn = self._connect()
+            data_version = self._watch_conn.execute('PRAGMA data_version').fetchall()[0][0]
+        except sqlite3.Error:
+            return self.write_version
+        if self._data_version is not None and data_version != self._data_version:
+            self._bump_write_version()
+        self._data_version = data_version
+        return self.write_version
+
+    def close(self):
+        """关闭常驻连接（提交检测与参与者目录）"""
+        if self._watch_conn is not None:
+            self._watch_conn.close()
+            self._watch_conn = None
+            self._data_version = None
+        self.directory.close()
+
+    def _cached_query(self, query: str, params: Tuple, path: Optional[str] = None) -> List[Dict[str, Any]]:
+        """带缓存的只读查询，返回结果行的副本（path 为分区文件时查询该分区）"""
+        version = self.check_external_writes()
+        if version != self._cache_version:
+            self._cache.clear()
+            self._cache_version = version
+
+        key = (query, params) if path is None else (path, query, params)
+        rows = self._cache.get(key)
+        if rows is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return [dict(row) for row in rows]
+
+        self.cache_misses += 1
+        rows = self._read(query, params, path)
+
+        self._cache[key] = rows
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return [dict(row) for row in rows]
+
+    def clear_cache(self):
+        """清空查询缓存（释放内存）"""
+        self._cache.clear()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """查询缓存命中统计"""
+        total = self.cache_hits + self.cache_misses
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'hit_rate': self.cache_hits / total if total else 0.0,
+            'size': len(self._cache),
+            'write_version': self.write_version
+        }
+
+    def _ensure_column(self, cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+        """列不存在时追加列"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def save_user(self, user_data: Dict[str, Any]) -> bool:
+        """保存用户信息"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                INSERT OR REPLACE INTO users (user_id, name, age, gender, occupation)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (
+                user_data['user_id'],
+                user_data['name'],
+                user_data['age'],
+                user_data.get('gender', ''),
+                user_data.get('occupation', '')
+            ))
+
+            conn.commit()
+            conn.close()
+            self._bump_write_version()
+            return True
+        except Exception as e:
+            print(f"保存用户信息失败: {e}")
+            return False
+
+    def save_test_record(self, record: TrialRecord) -> bool:
+        """保存单次测试记录"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                INSERT INTO test_records 
+                (user_id, test_type, stimulus_type, trial_index, 
+                 stimulus_content, reaction_time, is_correct, qc_label, latency_correction)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                record.user_id,
+                record.test_type,
+                record.stimulus_type,
+                record.trial_index,
+                json.dumps(record.stimulus_content, default=_json_default),
+                record.reaction_time,
+                1 if record.is_correct else 0,
+                record.qc_label,
+                record.latency_correction
+            ))
+
+            conn.commit()
+            conn.close()
+            self._bump_write_version()
+            return True
+        except Exception as e:
+            print(f"保存测试记录失败: {e}")
+            return False
+
+    def save_test_statistics(self, stat_data: Dict[str, Any]) -> bool:
+        """保存测试统计结果"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                INSERT INTO test_statistics 
+                (user_id, test_type, stimulus_type, avg_reaction_time,
+                 std_reaction_time, min_reaction_time, max_reaction_time,
+                 accuracy_rate, total_trials, test_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                stat_data['user_id'],
+                stat_data['test_type'],
+                stat_data['stimulus_type'],
+                stat_data['avg_reaction_time'],
+                stat_data['std_reaction_time'],
+                stat_data['min_reaction_time'],
+                stat_data['max_reaction_time'],
+                stat_data['accuracy_rate'],
+                stat_data['total_trials'],
+                stat_data['test_date']
+            ))
+
+            conn.commit()
+            conn.close()
+            self._bump_write_version()
+            return True
+        except Exception as e:
+            print(f"保存统计结果失败: {e}")
+            return False
+
+    def save_latency_profile(self, profile: LatencyProfile) -> bool:
+        """保存工作站延迟档案"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            save_profile(conn, profile)
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"保存延迟档案失败: {e}")
+            return False
+
+    def get_latency_profile(self, station: str) -> Optional[LatencyProfile]:
+        """获取工作站延迟档案"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            profile = load_profile(conn, station)
+            conn.close()
+            return profile
+        except Exception as e:
+            print(f"获取延迟档案失败: {e}")
+            return None
+
+    def get_user_history(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """获取用户历史记录"""
+        try:
+            return self._cached_query('''
+                SELECT * FROM test_statistics 
+                WHERE user_id = ? 
+                ORDER BY test_date DESC, stat_id DESC 
+                LIMIT ?
+            ''', (user_id, limit))
+        except Exception as e:
+            print(f"获取历史记录失败: {e}")
+            return []
+
+    # 历史记录允许排序的列
+    HISTORY_SORT_COLUMNS = ('test_type', 'stimulus_type', 'avg_reaction_time', 'accuracy_rate', 'test_date')
+
+    def get_user_history_page(self, user_id: str, order_by: str = 'test_date', descending: bool = True,
+                              after: Optional[Tuple[Any, int]] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """按键集分页获取用户历史记录
+
+        after为上一页最后一行的 (排序列值, stat_id)，为None时取第一页；
+        按 (排序列, stat_id) 定位，翻页开销与已浏览行数无关。
+        排序列为空值的行按SQLite的顺序排在升序最前、降序最后，单独按 stat_id 定位。
+        """
+        if order_by not in self.HISTORY_SORT_COLUMNS:
+            raise ValueError(f"不支持的排序列: {order_by}")
+
+        direction = 'DESC' if descending else 'ASC'
+        comparison = '<' if descending else '>'
+
+        try:
+            if after is None:
+                return self._cached_query(f'''
+                    SELECT * FROM test_statistics
+                    WHERE user_id = ?
+                    ORDER BY {order_by} {direction}, stat_id {direction}
+                    LIMIT ?
+                ''', (user_id, limit))
+
+            # 行值比较遇到空值结果为NULL，空值行需要单独的条件
+            if after[0] is None:
+                keyset = f"(({order_by} IS NULL AND stat_id {comparison} ?)"
+                keyset += ")" if descending else f" OR {order_by} IS NOT NULL)"
+                params = (user_id, after[1], limit)
+            else:
+                keyset = f"(({order_by}, stat_id) {comparison} (?, ?)"
+                keyset += f" OR {order_by} IS NULL)" if descending else ")"
+                params = (user_id, after[0], after[1], limit)
+            return self._cached_query(f'''
+                SELECT * FROM test_statistics
+                WHERE user_id = ? AND {keyset}
+                ORDER BY {order_by} {direction}, stat_id {direction}
+                LIMIT ?
+            ''', params)
+        except Exception as e:
+            print(f"获取历史记录失败: {e}")
+            return []
+
+    def get_trial_details(self, user_id: str, test_type: str = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """获取详细测试记录（主库不足 limit 行时按月份从新到旧补充分区中的记录）"""
+        if test_type:
+            query = '''
+                SELECT * FROM test_records 
+                WHERE user_id = ? AND test_type = ?
+                ORDER BY trial_index 
+                LIMIT ?
+            '''
+            params = (user_id, test_type)
+        else:
+            query = '''
+                SELECT * FROM test_records 
+                WHERE user_id = ? 
+                ORDER BY test_time DESC 
+                LIMIT ?
+            '''
+            params = (user_id,)
+        try:
+            rows = self._cached_query(query, params + (limit,))
+            for _, path in reversed(list_partitions(self.db_path)):
+                if len(rows) >= limit:
+                    break
+                rows += self._cached_query(query, params + (limit - len(rows),), path)
+            return rows
+        except Exception as e:
+            print(f"获取详细记录失败: {e}")
+            return []
+
+    # 可逐块导出的数据：名称 -> (表名, 键集分页列)
+    EXPORT_TABLES = {
+        'trials': ('test_records', 'record_id'),
+        'runs': ('test_statistics', 'stat_id'),
+        'users': ('users', 'user_id')
+    }
+
+    @staticmethod
+    def _keyset_query(table: str, key: str, user_id: Optional[str], test_type: Optional[str],
+                      after: Optional[Any]) -> Tuple[str, List[Any]]:
+        """按 key 列键集分页的查询（不含 LIMIT）"""
+        conditions = []
+        params: List[Any] = []
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        if test_type is not None:
+            conditions.append('test_type = ?')
+            params.append(test_type)
+        if after is not None:
+            conditions.append(f'{key} > ?')
+            params.append(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return f'SELECT * FROM {table} {where} ORDER BY {key}', params
+
+    @classmethod
+    def _trial_page_query(cls, user_id: Optional[str], test_type: Optional[str],
+                          after: Optional[int]) -> Tuple[str, List[Any]]:
+        """按 record_id 键集分页的试次查询（不含 LIMIT）"""
+        return cls._keyset_query('test_records', 'record_id', user_id, test_type, after)
+
+    def _partition_low(self, path: str) -> Optional[int]:
+        """分区中最小的 record_id（文件未变化时不重新打开）"""
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self._partition_lows.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, self._read('SELECT MIN(record_id) AS low FROM test_records', (), path)[0]['low'])
+            self._partition_lows[path] = cached
+        return cached[1]
+
+    def _trial_chunk(self, user_id: Optional[str], test_type: Optional[str], after: Optional[int],
+                     limit: int, cached: bool) -> List[Dict[str, Any]]:
+        """按 record_id 键集读取一页试次，合并主库与各分区
+
+        数据源按各自最小 record_id 排序依次读取；凑满一页后，最小编号已超过页内最后一行的
+        数据源不可能再有更小的行，直接跳过（通常只需读一到两个数据源）。
+        """
+        query, params = self._trial_page_query(user_id, test_type, after)
+        query += ' LIMIT ?'
+        params = tuple(params) + (limit,)
+        read = self._cached_query if cached else self._read
+        partitions = list_partitions(self.db_path)
+        if not partitions:
+            return read(query, params)
+
+        sources = []
+        for path in [path for _, path in partitions] + [None]:
+            low = self._partition_low(path) if path else \
+                read(f'SELECT MIN(record_id) AS low FROM {self._trial_table}', ())[0]['low']
+            if low is not None:
+                sources.append((low, path))
+        sources.sort(key=lambda source: source[0])
+
+        rows: List[Dict[str, Any]] = []
+        for low, path in sources:
+            if len(rows) >= limit and low > rows[limit - 1]['record_id']:
+                break
+            rows = sorted(rows + read(query, params, path), key=lambda row: row['record_id'])[:limit]
+        return rows
+
+    def get_trial_page(self, user_id: Optional[str] = None, test_type: Optional[str] = None,
+                       after: Optional[int] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """按键集分页获取试次记录（after为上一页最后一行的 record_id，包含分区中的记录）"""
+        try:
+            return self._trial_chunk(user_id, test_type, after, limit, cached=True)
+        except Exception as e:
+            print(f"获取试次记录失败: {e}")
+            return []
+
+    def iter_trial_chunks(self, user_id: Optional[str] = None, test_type: Optional[str] = None,
+                          after: Optional[int] = None, chunk_size: int = 5000):
+        """逐块读取试次记录（大批量导出用，不进入查询缓存）
+
+        每块单独打开连接读取，块与块之间不持有读锁，不会长时间阻塞写入。
+        """
+        return self.iter_table_chunks('trials', user_id, test_type, after, chunk_size)
+
+    def iter_table_chunks(self, name: str = 'trials', user_id: Optional[str] = None,
+                          test_type: Optional[str] = None, after: Optional[Any] = None,
+                          chunk_size: int = 5000):
+        """逐块读取 EXPORT_TABLES 中的一类数据（试次、轮次统计或用户），按键集顺序"""
+        table, key = self.EXPORT_TABLES[name]
+        if name == 'users' and test_type is not None:
+            raise ValueError("用户表不能按测试类型筛选")
+        while True:
+            if name == 'trials':
+                rows = self._trial_chunk(user_id, test_type, after, chunk_size, cached=False)
+            else:
+                query, params = self._keyset_query(table, key, user_id, test_type, after)
+                rows = self._read(query + ' LIMIT ?', params + [chunk_size])
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            after = rows[-1][key]
+
+    # 汇总统计允许的分组列
+    AGGREGATE_GROUP_COLUMNS = ('test_type', 'stimulus_type', 'user_id', 'test_date')
+
+    def get_run_aggregates(self, group_by: str = 'test_type', user_id: Optional[str] = None,
+                           after: Optional[Any] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """按分组汇总各轮统计结果（按分组值键集分页）"""
+        if group_by not in self.AGGREGATE_GROUP_COLUMNS:
+            raise ValueError(f"不支持的分组列: {group_by}")
+
+        conditions = [f'{group_by} IS NOT NULL']
+        params: List[Any] = []
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        if after is not None:
+            conditions.append(f'{group_by} > ?')
+            params.append(after)
+
+        try:
+            return self._cached_query(f'''
+                SELECT {group_by},
+                       COUNT(*) AS runs,
+                       SUM(total_trials) AS trials,
+                       AVG(avg_reaction_time) AS mean_reaction_time,
+                       MIN(min_reaction_time) AS min_reaction_time,
+                       MAX(max_reaction_time) AS max_reaction_time,
+                       AVG(accuracy_rate) AS mean_accuracy_rate
+                FROM test_statistics
+                WHERE {' AND '.join(conditions)}
+                GROUP BY {group_by}
+                ORDER BY {group_by}
+                LIMIT ?
+            ''', tuple(params) + (limit,))
+        except Exception as e:
+            print(f"获取汇总统计失败: {e}")
+            return []
+
+    # ------------------------------------------------------------ 维护
+
+    def integrity_report(self, full: bool = False) -> Dict[str, Any]:
+        """检查数据库一致性，返回各项结果与问题列表（full为True时做完整的 integrity_check）"""
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            pragma = 'integrity_check' if full else 'quick_check'
+            check = [row[0] for row in conn.execute(f'PRAGMA {pragma}')]
+            # 逐表检查：规范化结构中部分表的外键指向兼容视图，整体检查会直接报错
+            foreign_keys = []
+            for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                try:
+                    foreign_keys += conn.execute(f'PRAGMA foreign_key_check("{table}")').fetchall()
+                except sqlite3.OperationalError:
+                    continue
+            missing_users = conn.execute('''
+                SELECT COUNT(*) FROM (
+                    SELECT user_id FROM test_records
+                    UNION SELECT user_id FROM test_statistics
+                ) r
+                WHERE r.user_id IS NULL
+                   OR NOT EXISTS (SELECT 1 FROM users u WHERE u.user_id = r.user_id)
+            ''').fetchone()[0]
+            unindexed = conn.execute('''
+                SELECT COUNT(*) FROM users u
+                WHERE NOT EXISTS (SELECT 1 FROM participant_terms t WHERE t.user_id = u.user_id)
+            ''').fetchone()[0]
+            report = {
+                'normalized': is_normalized(conn),
+                pragma: check,
+                'foreign_key_violations': len(foreign_keys),
+                'records_without_user': missing_users,
+                'unindexed_participants': unindexed
+            }
+            # 完整检查时顺带核对历史记录键集分页（含空值排序列）
+            paging_mismatches = self._check_history_paging(conn) if full else []
+            if full:
+                report['history_paging_errors'] = len(paging_mismatches)
+        finally:
+            conn.close()
+
+        problems = [] if check == ['ok'] else [f"{pragma}: {line}" for line in check]
+        if report['foreign_key_violations']:
+            problems.append(f"外键不一致的行: {report['foreign_key_violations']}")
+        if missing_users:
+            problems.append(f"找不到对应用户的测试记录或统计用户: {missing_users}")
+        if unindexed:
+            problems.append(f"未进入参与者目录索引的用户: {unindexed}")
+        for mismatch in paging_mismatches:
+            problems.append(f"历史记录分页结果与整体排序不一致: {mismatch}")
+        report['problems'] = problems
+        return report
+
+    def _check_history_paging(self, conn: sqlite3.Connection, users: int = 20,
+                              page_size: int = 7) -> List[str]:
+        """逐列、双向按键集翻页读取用户历史，与一次性排序的结果比较，返回不一致的 用户/列/方向
+
+        优先检查排序列含空值的用户（最多 users 个），没有时检查轮次最多的用户
+        """
+        null_checks = ' OR '.join(f"{column} IS NULL" for column in self.HISTORY_SORT_COLUMNS)
+        user_ids = [row[0] for row in conn.execute(f'''
+            SELECT DISTINCT user_id FROM test_statistics WHERE {null_checks} LIMIT ?
+        ''', (users,))]
+        if not user_ids:
+            user_ids = [row[0] for row in conn.execute('''
+                SELECT user_id FROM test_statistics GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1
+            ''')]
+
+        mismatches = []
+        for user_id in user_ids:
+            for column in self.HISTORY_SORT_COLUMNS:
+                for descending in (False, True):
+                    direction = 'DESC' if descending else 'ASC'
+                    expected = [row[0] for row in conn.execute(f'''
+                        SELECT stat_id FROM test_statistics WHERE user_id = ?
+                        ORDER BY {column} {direction}, stat_id {direction}
+                    ''', (user_id,))]
+                    paged, after = [], None
+                    while len(paged) <= len(expected):
+                        page = self.get_user_history_page(user_id, column, descending, after, page_size)
+                        paged += [row['stat_id'] for row in page]
+                        if len(page) < page_size:
+                            break
+                        after = (page[-1][column], page[-1]['stat_id'])
+                    if paged != expected:
+                        mismatches.append(f"{user_id}/{column}/{direction}")
+        return mismatches
+
+    @staticmethod
+    def _source_columns(conn: sqlite3.Connection, table: str, columns: Tuple[str, ...]) -> str:
+        """附加库中表/视图的列选择表达式（旧版本数据库缺少的列取NULL）"""
+        existing = {row[1] for row in conn.execute(f'PRAGMA src.table_info({table})')}
+        return ', '.join(f's.{column}' if column in existing else f'NULL AS {column}' for column in columns)
+
+    def merge_from(self, source_path: str) -> Dict[str, int]:
+        """把另一个数据库（任一种结构）中的用户、试次与统计合并进来，返回各表新增行数
+
+        试次与统计重新分配编号；已存在的用户保留本库信息，主库或月分区中已有相同内容的试次/统计行跳过，
+        同一来源重复合并不会产生重复数据。
+        """
+        user_columns = ('user_id', 'name', 'age', 'gender', 'occupation', 'created_time')
+        record_columns = ('user_id', 'test_type', 'stimulus_type', 'trial_index', 'stimulus_content',
+                          'reaction_time', 'is_correct', 'qc_label', 'latency_correction', 'test_time')
+        stat_columns = ('user_id', 'test_type', 'stimulus_type', 'avg_reaction_time', 'std_reaction_time',
+                        'min_reaction_time', 'max_reaction_time', 'accuracy_rate', 'total_trials', 'test_date')
+
+        # ATTACH 不存在的文件会新建空库，这里先检查
+        if not os.path.isfile(source_path):
+            raise FileNotFoundError(f"来源数据库不存在: {source_path}")
+        if os.path.exists(self.db_path) and os.path.samefile(source_path, self.db_path):
+            raise ValueError("不能把数据库合并到自身")
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("ATTACH DATABASE ? AS src", (source_path,))
+        # 规范化结构中写入的是视图（由触发器落表），rowcount 不计数，按前后行数相减
+        tables = ('users', 'test_records', 'test_statistics')
+        try:
+            self._mark_partition_duplicates(conn)
+            before = {table: conn.execute(f'SELECT COUNT(*) FROM main.{table}').fetchone()[0] for table in tables}
+            with conn:
+                conn.execute(f'''
+                    INSERT INTO users ({', '.join(user_columns)})
+                    SELECT {self._source_columns(conn, 'users', user_columns)} FROM src.users s
+                    WHERE NOT EXISTS (SELECT 1 FROM main.users u WHERE u.user_id = s.user_id)
+                ''')
+                # IS 比较使空值列也能判定为相同
+                conn.execute(f'''
+                    INSERT INTO test_records ({', '.join(record_columns)})
+                    SELECT {self._source_columns(conn, 'test_records', record_columns)}
+                    FROM src.test_records s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM main.test_records r
+                        WHERE r.user_id = s.user_id AND r.test_time IS s.test_time
+                          AND r.test_type IS s.test_type AND r.stimulus_type IS s.stimulus_type
+                          AND r.trial_index IS s.trial_index AND r.reaction_time IS s.reaction_time
+                    )
+                    AND s.record_id NOT IN (SELECT record_id FROM temp.merge_skip)
+                    ORDER BY s.record_id
+                ''')
+                conn.execute(f'''
+                    INSERT INTO test_statistics ({', '.join(stat_columns)})
+                    SELECT {self._source_columns(conn, 'test_statistics', stat_columns)}
+                    FROM src.test_statistics s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM main.test_statistics t
+                        WHERE t.user_id = s.user_id AND t.test_date IS s.test_date
+                          AND t.test_type IS s.test_type AND t.stimulus_type IS s.stimulus_type
+                          AND t.avg_reaction_time IS s.avg_reaction_time
+                          AND t.total_trials IS s.total_trials
+                    )
+                    ORDER BY s.stat_id
+                ''')
+            counts = {table: conn.execute(f'SELECT COUNT(*) FROM main.{table}').fetchone()[0] - before[table]
+                      for table in tables}
+        finally:
+            conn.execute("DETACH DATABASE src")
+            conn.close()
+
+        self._bump_write_version()
+        return counts
+
+    def _mark_partition_duplicates(self, conn: sqlite3.Connection):
+        """来源（附加为 src）中已存在于月分区的试次，其来源编号写入 temp.merge_skip
+
+        单连接最多附加10个数据库，分区逐个附加；只比较测试时间落在该分区月份内的来源行
+        """
+        with conn:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS merge_skip (record_id INTEGER PRIMARY KEY)')
+            conn.execute('DELETE FROM temp.merge_skip')
+        if 'test_time' not in {row[1] for row in conn.execute('PRAGMA src.table_info(test_records)')}:
+            return
+
+        for month, path in list_partitions(self.db_path):
+            start, end, _, _ = month_bounds(month)
+            conn.execute("ATTACH DATABASE ? AS part", (path,))
+            try:
+                with conn:
+                    conn.execute('''
+                        INSERT OR IGNORE INTO temp.merge_skip (record_id)
+                        SELECT s.record_id FROM src.test_records s
+                        WHERE s.test_time >= ? AND s.test_time < ?
+                          AND EXISTS (
+                              SELECT 1 FROM part.test_records r
+                              WHERE r.user_id = s.user_id AND r.test_time IS s.test_time
+                                AND r.test_type IS s.test_type AND r.stimulus_type IS s.stimulus_type
+                                AND r.trial_index IS s.trial_index AND r.reaction_time IS s.reaction_time
+                          )
+                    ''', (start, end))
+            finally:
+                conn.execute("DETACH DATABASE part")
+
+    def vacuum(self, into: Optional[str] = None) -> Dict[str, int]:
+        """整理数据库文件（into 不为空时写出整理后的副本，原文件不变），返回整理前后的字节数
+
+        原地整理时顺带把旧库转换为增量整理模式，此后定期任务只需 PRAGMA incremental_vacuum
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            before = conn.execute('PRAGMA page_count').fetchone()[0] * page_size
+            if into:
+                conn.execute('VACUUM INTO ?', (into,))
+            else:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+            after = os.path.getsize(into) if into else conn.execute('PRAGMA page_count').fetchone()[0] * page_size
+        finally:
+            conn.close()
+        return {'before_bytes': before, 'after_bytes': after}
+
+    def run_maintenance(self, hot_months: int = DEFAULT_HOT_MONTHS, retention_months: Optional[int] = None,
+                        tasks: Optional[List[str]] = None, force: bool = False) -> Dict[str, Any]:
+        """运行到期的维护任务（移入分区、保留期、整理、统计信息，见 db_maintenance.py）"""
+        results = DatabaseMaintenance(self.db_path, hot_months, retention_months).run_due(tasks=tasks, force=force)
+        if 'roll' in results or 'retention' in results:
+            self._bump_write_version()
+        return results
+
+    def clear_all_data(self) -> Dict[str, Any]:
+        """清除全部测试数据：删除分区文件并清空主库中的用户、试次与统计（保留延迟档案）"""
+        result = DatabaseMaintenance(self.db_path).clear_data()
+        self._bump_write_version()
+        return result
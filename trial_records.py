@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+试次记录与单轮测试缓冲
+TrialRecord 使用 __slots__，替代每个试次构造的 record_data / response_data 字典；
+RunBuffer 按试次数预分配定长数组，替代并行的 reaction_times / correct_responses 列表。
+桌面端与Web端共用，不依赖Qt/Streamlit
+"""
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from quality_control import QC_LABELS, QC_VALID
+
+# 质量控制标签与整数编码互转
+QC_CODES = {label: code for code, label in enumerate(QC_LABELS)}
+QC_VALID_CODE = QC_CODES[QC_VALID]
+
+
+class TrialRecord:
+    """单个试次记录（引擎、信号、质量控制与持久化共用）"""
+
+    __slots__ = ('user_id', 'test_type', 'stimulus_type', 'trial_index', 'stimulus_content',
+                 'reaction_time', 'is_correct', 'qc_label', 'correct_key', 'latency_correction')
+
+    def __init__(self, user_id: str, test_type: str, stimulus_type: str, trial_index: int,
+                 stimulus_content: Any, reaction_time: float, is_correct: bool,
+                 qc_label: Optional[str] = None, correct_key: Any = None,
+                 latency_correction: float = 0.0):
+        self.user_id = user_id
+        self.test_type = test_type
+        self.stimulus_type = stimulus_type
+        self.trial_index = trial_index
+        self.stimulus_content = stimulus_content
+        self.reaction_time = reaction_time
+        self.is_correct = is_correct
+        self.qc_label = qc_label
+        self.correct_key = correct_key
+        # 已从reaction_time中扣除的工作站延迟（ms）
+        self.latency_correction = latency_correction
+
+    @property
+    def trial(self) -> int:
+        """从1开始的试次序号（用于界面显示）"""
+        return self.trial_index + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典（导出或调试用）"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return (f"TrialRecord(trial_index={self.trial_index}, reaction_time={self.reaction_time:.1f}, "
+                f"is_correct={self.is_correct}, qc_label={self.qc_label!r})")
+
+
+class RunBuffer:
+    """单轮测试的预分配数组缓冲
+
+    按试次数一次性分配定长数组，追加试次只写入下标，不产生新对象；
+    无效试次重测导致超出容量时按倍数扩容。
+    """
+
+    __slots__ = ('_reaction_times', '_correct', '_qc_codes', 'size')
+
+    def __init__(self, capacity: int = 10):
+        capacity = max(int(capacity), 1)
+        self._reaction_times = np.zeros(capacity, dtype=np.float64)
+        self._correct = np.zeros(capacity, dtype=np.bool_)
+        self._qc_codes = np.zeros(capacity, dtype=np.uint8)
+        self.size = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._reaction_times)
+
+    def reset(self, capacity: Optional[int] = None):
+        """清空缓冲，容量不足时重新分配"""
+        if capacity is not None and capacity > self.capacity:
+            self.__init__(capacity)
+        self.size = 0
+
+    def append(self, reaction_time: float, is_correct: bool, qc_label: str = QC_VALID):
+        """追加一个试次"""
+        if self.size == self.capacity:
+            self._grow()
+        i = self.size
+        self._reaction_times[i] = reaction_time
+        self._correct[i] = is_correct
+        self._qc_codes[i] = QC_CODES[qc_label]
+        self.size = i + 1
+
+    def append_record(self, record: TrialRecord):
+        """追加一个试次记录"""
+        self.append(record.reaction_time, record.is_correct, record.qc_label or QC_VALID)
+
+    @property
+    def reaction_times(self) -> np.ndarray:
+        """已记录的反应时（只读视图，不复制）"""
+        return self._reaction_times[:self.size]
+
+    @property
+    def correct(self) -> np.ndarray:
+        """已记录的正确与否"""
+        return self._correct[:self.size]
+
+    @property
+    def qc_codes(self) -> np.ndarray:
+        """已记录的质量控制编码"""
+        return self._qc_codes[:self.size]
+
+    def valid_mask(self) -> np.ndarray:
+        """正确且通过质量控制的试次"""
+        return self.correct & (self.qc_codes == QC_VALID_CODE)
+
+    def last(self, n: int = 1) -> np.ndarray:
+        """最近n个反应时"""
+        return self.reaction_times[-n:]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        for name in ('_reaction_times', '_correct', '_qc_codes'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)